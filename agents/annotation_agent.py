@@ -18,6 +18,7 @@ import queue
 from typing import List
 from pydantic import BaseModel
 from .base_agent import Agent
+from utils.frame_store import Frame
 
 class SurgeryAnnotation(BaseModel):
     timestamp: str
@@ -85,7 +86,7 @@ class AnnotationAgent(Agent):
                     continue
                 
                 # Check frame data validity
-                if not frame_data or not isinstance(frame_data, str) or len(frame_data) < 1000:
+                if not frame_data or not isinstance(frame_data, (str, Frame)) or len(frame_data) < 1000:
                     self._logger.warning("Invalid frame data received")
                     time.sleep(self.time_step)
                     continue
@@ -94,6 +95,10 @@ class AnnotationAgent(Agent):
                 if video_loaded:
                     annotation = self._generate_annotation(frame_data)
                     if annotation:
+                        # Frames cut on the server know exactly where in the video they are
+                        video_time = getattr(frame_data, 'video_time', None)
+                        if video_time is not None:
+                            annotation["video_time_seconds"] = round(video_time, 3)
                         self.annotations.append(annotation)
                         try:
                             self.append_json_to_file(annotation, self.annotation_filepath)
@@ -15,21 +15,28 @@ import logging
 import yaml
 import time
 import tiktoken
-from threading import Lock
+from threading import Condition, Lock
 import base64
 import tempfile
 import os
+import re
 import requests
+from contextlib import contextmanager
 from openai import OpenAI
+from utils.frame_store import frame_bytes
 
 class Agent(ABC):
     _llm_lock = Lock()
+    # Interactive (user-facing) requests in flight; background work yields while > 0.
+    _foreground_cond = Condition()
+    _foreground_requests = 0
     
     def __init__(self, settings_path, response_handler, agent_key=None):
         self._logger = logging.getLogger(f"{__name__}.{type(self).__name__}")        
         self.load_settings(settings_path, agent_key=agent_key)
         self.response_handler = response_handler
         self.tokenizer = tiktoken.get_encoding("cl100k_base")
+        self._role_overhead_cache = {}
         self.client = OpenAI(api_key="EMPTY", base_url=self.llm_url)
         self._wait_for_server()
 
@@ -79,33 +86,67 @@ class Agent(ABC):
             f"You can start it manually using: ./scripts/run_vllm_server.sh"
         )
 
-    def stream_response(self, prompt, grammar=None, temperature=0.0, display_output=True):
+    @classmethod
+    @contextmanager
+    def foreground_request(cls):
+        """
+        Mark an interactive request as in flight so low-priority background
+        LLM work (e.g. rolling summaries) holds off until it completes.
+        """
+        with cls._foreground_cond:
+            Agent._foreground_requests += 1
+        try:
+            yield
+        finally:
+            with cls._foreground_cond:
+                Agent._foreground_requests -= 1
+                cls._foreground_cond.notify_all()
+
+    @classmethod
+    def wait_for_foreground_idle(cls, timeout=None):
+        """Block until no interactive request is in flight. Returns False on timeout."""
+        with cls._foreground_cond:
+            return cls._foreground_cond.wait_for(lambda: Agent._foreground_requests == 0, timeout=timeout)
+
+    def stream_response(self, prompt, grammar=None, temperature=0.0, display_output=True, cancel_token=None, output=None):
+        # `output` receives the streamed answer instead of the response handler
+        output = output or self.response_handler
         with Agent._llm_lock:
             user_message = prompt.split("<|im_start|>user\n")[-1].split("<|im_end|>")[0].strip()
-            request_messages = []
-            if self.agent_prompt:
-                request_messages.append({"role": "system", "content": self.agent_prompt})
+            request_messages = self._context_messages(prompt)
             request_messages.append({"role": "user", "content": user_message})
             self._logger.debug(
                 f"Sending chat request to vLLM/OpenAI client. Model={self.model_name}, temperature={temperature}\nUser message:\n{user_message[:500]}"
             )
+            request_kwargs = {
+                "model": self.model_name,
+                "messages": request_messages,
+                "temperature": temperature,
+                "max_tokens": self.ctx_length
+            }
             try:
-                completion = self.client.chat.completions.create(
-                    model=self.model_name,
-                    messages=request_messages,
-                    temperature=temperature,
-                    max_tokens=self.ctx_length
-                )
-                response_text = completion.choices[0].message.content if completion.choices else ""
-                if display_output and self.response_handler:
-                    self.response_handler.add_response(response_text)
-                    self.response_handler.end_response()
+                if display_output and output:
+                    # Pass the answer on as it is generated, e.g. to start speaking it
+                    response_text = self._cancellable_completion(
+                        request_kwargs, cancel_token, on_delta=output.add_response
+                    )
+                    output.end_response()
+                    if response_text is None:
+                        return ""
+                elif cancel_token is not None:
+                    response_text = self._cancellable_completion(request_kwargs, cancel_token)
+                    if response_text is None:
+                        return ""
+                else:
+                    completion = self.client.chat.completions.create(**request_kwargs)
+                    response_text = completion.choices[0].message.content if completion.choices else ""
                 return response_text
             except Exception as e:
                 self._logger.error(f"vLLM chat request failed: {e}", exc_info=True)
                 return ""
 
-    def stream_image_response(self, prompt, image_b64, grammar=None, temperature=0.0, display_output=True, extra_body=None):
+    def stream_image_response(self, prompt, image_b64, grammar=None, temperature=0.0, display_output=True, extra_body=None, cancel_token=None, output=None):
+        output = output or self.response_handler
         self._logger.debug(f"stream_image_response with model={self.model_name}")
         if not image_b64:
             self._logger.warning("No image data provided for image response, will use placeholder")
@@ -122,19 +163,17 @@ class Agent(ABC):
         try:
             # Extract and decode base64 data
             try:
-                raw_b64 = self._extract_raw_base64(image_b64)
+                # Binary frames are written as-is; only legacy data URIs need decoding
                 with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as tmp_file:
                     file_path = tmp_file.name
-                    tmp_file.write(base64.b64decode(raw_b64))
+                    tmp_file.write(frame_bytes(image_b64))
                 self._logger.debug(f"Temp image file created: {file_path}")
             except Exception as img_error:
                 self._logger.error(f"Failed to process image data: {img_error}", exc_info=True)
                 raise ValueError(f"Invalid image data: {img_error}")
             
             # Create message structure with explicit instruction to look at the image
-            messages = []
-            if self.agent_prompt:
-                messages.append({"role": "system", "content": self.agent_prompt})
+            messages = self._context_messages(prompt)
             
             # Add "you can see the image attached to this message" to ensure model knows there's an image
             modified_message = user_message
@@ -161,15 +200,22 @@ class Agent(ABC):
                 
             # Make the API request with timeout handling
             try:
+                if display_output and output:
+                    # Pass the answer on as it is generated, e.g. to start speaking it
+                    raw_text = self._cancellable_completion(
+                        request_kwargs, cancel_token, on_delta=output.add_response
+                    )
+                    output.end_response()
+                    return raw_text or ""
+                if cancel_token is not None:
+                    raw_text = self._cancellable_completion(request_kwargs, cancel_token)
+                    return raw_text or ""
+
                 result = self.client.chat.completions.create(**request_kwargs)
                 
                 # Process the response
                 if result and result.choices and len(result.choices) > 0:
-                    raw_text = result.choices[0].message.content
-                    if display_output and self.response_handler:
-                        self.response_handler.add_response(raw_text)
-                        self.response_handler.end_response()
-                    return raw_text
+                    return result.choices[0].message.content
                 else:
                     self._logger.warning("Empty or invalid response from vLLM")
                     return ""
@@ -193,6 +239,62 @@ class Agent(ABC):
                 except Exception as cleanup_error:
                     self._logger.warning(f"Failed to remove temporary file {file_path}: {cleanup_error}")
 
+    def _cancellable_completion(self, request_kwargs, cancel_token=None, on_delta=None):
+        """
+        Run a chat completion as a stream so it can be abandoned part way
+        and its text used as it arrives: each piece is passed to `on_delta`.
+        Generated tokens are counted on `cancel_token`, if given; returns
+        None if the token was cancelled, in which case the stream is closed
+        and vLLM aborts the request.
+        """
+        stream = self.client.chat.completions.create(stream=True, **request_kwargs)
+        parts = []
+        try:
+            for chunk in stream:
+                if cancel_token is not None and cancel_token.cancelled:
+                    self._logger.debug("Completion cancelled mid-stream")
+                    return None
+                if chunk.choices and chunk.choices[0].delta.content:
+                    delta = chunk.choices[0].delta.content
+                    parts.append(delta)
+                    if cancel_token is not None:
+                        cancel_token.add_tokens(self.calculate_token_usage(delta))
+                    if on_delta:
+                        on_delta(delta)
+        finally:
+            stream.close()
+        return None if cancel_token is not None and cancel_token.cancelled else "".join(parts)
+
+    def _context_messages(self, prompt):
+        """
+        Chat messages that precede the final user message: the system prompt
+        (plus any extra system text, such as a summary of older turns) and the
+        earlier conversation turns that generate_prompt rendered into `prompt`.
+        """
+        system_parts = [self.agent_prompt] if self.agent_prompt else []
+        turns = []
+        roles = {self.bot_rule_prefix: "system", self.user_prefix: "user", self.bot_prefix: "assistant"}
+        roles.pop("", None)
+        if roles and self.end_token:
+            pattern = re.compile(
+                "(" + "|".join(re.escape(prefix) for prefix in roles) + r")\n(.*?)" + re.escape(self.end_token),
+                re.DOTALL,
+            )
+            for match in pattern.finditer(prompt):
+                role, content = roles[match.group(1)], match.group(2).strip()
+                if role == "system":
+                    if content and content != self.agent_prompt:
+                        system_parts.append(content)
+                else:
+                    turns.append({"role": role, "content": content})
+            # The last user block is the current request, which callers add themselves
+            if turns and turns[-1]["role"] == "user":
+                turns.pop()
+        messages = []
+        if system_parts:
+            messages.append({"role": "system", "content": "\n\n".join(system_parts)})
+        return messages + turns
+
     def _extract_raw_base64(self, image_b64: str) -> str:
         prefix = "data:image/"
         if image_b64.startswith(prefix):
@@ -213,29 +315,68 @@ class Agent(ABC):
         prompt += f"\n{self.bot_prefix}\n"
         return prompt
 
-    def create_conversation_str(self, chat_history, token_usage, conversation_length=2):
+    def create_conversation_str(self, chat_history, token_usage, conversation_length=None):
+        """
+        Render as much conversation context as fits in max_prompt_tokens: the
+        running summary of older turns (when the history carries one) followed
+        by the most recent unsummarized turns verbatim, newest first until the
+        budget runs out. `conversation_length` optionally caps the turn count.
+        """
         total_tokens = token_usage
+        recent = chat_history[:-1]
+        if conversation_length:
+            recent = recent[-conversation_length:]
+        # ChatHistory views carry cached per-message token counts and the summary
+        message_tokens = getattr(recent, "message_tokens", None)
+        summary_text, covered = recent.summary() if hasattr(recent, "summary") else ("", 0)
+
+        summary_str = ""
+        if summary_text:
+            summary_str = (
+                f"\n{self.bot_rule_prefix}\nSummary of the earlier conversation:\n"
+                f"{summary_text}\n{self.end_token}"
+            )
+            summary_tokens = self.calculate_token_usage(summary_str)
+            if total_tokens + summary_tokens <= self.max_prompt_tokens:
+                total_tokens += summary_tokens
+            else:
+                summary_str = ""
+
         msg_hist = []
-        for user_msg, bot_msg in chat_history[:-1][-conversation_length:][::-1]:
+        for i in range(len(recent) - 1, covered - 1, -1):
+            user_msg, bot_msg = recent[i]
+            user_count, bot_count = message_tokens(i) if message_tokens else (None, None)
             if bot_msg:
                 bot_msg_str = f"\n{self.bot_prefix}\n{bot_msg}\n{self.end_token}"
-                bot_tokens = self.calculate_token_usage(bot_msg_str)
+                if bot_count is not None:
+                    bot_tokens = bot_count + self._role_overhead_tokens(self.bot_prefix)
+                else:
+                    bot_tokens = self.calculate_token_usage(bot_msg_str)
                 if total_tokens + bot_tokens > self.max_prompt_tokens:
                     break
                 total_tokens += bot_tokens
                 msg_hist.append(bot_msg_str)
             if user_msg:
                 user_msg_str = f"\n{self.user_prefix}\n{user_msg}\n{self.end_token}"
-                user_tokens = self.calculate_token_usage(user_msg_str)
+                if user_count is not None:
+                    user_tokens = user_count + self._role_overhead_tokens(self.user_prefix)
+                else:
+                    user_tokens = self.calculate_token_usage(user_msg_str)
                 if total_tokens + user_tokens > self.max_prompt_tokens:
                     break
                 total_tokens += user_tokens
                 msg_hist.append(user_msg_str)
-        return "".join(msg_hist[::-1])
+        return summary_str + "".join(msg_hist[::-1])
 
     def calculate_token_usage(self, text):
         return len(self.tokenizer.encode(text))
 
+    def _role_overhead_tokens(self, prefix):
+        """Tokens added by wrapping a message in `prefix` and the end token."""
+        if prefix not in self._role_overhead_cache:
+            self._role_overhead_cache[prefix] = self.calculate_token_usage(f"\n{prefix}\n\n{self.end_token}")
+        return self._role_overhead_cache[prefix]
+
     @abstractmethod
     def process_request(self, input_data, chat_history):
         pass
@@ -21,24 +21,39 @@ class ChatAgent(Agent):
 
     def __init__(self, settings_path, response_handler):
         super().__init__(settings_path, response_handler)
+        # Optional utils.procedure_index.ProcedureIndex over annotations and notes
+        self.procedure_index = None
+        self.procedure_context_tokens = self.agent_settings.get('procedure_context_tokens', 300)
+        self.summary_context_tokens = self.agent_settings.get('summary_context_tokens', 2000)
 
-    def process_request(self, text, chat_history, visual_info=None):
+    def process_request(self, text, chat_history, visual_info=None, display_output=True, cancel_token=None, output=None):
         """
         Process a user request that may have an image in visual_info["image_b64"].
         If there's image data, we call stream_image_response in the base agent,
-        otherwise we call stream_response.
+        otherwise we call stream_response. Passing a `cancel_token` lets the
+        caller abandon the request part way (used for speculative runs), and
+        `output` takes the streamed answer in place of the response handler.
         """
+        output = output or self.response_handler
         try:
             self._logger.debug("Starting ChatAgent process_request")
             self._logger.debug(f"Input text: {text}")
 
+            # Factual questions about the procedure so far need no LLM call
+            direct_answer = self.answer_from_records(text)
+            if direct_answer:
+                self._logger.debug("Answered from the procedure index.")
+                if display_output and output:
+                    output.add_response(direct_answer)
+                    output.end_response()
+                return {"name": "ChatAgent", "response": direct_answer}
+
             if not visual_info:
                 visual_info = {}
             image_b64 = visual_info.get("image_b64", None)
             tool_labels = visual_info.get("tool_labels", {})
 
-            # Possibly unify text with tool labels
-            final_user_message = self.generate_user_prompt(text, tool_labels)
+            final_user_message = self.build_user_message(text, tool_labels)
             prompt = self.generate_full_prompt(final_user_message, chat_history)
 
             if image_b64:
@@ -46,14 +61,20 @@ class ChatAgent(Agent):
                 response = self.stream_image_response(
                     prompt=prompt,
                     image_b64=image_b64,
-                    temperature=0.0
+                    temperature=0.0,
+                    display_output=display_output,
+                    cancel_token=cancel_token,
+                    output=output
                 )
             else:
                 # If no image, just do a normal text-only request
                 self._logger.debug("No image data, calling stream_response.")
                 response = self.stream_response(
                     prompt=prompt,
-                    temperature=0.0
+                    temperature=0.0,
+                    display_output=display_output,
+                    cancel_token=cancel_token,
+                    output=output
                 )
             
             return {"name": "ChatAgent", "response": response}
@@ -62,6 +83,40 @@ class ChatAgent(Agent):
             self._logger.error(f"Error in ChatAgent.process_request: {e}", exc_info=True)
             return {"name": "ChatAgent", "response": f"Error: {str(e)}"}
 
+    def answer_from_records(self, text):
+        """Answer `text` from the procedure index if it is a factual question it covers."""
+        if not self.procedure_index:
+            return None
+        try:
+            return self.procedure_index.answer(text)
+        except Exception as e:
+            self._logger.error(f"Procedure index lookup failed: {e}", exc_info=True)
+            return None
+
+    def build_user_message(self, text, tool_labels=None):
+        """The user_prompt template filled with `text`, plus the procedure records that relate to it."""
+        # Possibly unify text with tool labels
+        final_user_message = self.generate_user_prompt(text, tool_labels or {})
+
+        # Add only the procedure records that relate to the question
+        if self.procedure_index:
+            records = self.procedure_index.context_for(
+                text, self.procedure_context_tokens, self.calculate_token_usage
+            )
+            if records:
+                final_user_message += f"\n\nRelevant procedure records:\n{records}"
+        return final_user_message
+
+    def conversation_messages(self, text, chat_history):
+        """
+        The chat messages a text-only process_request would send for `text`:
+        system prompt (with any summary of older turns), earlier turns, and
+        the final user message. Lets another agent answer on ChatAgent's behalf.
+        """
+        final_user_message = self.build_user_message(text)
+        prompt = self.generate_full_prompt(final_user_message, chat_history)
+        return self._context_messages(prompt) + [{"role": "user", "content": final_user_message}]
+
     def generate_user_prompt(self, text, tool_labels):
         user_prompt_template = self.agent_settings.get('user_prompt', '')
         
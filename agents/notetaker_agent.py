@@ -15,6 +15,7 @@ import time
 import logging
 import base64
 from .base_agent import Agent
+from utils.frame_store import Frame
 
 class NotetakerAgent(Agent):
     """
@@ -49,6 +50,8 @@ class NotetakerAgent(Agent):
         os.makedirs(self.images_subdir, exist_ok=True)
 
         self.notes = []
+        # Optional hook invoked with each recorded note (e.g. for rolling summaries)
+        self.on_note_callback = None
 
     def _skip_llm_wait(self, timeout=60):
         self._logger.debug("NotetakerAgent does NOT need an LLM, skipping server wait.")
@@ -76,36 +79,62 @@ class NotetakerAgent(Agent):
         self.notes.append(note)
         self.append_json_to_file(note, self.notes_filepath)
 
+        if self.on_note_callback:
+            try:
+                self.on_note_callback(note)
+            except Exception as callback_error:
+                self._logger.error(f"Error in note callback: {callback_error}")
+
         response = (
             f"Note recorded (timestamp={timestamp_str}). "
             f"Total notes so far: {len(self.notes)}."
         )
         return {
             "name": "NotetakerAgent",
-            "response": response
+            "response": response,
+            "note": note
         }
 
+    def amend_note(self, note, user_text):
+        """
+        Replace the text of an already recorded note, e.g. once the selector's
+        ASR-corrected input arrives for a note that was recorded early.
+        """
+        if note not in self.notes or note.get("text") == user_text:
+            return
+        note["text"] = user_text
+        try:
+            with open(self.notes_filepath, 'w') as f:
+                json.dump(self.notes, f, indent=2)
+        except Exception as e:
+            self._logger.error(f"Failed to rewrite notes file: {e}", exc_info=True)
+
     def _save_image(self, data_uri, timestamp_str):
         """
-        Decodes a data URI (e.g. "data:image/jpeg;base64,<b64>") 
-        and writes it to note_images/<unique_filename>.jpg.
+        Decodes a data URI (e.g. "data:image/jpeg;base64,<b64>"), or takes the
+        bytes of a binary Frame, and writes it to note_images/<unique_filename>.jpg.
 
         Returns the filename or None if decode failed.
         """
         try:
-            # typical format: "data:image/jpeg;base64,ABCD..."
-            if not data_uri.startswith("data:image/"):
-                self._logger.warning(f"Skipping non-image data URI: {data_uri[:50]}...")
-                return None
-
-            header, b64_data = data_uri.split(",", 1)
-            # We can guess extension from header if you want. For now, ".jpg"
-            # Or if "png" in header -> .png
-            extension = ".jpg"
-            if "png" in header:
-                extension = ".png"
-
-            raw_bytes = base64.b64decode(b64_data)
+            if isinstance(data_uri, Frame):
+                # Binary frames already hold the JPEG bytes
+                extension = ".jpg"
+                raw_bytes = data_uri.jpeg
+            else:
+                # typical format: "data:image/jpeg;base64,ABCD..."
+                if not data_uri.startswith("data:image/"):
+                    self._logger.warning(f"Skipping non-image data URI: {data_uri[:50]}...")
+                    return None
+
+                header, b64_data = data_uri.split(",", 1)
+                # We can guess extension from header if you want. For now, ".jpg"
+                # Or if "png" in header -> .png
+                extension = ".jpg"
+                if "png" in header:
+                    extension = ".png"
+
+                raw_bytes = base64.b64decode(b64_data)
 
             # build a unique name for the file
             unique_id = str(int(time.time() * 1000))[-5:]  # last 5 digits
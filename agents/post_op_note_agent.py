@@ -11,15 +11,92 @@
 
 import os
 import json
-import math
+import hashlib
 import logging
+import datetime
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from .base_agent import Agent
 
+# Allowance for the chat template tokens wrapped around each message by the server.
+MESSAGE_OVERHEAD_TOKENS = 16
+# Smallest chunk budget we accept before treating the config as broken.
+MIN_CHUNK_TOKENS = 64
+
+# Intermediate summaries written during the procedure, relative to the procedure folder.
+ROLLING_SUMMARY_FILE = "rolling_summaries.json"
+# On-disk memo of chunk summaries, relative to the procedure folder.
+SUMMARY_CACHE_DIR = "summary_cache"
+# Rolling summary channels and the labels their chunks are summarized under.
+ROLLING_CHANNELS = {
+    "annotation": "Annotation data",
+    "notes": "Notetaker data",
+}
+
+# Sections of the streamed note, in display order. The first two are built from
+# stored data; the rest are written by the LLM, one guided request each.
+DETERMINISTIC_SECTIONS = ["procedure_information", "procedure_timeline"]
+LLM_SECTIONS = ["findings", "complications"]
+# Each LLM section is a list of short statements.
+SECTION_ITEMS_SCHEMA = {
+    "type": "object",
+    "properties": {"items": {"type": "array", "items": {"type": "string"}}},
+    "required": ["items"]
+}
+
+def fallback_post_op_note(finding, procedure_type="laparoscopic procedure", duration="Unknown"):
+    """A minimal note in the same shape as the generated one, for when generation is not possible."""
+    return {
+        "procedure_information": {
+            "procedure_type": procedure_type,
+            "date": datetime.datetime.now().strftime("%Y-%m-%d"),
+            "duration": duration,
+            "surgeon": "Not specified"
+        },
+        "findings": [finding],
+        "procedure_timeline": [],
+        "complications": []
+    }
+
+class _RollingChannel:
+    """
+    Incremental chunking state for one data stream (annotations or notes).
+    Items are identified by entry key (see PostOpNoteAgent._rolling_keys), so
+    coverage does not depend on their position in the file.
+    """
+
+    def __init__(self, label, budget, consumed=None, summaries=None):
+        self.label = label
+        self.budget = budget
+        self.consumed = dict(consumed or {})  # entry key -> line digest, for items covered by `summaries`
+        self.summaries = list(summaries or [])
+        self.fed = dict(self.consumed)        # entry key -> line digest, for every item fed so far
+        self.counts = {}                      # timestamp -> items fed with it, to key the next one
+        self.pending = []                     # (entry key, digest, line) of the chunk being filled
+        self.pending_tokens = 0
+        self.generation = 0                   # bumped when summaries are discarded; stale jobs are dropped
+        self.failed = False
+
+class _RollingState:
+    def __init__(self, procedure_folder):
+        self.procedure_folder = procedure_folder
+        self.cond = threading.Condition()
+        self.jobs = deque()
+        self.channels = {}
+        self.stopped = False
+        self.thread = None
+
 class PostOpNoteAgent(Agent):
     def __init__(self, settings_path, response_handler=None, agent_key=None):
         super().__init__(settings_path, response_handler, agent_key=agent_key)
         self._logger = logging.getLogger(__name__)
-        self.chunk_size = self.agent_settings.get("chunk_size", 20)
+        # Tokens reserved for each summary completion; defaults to the max_tokens we request.
+        self.summary_output_tokens = self.agent_settings.get("summary_output_tokens", self.ctx_length)
+        # How many times a truncated note is resumed before giving up
+        self.max_continuations = self.agent_settings.get("max_continuations", 2)
+        self.section_prompts = self.agent_settings.get("section_prompts", {})
+        self._rolling = None
 
         self.schema_dict = {}
         if self.grammar:
@@ -35,47 +112,38 @@ class PostOpNoteAgent(Agent):
             "response": "Invoke generate_post_op_note(procedure_folder) to produce and save the final note."
         }
 
-    def generate_post_op_note(self, procedure_folder):
+    def generate_post_op_note(self, procedure_folder=None, progress_callback=None, annotations=None, notes=None):
+        """
+        Build the final post-op note for `procedure_folder` and save it there.
+        Alternatively pass `annotations` and `notes` lists to work purely in
+        memory: nothing is read, cached or saved on disk in that case.
+        `progress_callback(stage)`, if given, is called as each stage starts.
+        """
+        def report(stage):
+            if progress_callback:
+                progress_callback(stage)
+
         try:
-            self._logger.info(f"Starting post-op note generation for folder: {procedure_folder}")
-            
-            # Check if procedure folder exists
-            if not os.path.isdir(procedure_folder):
-                self._logger.error(f"Procedure folder does not exist: {procedure_folder}")
+            report("loading_data")
+            ann_list, note_list = self._load_procedure_data(procedure_folder, annotations, notes)
+            if ann_list is None:
                 return None
-                
-            annotation_json = os.path.join(procedure_folder, "annotation.json")
-            notetaker_json = os.path.join(procedure_folder, "notetaker_notes.json")
-
-            # Load annotations and notes
-            self._logger.debug(f"Loading annotations from {annotation_json}")
-            ann_list = self._load_json_array(annotation_json)
             if not ann_list:
                 self._logger.warning("No annotation data found or unable to load annotations")
-                
-            self._logger.debug(f"Loading notes from {notetaker_json}")
-            note_list = self._load_json_array(notetaker_json)
             if not note_list:
                 self._logger.warning("No notetaker data found or unable to load notes")
                 
             # Create default structure when data is missing
             if not ann_list and not note_list:
                 self._logger.warning("Both annotation and notetaker data are missing or empty - creating default structure")
-                return {
-                    "procedure_information": {
-                        "procedure_type": "Not specified",
-                        "date": "Not specified",
-                        "duration": "Not specified",
-                        "surgeon": "Not specified"
-                    },
-                    "findings": ["No findings recorded"],
-                    "procedure_timeline": [],
-                    "complications": []
-                }
+                return fallback_post_op_note("No findings recorded", procedure_type="Not specified")
                 
-            # Summarize annotations and notes
-            ann_summary = self._chunk_summarize_annotation(ann_list)
-            notes_summary = self._chunk_summarize_notetaker(note_list)
+            # Summarize annotations and notes, reusing rolling and memoized chunk summaries
+            rolling = self._rolling_snapshot(procedure_folder) if procedure_folder else {}
+            report("summarizing_annotations")
+            ann_summary = self._chunk_summarize_annotation(ann_list, rolling, cache_folder=procedure_folder)
+            report("summarizing_notes")
+            notes_summary = self._chunk_summarize_notetaker(note_list, rolling, cache_folder=procedure_folder)
 
             user_msg = (
                 f"Annotated summary:\n{ann_summary}\n\n"
@@ -92,6 +160,7 @@ class PostOpNoteAgent(Agent):
             )
             self._logger.debug(f"Final post-op prompt: {final_prompt[:500]}...")
 
+            report("generating_note")
             raw_resp = self._ask_for_json(final_prompt)
             if not raw_resp:
                 self._logger.error("Empty response received from vLLM")
@@ -99,70 +168,27 @@ class PostOpNoteAgent(Agent):
                 
             self._logger.debug(f"PostOp raw response: {raw_resp[:500]}")
 
+            # Clean the response further if needed
+            cleaned_resp = raw_resp.strip()
+            # If response contains JSON starting markers, extract only the JSON part
+            if "```json" in cleaned_resp:
+                cleaned_resp = cleaned_resp.split("```json")[1].split("```")[0].strip()
+            elif "```" in cleaned_resp:
+                cleaned_resp = cleaned_resp.split("```")[1].split("```")[0].strip()
+
             try:
-                # Clean the response further if needed
-                cleaned_resp = raw_resp.strip()
-                # If response contains JSON starting markers, extract only the JSON part
-                if "```json" in cleaned_resp:
-                    cleaned_resp = cleaned_resp.split("```json")[1].split("```")[0].strip()
-                elif "```" in cleaned_resp:
-                    cleaned_resp = cleaned_resp.split("```")[1].split("```")[0].strip()
-                
                 final_json = json.loads(cleaned_resp)
                 self._logger.debug(f"Successfully parsed JSON response")
             except json.JSONDecodeError as e:
+                # Generation is schema-guided and resumed on truncation, so a parse
+                # failure here means the output is unusable rather than cut short.
                 self._logger.warning(f"Failed to parse final post-op note JSON: {e}\nRaw={raw_resp[:500]}...")
-                # Try multiple fallback approaches
-                try:
-                    # Approach 1: Look for patterns that look like JSON objects
-                    import re
-                    json_pattern = r'(\{[\s\S]*\})'
-                    matches = re.findall(json_pattern, raw_resp)
-                    if matches:
-                        potential_json = matches[0]
-                        self._logger.debug(f"Attempting to parse extracted JSON pattern: {potential_json[:500]}")
-                        final_json = json.loads(potential_json)
-                        self._logger.info("Successfully parsed JSON after regex extraction")
-                        return final_json
-                        
-                    # Approach 2: Try to complete truncated JSON
-                    if self._is_truncated_json(raw_resp):
-                        self._logger.warning("Detected truncated JSON, attempting to fix...")
-                        fixed_json = self._fix_truncated_json(raw_resp)
-                        if fixed_json:
-                            self._logger.info("Successfully reconstructed truncated JSON")
-                            return fixed_json
-                    
-                    # Approach 3: Create a fallback basic structure
-                    self._logger.warning("Creating fallback post-op note structure")
-                    import datetime
-                    fallback_json = {
-                        "procedure_information": {
-                            "procedure_type": "laparoscopic procedure",
-                            "date": datetime.datetime.now().strftime("%Y-%m-%d"),
-                            "duration": "Unknown",
-                            "surgeon": "Not specified"
-                        },
-                        "findings": ["Procedure data incomplete or corrupted"],
-                        "procedure_timeline": [],
-                        "complications": []
-                    }
-                    return fallback_json
-                except Exception as e2:
-                    self._logger.error(f"All JSON parsing attempts failed: {e2}")
-                    
-                    # Last resort: Create minimal structure
-                    import datetime
-                    return {
-                        "procedure_information": {
-                            "procedure_type": "Unknown procedure",
-                            "date": datetime.datetime.now().strftime("%Y-%m-%d"),
-                        },
-                        "findings": ["Error generating post-op note"]
-                    }
-
-            post_op_file = os.path.join(procedure_folder, "post_op_note.json")
-            self._save_post_op_note(final_json, post_op_file)
+                self._logger.warning("Creating fallback post-op note structure")
+                return fallback_post_op_note("Procedure data incomplete or corrupted")
+
+            if procedure_folder:
+                post_op_file = os.path.join(procedure_folder, "post_op_note.json")
+                self._save_post_op_note(final_json, post_op_file)
 
             return final_json
             
@@ -170,7 +196,395 @@ class PostOpNoteAgent(Agent):
             self._logger.error(f"Unexpected error in generate_post_op_note: {e}", exc_info=True)
             return None
 
+    def iter_post_op_note_sections(self, procedure_folder=None, video_duration=None, annotations=None, notes=None):
+        """
+        Generate the post-op note section by section, yielding (section, content)
+        as each one is ready. Sections built from stored data come first, before
+        any LLM call; LLM-written sections follow in completion order. The
+        assembled note is saved as post_op_note_sections.json when working from
+        a procedure folder rather than in-memory `annotations` and `notes`.
+        """
+        ann_list, note_list = self._load_procedure_data(procedure_folder, annotations, notes)
+        if ann_list is None:
+            ann_list, note_list = [], []
+
+        note = {}
+        note["procedure_information"] = self._procedure_information(ann_list, video_duration)
+        yield "procedure_information", note["procedure_information"]
+        note["procedure_timeline"] = self._procedure_timeline(ann_list, note_list)
+        yield "procedure_timeline", note["procedure_timeline"]
+
+        if not ann_list and not note_list:
+            note["findings"] = ["No findings recorded"]
+            note["complications"] = []
+        else:
+            rolling = self._rolling_snapshot(procedure_folder) if procedure_folder else {}
+            ann_summary = self._chunk_summarize_annotation(ann_list, rolling, cache_folder=procedure_folder)
+            notes_summary = self._chunk_summarize_notetaker(note_list, rolling, cache_folder=procedure_folder)
+            context = f"Annotated summary:\n{ann_summary}\n\nNotetaker summary:\n{notes_summary}"
+
+            # vLLM batches concurrent requests, so sections are generated in parallel
+            with ThreadPoolExecutor(max_workers=len(LLM_SECTIONS)) as pool:
+                futures = {pool.submit(self._ask_for_section, section, context): section for section in LLM_SECTIONS}
+                for future in as_completed(futures):
+                    section = futures[future]
+                    note[section] = future.result()
+                    yield section, note[section]
+
+        if procedure_folder and os.path.isdir(procedure_folder):
+            self._save_post_op_note(note, os.path.join(procedure_folder, "post_op_note_sections.json"))
+
+    def _procedure_information(self, ann_list, video_duration=None):
+        date = datetime.datetime.now().strftime("%Y-%m-%d")
+        duration = video_duration or "Unknown"
+        if ann_list:
+            first_ts = str(ann_list[0].get("timestamp", ""))
+            try:
+                date = datetime.datetime.strptime(first_ts, "%Y-%m-%d %H:%M:%S").strftime("%Y-%m-%d")
+            except ValueError:
+                pass
+            if not video_duration:
+                elapsed = max((ann.get("elapsed_time_seconds") or 0) for ann in ann_list)
+                if elapsed:
+                    duration = str(datetime.timedelta(seconds=int(elapsed)))
+        return {
+            "procedure_type": "laparoscopic procedure",
+            "date": date,
+            "duration": duration,
+            "surgeon": "Not specified"
+        }
+
+    def _procedure_timeline(self, ann_list, note_list):
+        events = []
+        last_phase = None
+        for ann in ann_list:
+            phase = ann.get("surgical_phase")
+            if phase and phase != last_phase:
+                description = f"{phase.replace('_', ' ').capitalize()} began"
+                tools = [t for t in ann.get("tools", []) or [] if t != "none"]
+                if tools:
+                    description += f" (tools: {', '.join(tools)})"
+                events.append({"time": str(ann.get("timestamp", "Unknown")), "description": description})
+                last_phase = phase
+        for note in note_list:
+            if not self._is_placeholder_note(note):
+                events.append({"time": str(note.get("timestamp", "Unknown")), "description": f"Note: {note['text'].strip()}"})
+        return sorted(events, key=lambda event: event["time"])
+
+    def _ask_for_section(self, section, context):
+        instruction = self.section_prompts.get(section, f"List the {section.replace('_', ' ')} of the procedure.")
+        messages = []
+        if self.agent_prompt:
+            messages.append({"role": "system", "content": self.agent_prompt})
+        messages.append({
+            "role": "user",
+            "content": f"{context}\n\n{instruction.strip()}\nReturn JSON of the form {{\"items\": [\"...\"]}}."
+        })
+        try:
+            result = self.client.chat.completions.create(
+                model=self.model_name,
+                messages=messages,
+                temperature=0.3,
+                max_tokens=self.ctx_length,
+                extra_body={"guided_json": SECTION_ITEMS_SCHEMA}
+            )
+            items = json.loads(result.choices[0].message.content).get("items", [])
+            return [str(item).strip() for item in items if str(item).strip()]
+        except Exception as e:
+            self._logger.error(f"Error generating post-op note section {section}: {e}", exc_info=True)
+            return []
+
+    def start_rolling_summary(self, procedure_folder):
+        """
+        Summarize annotation and note chunks in the background as soon as they
+        fill, persisting the results in the procedure folder, so that only the
+        final reduce and note generation remain when the case ends.
+        """
+        self.stop_rolling_summary()
+        state = _RollingState(procedure_folder)
+        saved = self._rolling_snapshot_from_file(procedure_folder)
+        for key, label in ROLLING_CHANNELS.items():
+            consumed, summaries = saved.get(key, ({}, []))
+            state.channels[key] = _RollingChannel(
+                label,
+                self._data_chunk_budget(label),
+                consumed=consumed,
+                summaries=summaries,
+            )
+        self._rolling = state
+
+        # Feed anything recorded after the last persisted summary (e.g. after a restart)
+        for key in ROLLING_CHANNELS:
+            self._rolling_resync(key)
+
+        state.thread = threading.Thread(target=self._rolling_worker, args=(state,), daemon=True)
+        state.thread.start()
+        self._logger.info(f"Rolling post-op summarization started for {procedure_folder}")
+
+    def stop_rolling_summary(self):
+        state = self._rolling
+        if state is None:
+            return
+        with state.cond:
+            state.stopped = True
+            state.cond.notify_all()
+        self._rolling = None
+        self._logger.info(f"Rolling post-op summarization stopped for {state.procedure_folder}")
+
+    def add_annotation(self, ann):
+        self._rolling_feed("annotation", ann)
+
+    def add_note(self, note):
+        self._rolling_feed("notes", note)
+
+    def note_amended(self, note):
+        """
+        Called after a recorded note's text was changed. Its chunk is rebuilt
+        if it has not been summarized yet; otherwise the note summaries are
+        discarded and redone, so the final note never uses the old text.
+        """
+        if self._rolling is not None:
+            self._rolling_resync("notes")
+
+    def _rolling_line(self, key, item):
+        if key == "annotation":
+            return self._annotation_line(item)
+        return None if self._is_placeholder_note(item) else self._note_line(item)
+
+    @staticmethod
+    def _rolling_keys(items):
+        """
+        Stable entry keys for `items`, in order: the item's timestamp plus how
+        many earlier items share it. The data files are append-only, so an
+        item keeps its key however many other items are added or skipped.
+        """
+        counts = {}
+        keys = []
+        for item in items:
+            timestamp = str(item.get("timestamp", ""))
+            keys.append(f"{timestamp}#{counts.get(timestamp, 0)}")
+            counts[timestamp] = counts.get(timestamp, 0) + 1
+        return keys
+
+    @staticmethod
+    def _line_digest(line):
+        return hashlib.sha256(line.encode("utf-8")).hexdigest()[:16]
+
+    def _rolling_resync(self, key):
+        """
+        Bring a channel in line with its data file: summaries whose items have
+        since changed or disappeared are discarded, and every item not yet
+        summarized or queued is (re)fed, rebuilding the chunk being filled.
+        """
+        state = self._rolling
+        if state is None:
+            return
+        filename = "annotation.json" if key == "annotation" else "notetaker_notes.json"
+        path = os.path.join(state.procedure_folder, filename)
+        items = self._load_json_array(path) if os.path.isfile(path) else []
+        entries = []
+        for entry_key, item in zip(self._rolling_keys(items), items):
+            line = self._rolling_line(key, item)
+            entries.append((entry_key, item, line, self._line_digest(line) if line is not None else None))
+        current = {entry_key: digest for entry_key, _, _, digest in entries}
+
+        with state.cond:
+            if state.stopped:
+                return
+            channel = state.channels[key]
+            pending_keys = {entry_key for entry_key, _, _ in channel.pending}
+            # Items already summarized, or handed to the worker, must be unchanged
+            stale = [
+                entry_key for entry_key, digest in channel.fed.items()
+                if entry_key not in pending_keys and current.get(entry_key) != digest
+            ]
+            if stale:
+                self._logger.info(
+                    f"{len(stale)} {channel.label.lower()} entries changed after being summarized; "
+                    f"discarding {len(channel.summaries)} rolling summaries"
+                )
+                channel.generation += 1
+                channel.summaries = []
+                channel.consumed = {}
+                channel.fed = {}
+                channel.failed = False
+                state.jobs = deque(job for job in state.jobs if job[0] != key)
+            else:
+                for entry_key in pending_keys:
+                    channel.fed.pop(entry_key, None)
+            channel.pending = []
+            channel.pending_tokens = 0
+            channel.counts = {}
+            for entry_key, item, line, digest in entries:
+                timestamp = str(item.get("timestamp", ""))
+                channel.counts[timestamp] = channel.counts.get(timestamp, 0) + 1
+                if entry_key not in channel.fed:
+                    self._rolling_append(state, key, channel, entry_key, line)
+
+    def _rolling_feed(self, key, item):
+        state = self._rolling
+        if state is None:
+            return
+        line = self._rolling_line(key, item)
+        with state.cond:
+            if state.stopped:
+                return
+            channel = state.channels[key]
+            timestamp = str(item.get("timestamp", ""))
+            entry_key = f"{timestamp}#{channel.counts.get(timestamp, 0)}"
+            channel.counts[timestamp] = channel.counts.get(timestamp, 0) + 1
+            self._rolling_append(state, key, channel, entry_key, line)
+
+    def _rolling_append(self, state, key, channel, entry_key, line):
+        """Add one item's line to the channel's current chunk; called with state.cond held."""
+        if line is None:
+            return
+        digest = self._line_digest(line)
+        channel.fed[entry_key] = digest
+        line_tokens = self.calculate_token_usage(line)
+        if line_tokens > channel.budget:
+            line = self._truncate_to_tokens(line, channel.budget)
+            line_tokens = channel.budget
+        extra = line_tokens + (self.calculate_token_usage("\n") if channel.pending else 0)
+        if channel.pending and channel.pending_tokens + extra > channel.budget:
+            # The chunk is full: queue it, ending just before this item
+            text = "\n".join(pending_line for _, _, pending_line in channel.pending)
+            covered = {pending_key: pending_digest for pending_key, pending_digest, _ in channel.pending}
+            state.jobs.append((key, text, covered, channel.generation))
+            state.cond.notify_all()
+            channel.pending = []
+            channel.pending_tokens = 0
+            extra = line_tokens
+        channel.pending.append((entry_key, digest, line))
+        channel.pending_tokens += extra
+
+    def _rolling_worker(self, state):
+        while True:
+            with state.cond:
+                state.cond.wait_for(lambda: state.jobs or state.stopped)
+                if state.stopped:
+                    return
+
+            # Low priority: only start a summary while no interactive request is running
+            if not Agent.wait_for_foreground_idle(timeout=1.0):
+                continue
+
+            with state.cond:
+                if state.stopped or not state.jobs:
+                    continue
+                key, text, covered, generation = state.jobs.popleft()
+                channel = state.channels[key]
+                if channel.failed:
+                    continue
+                label = f"{channel.label} chunk {len(channel.summaries) + 1}"
+
+            summary = self._ask_for_summary(text, label, cache_folder=state.procedure_folder)
+
+            with state.cond:
+                if generation != channel.generation:
+                    # The channel was reset while this chunk was being summarized
+                    continue
+                if summary:
+                    channel.summaries.append(summary)
+                    channel.consumed.update(covered)
+                    self._save_rolling_file(state)
+                else:
+                    # Leave the rest of this channel to be summarized at case end
+                    self._logger.warning(f"Rolling summary failed for {label}; deferring remaining {channel.label.lower()}")
+                    channel.failed = True
+
+    def _rolling_snapshot(self, procedure_folder):
+        """
+        Summaries produced so far for `procedure_folder`, as {channel: (consumed, summaries)}
+        where `consumed` maps the entry keys of the covered items to their line digests.
+        Uses the live state when this agent is rolling that folder, else the persisted file.
+        """
+        state = self._rolling
+        if state and os.path.abspath(state.procedure_folder) == os.path.abspath(procedure_folder):
+            with state.cond:
+                return {key: (dict(c.consumed), list(c.summaries)) for key, c in state.channels.items()}
+        return self._rolling_snapshot_from_file(procedure_folder)
+
+    def _rolling_snapshot_from_file(self, procedure_folder):
+        snapshot = {}
+        for key, entry in self._load_rolling_file(procedure_folder).items():
+            consumed = entry.get("consumed") if isinstance(entry, dict) else None
+            if not isinstance(consumed, list):
+                # Written by a version that tracked coverage by count; not trustworthy
+                continue
+            snapshot[key] = ({entry_key: digest for entry_key, digest in consumed}, entry.get("summaries", []))
+        return snapshot
+
+    def _summarize_from_rolling(self, key, items, rolling, cache_folder=None):
+        """
+        Summarize only the items not yet covered by rolling summaries, then reduce.
+        Returns None when there is nothing usable to build on.
+        """
+        consumed, summaries = rolling.get(key, ({}, []))
+        if not summaries:
+            return None
+
+        label = ROLLING_CHANNELS[key]
+        lines = []
+        current = {}
+        for entry_key, item in zip(self._rolling_keys(items), items):
+            line = self._rolling_line(key, item)
+            if line is None:
+                continue
+            current[entry_key] = self._line_digest(line)
+            if entry_key not in consumed:
+                lines.append(line)
+        if any(current.get(entry_key) != digest for entry_key, digest in consumed.items()):
+            # An item was amended or removed after it was summarized
+            self._logger.info(f"Rolling summaries for {label} are out of date; summarizing from scratch")
+            return None
+
+        self._logger.info(f"Reusing {len(summaries)} rolling summaries for {label}; {len(lines)} lines remaining")
+        summaries = list(summaries)
+        if lines:
+            for chunk in self._pack_lines(lines, self._data_chunk_budget(label)):
+                summary = self._ask_for_summary(chunk, f"{label} chunk {len(summaries) + 1}", cache_folder)
+                if summary:
+                    summaries.append(summary)
+        return self._reduce_summaries(summaries, label, cache_folder)
+
+    def _data_chunk_budget(self, label):
+        # Chunk labels are numbered as they fill; size for a generous count so
+        # the budget, and therefore chunk boundaries, stay put as data grows.
+        return self._chunk_token_budget(f"{label} chunk 9999")
+
+    def _load_rolling_file(self, procedure_folder):
+        path = os.path.join(procedure_folder, ROLLING_SUMMARY_FILE)
+        if not os.path.isfile(path):
+            return {}
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except Exception as e:
+            self._logger.warning(f"Ignoring unreadable rolling summaries {path}: {e}")
+            return {}
+
+    def _save_rolling_file(self, state):
+        path = os.path.join(state.procedure_folder, ROLLING_SUMMARY_FILE)
+        data = {
+            key: {"consumed": [[entry_key, digest] for entry_key, digest in c.consumed.items()], "summaries": c.summaries}
+            for key, c in state.channels.items()
+        }
+        try:
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            self._logger.error(f"Error writing rolling summaries to {path}: {e}", exc_info=True)
+
     def _ask_for_json(self, prompt_text: str):
+        """
+        Generate the post-op note constrained by the configured JSON schema. If the
+        output hits max_tokens, ask the server to continue the partial assistant
+        message rather than regenerating the whole note, up to max_continuations times.
+        """
         messages = []
         if self.agent_prompt:
             messages.append({"role": "system", "content": self.agent_prompt})
@@ -179,189 +593,92 @@ class PostOpNoteAgent(Agent):
         messages.append({"role": "user", "content": user_content})
 
         self._logger.debug("Calling vLLM for JSON response.")
+        content = ""
         try:
-            # First attempt with standard parameters
-            result = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=messages,
-                temperature=0.3,
-                max_tokens=self.ctx_length
-            )
-            content = result.choices[0].message.content
-            # Strip any Python tag markers that might be in the response
-            if content.startswith("<|python_tag|>"):
-                content = content.replace("<|python_tag|>", "")
-                
-            # Check if we have a complete JSON response
-            if self._is_truncated_json(content):
-                self._logger.warning("Detected truncated JSON in first response, trying again with different parameters")
-                # Try again with more structured approach
-                structured_messages = [
-                    {"role": "system", "content": f"{self.agent_prompt}\nIMPORTANT: Your response MUST be complete, valid JSON only. Do not truncate your response."},
-                    {"role": "user", "content": f"Generate a post-operative note in JSON format. Keep it concise but complete.\n\n{user_content}"}
-                ]
-                
-                # Second attempt with more explicit instructions and higher max_tokens
+            for attempt in range(self.max_continuations + 1):
+                if not content:
+                    request_messages = messages
+                    extra_body = {"guided_json": self.schema_dict} if self.schema_dict else None
+                else:
+                    # Resume from the partial output. Guided decoding would restart the
+                    # grammar from the top of the object, so continuations run unguided;
+                    # the guided prefix already fixes the structure being completed.
+                    request_messages = messages + [{"role": "assistant", "content": content}]
+                    extra_body = {"continue_final_message": True, "add_generation_prompt": False}
+
                 result = self.client.chat.completions.create(
                     model=self.model_name,
-                    messages=structured_messages,
-                    temperature=0.2,  # Lower temperature for more deterministic output
-                    max_tokens=self.ctx_length * 2  # Double the tokens to ensure completion
+                    messages=request_messages,
+                    temperature=0.3,
+                    max_tokens=self.ctx_length,
+                    extra_body=extra_body
                 )
-                content = result.choices[0].message.content
-            
+                choice = result.choices[0]
+                content += choice.message.content or ""
+                # Strip any Python tag markers that might be in the response
+                if content.startswith("<|python_tag|>"):
+                    content = content.replace("<|python_tag|>", "")
+
+                if choice.finish_reason != "length":
+                    break
+                self._logger.warning(
+                    f"Post-op note truncated at {len(content)} chars "
+                    f"(continuation {attempt + 1}/{self.max_continuations})"
+                )
+
             return content
         except Exception as e:
             self._logger.error(f"Error getting response from vLLM server: {e}", exc_info=True)
             raise
-            
-    def _is_truncated_json(self, text):
-        """Check if JSON appears to be truncated"""
-        # Count opening and closing braces
-        open_braces = text.count('{')
-        close_braces = text.count('}')
-        
-        # Check if we have complete pairs
-        if open_braces != close_braces:
-            self._logger.warning(f"Potential truncated JSON: {open_braces} opening braces vs {close_braces} closing braces")
-            return True
-            
-        # Check for typical truncation patterns
-        if text.rstrip().endswith(',') or text.rstrip().endswith(':') or text.rstrip().endswith('"'):
-            self._logger.warning(f"Potential truncated JSON: ends with delimiter")
-            return True
-            
-        try:
-            # Try to parse it
-            json.loads(text.strip())
-            return False
-        except json.JSONDecodeError as e:
-            # If there's a specific truncation error
-            if "Expecting" in str(e) or "Unterminated" in str(e):
-                self._logger.warning(f"JSON parse error suggests truncation: {e}")
-                return True
-            
-            # Otherwise it might be invalid for other reasons
-            return False
-            
-    def _fix_truncated_json(self, text):
-        """Attempt to fix truncated JSON by completing missing structure"""
-        import re
-        import datetime
-        
-        try:
-            # Clean the text
-            text = text.strip()
-            
-            # Extract what looks like a JSON object 
-            if '{' in text:
-                # Get everything from the first opening brace
-                potential_json = text[text.find('{'):]
-                
-                # Count braces to determine what's missing
-                open_braces = potential_json.count('{')
-                close_braces = potential_json.count('}')
-                
-                # Add missing closing braces
-                if open_braces > close_braces:
-                    missing_braces = open_braces - close_braces
-                    potential_json += '}' * missing_braces
-                
-                # Fix common truncation issues
-                # Remove trailing commas before closing braces
-                potential_json = re.sub(r',\s*}', '}', potential_json)
-                
-                # Fix unterminated strings by checking if we have an odd number of quotes
-                if potential_json.count('"') % 2 != 0:
-                    # Add a closing quote to the last string that's missing one
-                    last_quote_pos = potential_json.rfind('"')
-                    if last_quote_pos > 0:
-                        potential_json = potential_json[:last_quote_pos+1] + '"' + potential_json[last_quote_pos+1:]
-                
-                try:
-                    # Try to parse the fixed JSON
-                    fixed_json = json.loads(potential_json)
-                    self._logger.info("Successfully fixed truncated JSON")
-                    
-                    # Ensure it has the required structure
-                    base_structure = {
-                        "procedure_information": {
-                            "procedure_type": "laparoscopic procedure",
-                            "date": datetime.datetime.now().strftime("%Y-%m-%d"),
-                            "duration": "Unknown",
-                            "surgeon": "Not specified"
-                        },
-                        "findings": [],
-                        "procedure_timeline": [],
-                        "complications": []
-                    }
-                    
-                    # Add any missing sections
-                    for key, default in base_structure.items():
-                        if key not in fixed_json:
-                            fixed_json[key] = default
-                        elif fixed_json[key] is None:
-                            fixed_json[key] = default
-                            
-                    # Ensure procedure_information has all required fields
-                    if isinstance(fixed_json.get("procedure_information"), dict):
-                        for field, default in base_structure["procedure_information"].items():
-                            if field not in fixed_json["procedure_information"]:
-                                fixed_json["procedure_information"][field] = default
-                    
-                    return fixed_json
-                    
-                except Exception as e:
-                    self._logger.warning(f"Failed to fix and parse truncated JSON: {e}")
-            
-            # Couldn't fix it, return None to trigger fallback
-            return None
-            
-        except Exception as e:
-            self._logger.error(f"Error in _fix_truncated_json: {e}", exc_info=True)
-            return None
 
-    def _chunk_summarize_annotation(self, ann_list):
+    def _chunk_summarize_annotation(self, ann_list, rolling=None, cache_folder=None):
         if not ann_list:
             return "No annotation data found."
-        
-        lines = []
-        
-        # Track all unique tools, phases, and anatomy for comprehensive summary
-        all_tools = set()
-        all_phases = set()
-        all_anatomy = set()
-        
+
+        summary = self._summarize_from_rolling("annotation", ann_list, rolling or {}, cache_folder)
+        if summary is None:
+            lines = [self._annotation_line(ann) for ann in ann_list]
+            summary = self._multi_step_chunk_summarize(lines, label="Annotation data", cache_folder=cache_folder)
+
+        # Put a header in front to highlight all tools, phases, and anatomy. It is
+        # kept out of the chunks so that adding data does not shift chunk boundaries.
+        summary_lines = self._annotation_header(ann_list)
+        if summary_lines:
+            return "\n".join(summary_lines + ["---", summary])
+        return summary
+
+    def _annotation_line(self, ann):
+        ts = ann.get("timestamp", "???")
+        phase = ann.get("surgical_phase", "?")
+        desc = ann.get("description", "?")
+        tools = ann.get("tools", [])
+        anatomy = ann.get("anatomy", [])
+
+        # Create a more detailed line including tools and anatomy when available
+        details = []
+        if tools:
+            details.append(f"Tools=[{', '.join(tools)}]")
+        if anatomy:
+            details.append(f"Anatomy=[{', '.join(anatomy)}]")
+
+        if details:
+            return f"[{ts}] Phase={phase}, {desc} {' '.join(details)}"
+        return f"[{ts}] Phase={phase}, {desc}"
+
+    def _annotation_header(self, ann_list):
+        # Track all unique tools, phases, and anatomy in first-seen order, so the
+        # header text (and the prompts built from it) is stable across runs
+        all_tools = {}
+        all_phases = {}
+        all_anatomy = {}
+
         for ann in ann_list:
-            ts = ann.get("timestamp", "???")
             phase = ann.get("surgical_phase", "?")
-            desc = ann.get("description", "?")
-            
-            # Extract and track tools, anatomy
-            tools = ann.get("tools", [])
-            anatomy = ann.get("anatomy", [])
-            
-            # Update our tracking sets
             if phase and phase != "?":
-                all_phases.add(phase)
-            if tools:
-                all_tools.update(tools)
-            if anatomy:
-                all_anatomy.update(anatomy)
-            
-            # Create a more detailed line including tools and anatomy when available
-            details = []
-            if tools:
-                details.append(f"Tools=[{', '.join(tools)}]")
-            if anatomy:
-                details.append(f"Anatomy=[{', '.join(anatomy)}]")
-                
-            if details:
-                lines.append(f"[{ts}] Phase={phase}, {desc} {' '.join(details)}")
-            else:
-                lines.append(f"[{ts}] Phase={phase}, {desc}")
-        
-        # Add a summary line at the beginning to highlight all tools, phases, and anatomy
+                all_phases[phase] = None
+            all_tools.update(dict.fromkeys(ann.get("tools", []) or []))
+            all_anatomy.update(dict.fromkeys(ann.get("anatomy", []) or []))
+
         summary_lines = []
         if all_phases:
             summary_lines.append(f"ALL PHASES: {', '.join(all_phases)}")
@@ -369,119 +686,254 @@ class PostOpNoteAgent(Agent):
             summary_lines.append(f"ALL TOOLS: {', '.join(all_tools)}")
         if all_anatomy:
             summary_lines.append(f"ALL ANATOMY: {', '.join(all_anatomy)}")
-            
-        # Combine the summary header with the detailed lines
-        if summary_lines:
-            lines = summary_lines + ["---"] + lines
-            
-        return self._multi_step_chunk_summarize(lines, label="Annotation data")
+        return summary_lines
 
-    def _chunk_summarize_notetaker(self, note_list):
+    def _chunk_summarize_notetaker(self, note_list, rolling=None, cache_folder=None):
         if not note_list:
             return "No notetaker data found."
-            
+
         # Log the actual count of notes for debugging
         self._logger.info(f"Processing {len(note_list)} notetaker notes")
 
         # Filter out empty or placeholder notes
         valid_notes = []
         for note in note_list:
-            text = note.get("text", "").strip()
-            title = note.get("title", "").strip()
-            
-            # Skip notes with empty or placeholder content
-            if not text or text.lower() in ["take a note", "no text", "empty"]:
+            if self._is_placeholder_note(note):
                 self._logger.debug(f"Skipping empty/placeholder note: {note}")
                 continue
-                
             valid_notes.append(note)
-            
+
         self._logger.info(f"Found {len(valid_notes)} valid notes after filtering")
-        
+
         if not valid_notes:
             return "No substantive notetaker data found (0 valid notes)."
 
-        lines = []
+        summary = self._summarize_from_rolling("notes", note_list, rolling or {}, cache_folder)
+        if summary is None:
+            lines = [self._note_line(note) for note in valid_notes]
+            summary = self._multi_step_chunk_summarize(lines, label="Notetaker data", cache_folder=cache_folder)
+
         # Add a note count header
-        lines.append(f"TOTAL NOTES: {len(valid_notes)}")
-        lines.append("---")
-        
-        for note in valid_notes:
-            ts = note.get("timestamp", "???")
-            txt = note.get("text", "(no text)")
-            title = note.get("title", "")
-            
-            # Include the title if available
-            if title:
-                lines.append(f"[{ts}] TITLE: {title} | CONTENT: {txt}")
-            else:
-                lines.append(f"[{ts}] {txt}")
+        return f"TOTAL NOTES: {len(valid_notes)}\n---\n{summary}"
+
+    def _is_placeholder_note(self, note):
+        text = note.get("text", "").strip()
+        return not text or text.lower() in ["take a note", "no text", "empty"]
+
+    def _note_line(self, note):
+        ts = note.get("timestamp", "???")
+        txt = note.get("text", "(no text)")
+        title = note.get("title", "")
 
-        return self._multi_step_chunk_summarize(lines, label="Notetaker data")
+        # Include the title if available
+        if title:
+            return f"[{ts}] TITLE: {title} | CONTENT: {txt}"
+        return f"[{ts}] {txt}"
 
-    def _multi_step_chunk_summarize(self, lines, label="Data"):
+    def _multi_step_chunk_summarize(self, lines, label="Data", cache_folder=None):
         # If no lines to summarize, return a default message
         if not lines:
             return f"No {label.lower()} available to summarize."
-            
-        if len(lines) <= self.chunk_size:
-            block = "\n".join(lines)
-            return self._ask_for_summary(block, label)
-        else:
-            try:
-                chunk_summaries = []
-                total = len(lines)
-                n_chunks = math.ceil(total / self.chunk_size)
-                idx = 0
-                for i in range(n_chunks):
-                    chunk = lines[idx:idx+self.chunk_size]
-                    idx += self.chunk_size
-                    chunk_text = "\n".join(chunk)
-                    sub_summary = self._ask_for_summary(chunk_text, f"{label} chunk {i+1}/{n_chunks}")
-                    if sub_summary: # Only add non-empty summaries
-                        chunk_summaries.append(sub_summary)
-                
-                # If all chunk summaries failed, return a default message
-                if not chunk_summaries:
-                    return f"Unable to generate summary for {label.lower()}."
-                    
-                final_block = "\n\n".join(chunk_summaries)
-                final_summary = self._ask_for_summary(final_block, f"{label} final summary")
-                
-                # If final summary is empty, use the first chunk summary
-                if not final_summary and chunk_summaries:
-                    final_summary = chunk_summaries[0]
-                    
-                return final_summary or f"Unable to generate final summary for {label.lower()}."
-                
-            except Exception as e:
-                self._logger.error(f"Error in multi-step chunk summarization: {e}", exc_info=True)
-                return f"Error summarizing {label.lower()}: {str(e)}"
 
-    def _ask_for_summary(self, text_block, label="Data"):
-        messages = []
+        chunks = self._pack_lines(lines, self._data_chunk_budget(label))
+        if len(chunks) == 1:
+            return self._ask_for_summary(chunks[0], label, cache_folder)
+
+        try:
+            chunk_summaries = []
+            for i, chunk_text in enumerate(chunks):
+                # Labels must not depend on the chunk count, or every memoized summary
+                # would be invalidated as soon as one more chunk appears
+                sub_summary = self._ask_for_summary(chunk_text, f"{label} chunk {i+1}", cache_folder)
+                if sub_summary: # Only add non-empty summaries
+                    chunk_summaries.append(sub_summary)
+
+            # If all chunk summaries failed, return a default message
+            if not chunk_summaries:
+                return f"Unable to generate summary for {label.lower()}."
+
+            final_summary = self._reduce_summaries(chunk_summaries, label, cache_folder)
+
+            # If final summary is empty, use the first chunk summary
+            if not final_summary and chunk_summaries:
+                final_summary = chunk_summaries[0]
+
+            return final_summary or f"Unable to generate final summary for {label.lower()}."
+
+        except Exception as e:
+            self._logger.error(f"Error in multi-step chunk summarization: {e}", exc_info=True)
+            return f"Error summarizing {label.lower()}: {str(e)}"
+
+    def _reduce_summaries(self, summaries, label="Data", cache_folder=None):
+        """
+        Collapse chunk summaries into one, re-chunking by token budget so the
+        reduce prompt can never overflow either.
+        """
+        final_label = f"{label} final summary"
+        partial_label = f"{label} partial summary"
+        budget = min(self._chunk_token_budget(final_label), self._chunk_token_budget(partial_label))
+        # Clip anything over half the budget so every chunk holds at least two
+        # summaries and each reduce round at least halves the count.
+        half = max(1, budget // 2 - self.calculate_token_usage("\n\n"))
+        while len(summaries) > 1:
+            summaries = [self._truncate_to_tokens(s, half) for s in summaries]
+            groups = self._pack_lines(summaries, budget, separator="\n\n")
+            if len(groups) == 1:
+                return self._ask_for_summary(groups[0], final_label, cache_folder)
+            reduced = [self._ask_for_summary(g, partial_label, cache_folder) for g in groups]
+            summaries = [r for r in reduced if r]
+        return summaries[0] if summaries else ""
+
+    def _chunk_token_budget(self, label):
+        """
+        Tokens available for the data block of a summary request: max_prompt_tokens
+        minus the system prompt, the summary prompt template and the output reserve.
+        """
+        fixed = MESSAGE_OVERHEAD_TOKENS * 2 + self.summary_output_tokens
         if self.agent_prompt:
-            messages.append({"role": "system", "content": self.agent_prompt})
+            fixed += self.calculate_token_usage(self.agent_prompt)
+        fixed += self.calculate_token_usage(self._summary_user_prompt("", label))
+        budget = self.max_prompt_tokens - fixed
+        if budget < MIN_CHUNK_TOKENS:
+            self._logger.warning(
+                f"Chunk token budget for {label} is only {budget} tokens "
+                f"(max_prompt_tokens={self.max_prompt_tokens}, summary_output_tokens={self.summary_output_tokens}); "
+                f"using {MIN_CHUNK_TOKENS}"
+            )
+            budget = MIN_CHUNK_TOKENS
+        return budget
 
-        user_prompt = (
+    def _pack_lines(self, lines, budget, separator="\n"):
+        """
+        Greedily pack lines into as few text blocks as possible, none of which
+        exceeds `budget` tokens. A single line longer than the budget is truncated.
+        """
+        sep_tokens = self.calculate_token_usage(separator)
+        chunks = []
+        current = []
+        current_tokens = 0
+        for line in lines:
+            line_tokens = self.calculate_token_usage(line)
+            if line_tokens > budget:
+                self._logger.warning(f"Line of {line_tokens} tokens exceeds chunk budget {budget}; truncating")
+                line = self._truncate_to_tokens(line, budget)
+                line_tokens = budget
+            extra = line_tokens + (sep_tokens if current else 0)
+            if current and current_tokens + extra > budget:
+                chunks.append(separator.join(current))
+                current = []
+                current_tokens = 0
+                extra = line_tokens
+            current.append(line)
+            current_tokens += extra
+        if current:
+            chunks.append(separator.join(current))
+        return chunks
+
+    def _truncate_to_tokens(self, text, max_tokens):
+        tokens = self.tokenizer.encode(text)
+        if len(tokens) <= max_tokens:
+            return text
+        return self.tokenizer.decode(tokens[:max_tokens])
+
+    def _summary_user_prompt(self, text_block, label):
+        return (
             f"You are summarizing {label}.\n"
             f"Here is the data:\n\n{text_block}\n\n"
             "Please produce a concise summary.\n"
         )
-        messages.append({"role": "user", "content": user_prompt})
+
+    def _ask_for_summary(self, text_block, label="Data", cache_folder=None):
+        """
+        Summarize one block of text. With `cache_folder`, results are memoized on
+        disk keyed by the exact request, so regenerating a note only pays for
+        chunks whose contents changed.
+        """
+        messages = []
+        if self.agent_prompt:
+            messages.append({"role": "system", "content": self.agent_prompt})
+
+        messages.append({"role": "user", "content": self._summary_user_prompt(text_block, label)})
+
+        cache_path = None
+        if cache_folder:
+            cache_path = self._summary_cache_path(cache_folder, messages)
+            cached = self._read_cached_summary(cache_path)
+            if cached:
+                self._logger.debug(f"Summary cache hit for {label}")
+                return cached
 
         try:
             result = self.client.chat.completions.create(
                 model=self.model_name,
                 messages=messages,
                 temperature=0.5,
-                max_tokens=self.ctx_length
+                max_tokens=self.summary_output_tokens
             )
-            return result.choices[0].message.content.strip()
+            summary = result.choices[0].message.content.strip()
         except Exception as e:
             self._logger.error(f"Error summarizing {label} with vLLM: {e}")
             return ""
 
+        if cache_path and summary:
+            self._write_cached_summary(cache_path, label, summary)
+        return summary
+
+    def _summary_cache_path(self, cache_folder, messages):
+        key_material = json.dumps(
+            {"model": self.model_name, "max_tokens": self.summary_output_tokens, "messages": messages},
+            sort_keys=True,
+        )
+        digest = hashlib.sha256(key_material.encode("utf-8")).hexdigest()
+        return os.path.join(cache_folder, SUMMARY_CACHE_DIR, f"{digest}.json")
+
+    def _read_cached_summary(self, cache_path):
+        if not os.path.isfile(cache_path):
+            return None
+        try:
+            with open(cache_path, "r") as f:
+                return json.load(f).get("summary")
+        except Exception as e:
+            self._logger.warning(f"Ignoring unreadable summary cache entry {cache_path}: {e}")
+            return None
+
+    def _write_cached_summary(self, cache_path, label, summary):
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            tmp_path = f"{cache_path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"label": label, "summary": summary}, f)
+            os.replace(tmp_path, cache_path)
+        except Exception as e:
+            self._logger.warning(f"Failed to write summary cache entry {cache_path}: {e}")
+
+    def _load_procedure_data(self, procedure_folder=None, annotations=None, notes=None):
+        """
+        Return (annotations, notes) lists, either from the in-memory arguments or
+        from the procedure folder's JSON files. Returns (None, None) if neither
+        source is usable.
+        """
+        if annotations is not None or notes is not None:
+            self._logger.info("Using in-memory annotation and note data")
+            return (
+                self._check_json_array(annotations or [], "provided annotations"),
+                self._check_json_array(notes or [], "provided notes", is_notes=True),
+            )
+
+        # Check if procedure folder exists
+        if not procedure_folder or not os.path.isdir(procedure_folder):
+            self._logger.error(f"Procedure folder does not exist: {procedure_folder}")
+            return None, None
+
+        self._logger.info(f"Loading post-op data from folder: {procedure_folder}")
+        annotation_json = os.path.join(procedure_folder, "annotation.json")
+        notetaker_json = os.path.join(procedure_folder, "notetaker_notes.json")
+        self._logger.debug(f"Loading annotations from {annotation_json}")
+        ann_list = self._load_json_array(annotation_json)
+        self._logger.debug(f"Loading notes from {notetaker_json}")
+        note_list = self._load_json_array(notetaker_json)
+        return ann_list, note_list
+
     def _load_json_array(self, filepath):
         if not os.path.isfile(filepath):
             self._logger.warning(f"File not found: {filepath}")
@@ -489,38 +941,8 @@ class PostOpNoteAgent(Agent):
         try:
             with open(filepath, "r") as f:
                 data = json.load(f)
-                self._logger.debug(f"Loaded data from {filepath}: {data[:500] if len(str(data)) > 500 else data}")
-                
-                if not isinstance(data, list):
-                    self._logger.warning(f"{filepath} is not a JSON list.")
-                    return []
-                
-                # Check if we have valid content or just empty placeholders
-                if not data:
-                    self._logger.warning(f"{filepath} is an empty list.")
-                    return []
-                
-                # Log the actual count of items
-                self._logger.info(f"Loaded {len(data)} items from {filepath}")
-                
-                # For notetaker notes, we'll filter, not exclude completely
-                if "notetaker_notes.json" in filepath:
-                    # Check if we have at least one valid note
-                    has_valid_note = any(
-                        isinstance(item, dict) and 
-                        item.get("text", "").strip() and 
-                        item.get("text", "").lower().strip() not in ["", "take a note"]
-                        for item in data
-                    )
-                    
-                    if not has_valid_note:
-                        self._logger.warning(f"{filepath} contains only empty or placeholder notes.")
-                        return []
-                    
-                    return data
-                
-                # For annotation files, keep any non-empty list
-                return data
+            self._logger.debug(f"Loaded data from {filepath}: {data[:500] if len(str(data)) > 500 else data}")
+            return self._check_json_array(data, filepath, is_notes="notetaker_notes.json" in filepath)
         except json.JSONDecodeError as e:
             self._logger.error(f"Invalid JSON in {filepath}: {e}", exc_info=True)
             return []
@@ -528,6 +950,36 @@ class PostOpNoteAgent(Agent):
             self._logger.error(f"Error reading {filepath}: {e}", exc_info=True)
             return []
 
+    def _check_json_array(self, data, source, is_notes=False):
+        if not isinstance(data, list):
+            self._logger.warning(f"{source} is not a JSON list.")
+            return []
+
+        # Check if we have valid content or just empty placeholders
+        data = [item for item in data if isinstance(item, dict)]
+        if not data:
+            self._logger.warning(f"{source} is an empty list.")
+            return []
+
+        # Log the actual count of items
+        self._logger.info(f"Loaded {len(data)} items from {source}")
+
+        # For notetaker notes, we'll filter, not exclude completely
+        if is_notes:
+            # Check if we have at least one valid note
+            has_valid_note = any(
+                item.get("text", "").strip() and
+                item.get("text", "").lower().strip() not in ["", "take a note"]
+                for item in data
+            )
+
+            if not has_valid_note:
+                self._logger.warning(f"{source} contains only empty or placeholder notes.")
+                return []
+
+        # For annotation files, keep any non-empty list
+        return data
+
     def _save_post_op_note(self, note_json, filepath):
         try:
             with open(filepath, "w") as f:
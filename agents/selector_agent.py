@@ -11,20 +11,106 @@
 
 import logging
 import json
+import random
+import threading
 from typing import Literal
 from pydantic import BaseModel
 from .base_agent import Agent 
+from utils.intent_router import IntentRouter
+from utils.json_stream import JsonFieldStream
+
+AGENT_CHOICES = ("ChatAgent", "NotetakerAgent", "PostOpNoteAgent")
 
 class SelectorOutput(BaseModel):
-    corrected_input: str
+    # selection comes first so it is generated (and can be acted on) before
+    # the model writes out the corrected sentence
     selection: Literal["ChatAgent", "NotetakerAgent", "PostOpNoteAgent"]
+    corrected_input: str
+
+class FusedSelectorOutput(SelectorOutput):
+    answer: str = ""
 
 class SelectorAgent(Agent):
     def __init__(self, settings_path, response_handler):
         super().__init__(settings_path, response_handler)
         self._logger = logging.getLogger(__name__)
+        router_settings = self.agent_settings.get('local_router') or {}
+        if router_settings.get('enabled', False):
+            self.local_router = IntentRouter(router_settings)
+            self.shadow_rate = router_settings.get('shadow_rate', 0.0)
+        else:
+            self.local_router = None
+            self.shadow_rate = 0.0
+        fused_settings = self.agent_settings.get('fused_mode') or {}
+        self.fused_enabled = fused_settings.get('enabled', False)
+        self.fused_prompt = fused_settings.get('prompt', '').strip()
+        self.fused_grammar = fused_settings.get('grammar')
+        self.fused_ctx_length = fused_settings.get('ctx_length', self.ctx_length)
+
+    def process_request(self, text, chat_history, on_selection=None):
+        """
+        Return (selected_agent, corrected_text). If given, `on_selection(agent)`
+        is called as soon as the agent is known, which for LLM selection is
+        while the corrected input is still being generated.
+        """
+        local_label, local_confidence, local_source = self.route_locally(text)
+        if self.local_router and self.local_router.can_route(local_label, local_confidence, local_source):
+            self._logger.debug(
+                f"Routed locally to {local_label} ({local_source}, confidence {local_confidence:.2f})"
+            )
+            self.local_router.record_local_route(local_source)
+            if random.random() < self.shadow_rate:
+                threading.Thread(
+                    target=self._shadow_check,
+                    args=(text, local_label, local_confidence, local_source),
+                    daemon=True,
+                ).start()
+            self._notify_selection(on_selection, local_label)
+            # No ASR correction on the fast path; agents get the input as heard
+            return local_label, text.strip()
+
+        selected_agent, corrected_text = self._select_with_llm(text, on_selection)
+        if self.local_router and selected_agent:
+            self.local_router.record_llm_decision(
+                text, local_label, local_confidence, local_source, selected_agent
+            )
+            self._logger.debug(f"Intent router stats: {self.local_router.stats()}")
+        return selected_agent, corrected_text
+
+    def route_locally(self, text):
+        """Local intent guess as (agent, confidence, source); (None, 0.0, None) when disabled."""
+        if not self.local_router:
+            return None, 0.0, None
+        try:
+            return self.local_router.classify(text)
+        except Exception as e:
+            self._logger.error(f"Error in local intent routing: {e}", exc_info=True)
+            return None, 0.0, None
+
+    def can_route_locally(self, text):
+        """True if process_request would answer `text` without calling the LLM."""
+        if not self.local_router:
+            return False
+        return self.local_router.can_route(*self.route_locally(text))
+
+    def _shadow_check(self, text, local_label, local_confidence, local_source):
+        """Ask the LLM about a locally routed input, at background priority, to track agreement."""
+        Agent.wait_for_foreground_idle()
+        selected_agent, _ = self._select_with_llm(text)
+        if selected_agent:
+            self.local_router.record_llm_decision(
+                text, local_label, local_confidence, local_source, selected_agent
+            )
+
+    def _notify_selection(self, on_selection, selection):
+        if not on_selection:
+            return
+        try:
+            on_selection(selection)
+        except Exception as e:
+            self._logger.error(f"Error in selection callback: {e}", exc_info=True)
 
-    def process_request(self, text, chat_history):
+    def _select_with_llm(self, text, on_selection=None):
         messages = []
         if self.agent_prompt:
             messages.append({"role": "system", "content": self.agent_prompt})
@@ -32,33 +118,118 @@ class SelectorAgent(Agent):
         user_text = (
             f"User said: {text}\n\n"
             "Please ONLY return JSON in the shape:\n"
-            '{"corrected_input": "...", "selection": "ChatAgent"}\n'
+            '{"selection": "ChatAgent", "corrected_input": "..."}\n'
             "with selection in [ChatAgent, NotetakerAgent, PostOpNoteAgent]."
         )
         messages.append({"role": "user", "content": user_text})
 
         self._logger.debug(f"SelectorAgent calling vLLM with user text: {text}")
 
+        early_selection = []
+        def notify(selection):
+            early_selection.append(selection)
+            self._notify_selection(on_selection, selection)
+
         try:
-            guided_params = {"guided_json": json.loads(self.grammar)}
-            result = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=messages,
-                temperature=0,
-                max_tokens=self.ctx_length,
-                extra_body=guided_params
-            )
-            raw_json_str = result.choices[0].message.content
+            raw_json_str = self._stream_guided_json(messages, self.grammar, self.ctx_length, notify)
             self._logger.debug(f"Raw JSON from vLLM: {raw_json_str}")
             raw_json_str = raw_json_str.replace("\\'", "'")
 
             parsed = SelectorOutput.model_validate_json(raw_json_str)
             selected_agent = parsed.selection
             corrected_text = parsed.corrected_input
+            if not early_selection:
+                self._notify_selection(on_selection, selected_agent)
 
             self._logger.debug(f"Selected agent: {selected_agent}, corrected text: {corrected_text}")
             return selected_agent, corrected_text
 
         except Exception as e:
             self._logger.error(f"Error in process_request: {e}", exc_info=True)
+            if early_selection:
+                # The agent was already dispatched; stay consistent with it
+                return early_selection[0], text
             return None, None
+
+    def process_fused(self, text, chat_history, chat_agent, on_selection=None):
+        """
+        Route and answer a text-only turn in one request. Returns
+        (selected_agent, corrected_text, answer); answer is only meaningful when
+        the selection is ChatAgent, otherwise the caller runs the selected agent
+        as usual. Inputs the local router can handle skip the LLM entirely.
+
+        The answer half is given what `chat_agent` would see for the turn: its
+        system prompt, the conversation so far and its user message with the
+        relevant procedure records.
+        """
+        local_label, local_confidence, local_source = self.route_locally(text)
+        if self.local_router and self.local_router.can_route(local_label, local_confidence, local_source):
+            selected_agent, corrected_text = self.process_request(text, chat_history, on_selection=on_selection)
+            return selected_agent, corrected_text, None
+
+        messages = chat_agent.conversation_messages(text, chat_history)
+        chat_request = messages.pop()["content"]
+        chat_system = messages.pop(0)["content"] if messages and messages[0]["role"] == "system" else ""
+        system_parts = [part for part in (self.fused_prompt, chat_system) if part]
+        if system_parts:
+            messages.insert(0, {"role": "system", "content": "\n\nChatAgent instructions:\n".join(system_parts)})
+        messages.append({
+            "role": "user",
+            "content": f"User said: {text}\n\nIf you select ChatAgent, answer this request:\n{chat_request}"
+        })
+
+        self._logger.debug(f"SelectorAgent calling vLLM in fused mode with user text: {text}")
+
+        early_selection = []
+        def notify(selection):
+            early_selection.append(selection)
+            self._notify_selection(on_selection, selection)
+
+        try:
+            raw_json_str = self._stream_guided_json(messages, self.fused_grammar, self.fused_ctx_length, notify)
+            parsed = FusedSelectorOutput.model_validate_json(raw_json_str.replace("\\'", "'"))
+            if not early_selection:
+                self._notify_selection(on_selection, parsed.selection)
+            if self.local_router:
+                self.local_router.record_llm_decision(
+                    text, local_label, local_confidence, local_source, parsed.selection
+                )
+            answer = parsed.answer.strip() if parsed.selection == "ChatAgent" else None
+            self._logger.debug(f"Fused selection: {parsed.selection}, corrected text: {parsed.corrected_input}")
+            return parsed.selection, parsed.corrected_input, answer or None
+
+        except Exception as e:
+            self._logger.error(f"Error in process_fused: {e}", exc_info=True)
+            if early_selection:
+                return early_selection[0], text, None
+            return None, None, None
+
+    def _stream_guided_json(self, messages, grammar, max_tokens, on_selection=None):
+        """
+        Stream a guided-JSON completion and return the raw JSON text. Watches
+        the JSON as it streams so `on_selection` fires as soon as the selection
+        field is complete, before the rest of the object has been generated.
+        """
+        stream = self.client.chat.completions.create(
+            model=self.model_name,
+            messages=messages,
+            temperature=0,
+            max_tokens=max_tokens,
+            extra_body={"guided_json": json.loads(grammar)},
+            stream=True
+        )
+        fields = JsonFieldStream()
+        parts = []
+        notified = False
+        for chunk in stream:
+            if not chunk.choices or not chunk.choices[0].delta.content:
+                continue
+            delta = chunk.choices[0].delta.content
+            parts.append(delta)
+            for key, value in fields.feed(delta):
+                if key == "selection" and not notified and value in AGENT_CHOICES:
+                    notified = True
+                    self._logger.debug(f"Selection streamed early: {value}")
+                    if on_selection:
+                        on_selection(value)
+        return "".join(parts)
@@ -13,14 +13,19 @@ import asyncio
 import logging
 import os
 import sys
+import time
 from threading import Thread
 
 # Add project root to path to ensure imports work
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from utils.chat_history import ChatHistory
+from utils.conversation_memory import ConversationMemory
+from utils.procedure_index import ProcedureIndex
 from utils.response_handler import ResponseHandler
+from utils.speculation import DeferredOutput, Speculator
 
+from agents.base_agent import Agent
 from agents.selector_agent import SelectorAgent
 from agents.annotation_agent import AnnotationAgent
 from agents.chat_agent import ChatAgent
@@ -34,29 +39,52 @@ logging.basicConfig(level=logging.DEBUG)
 async def main():
     chat_history = ChatHistory()
     response_handler = ResponseHandler()
+    # Runs ChatAgent alongside the selector, since most inputs end up there
+    speculator = Speculator()
 
     # Define the callback for messages coming from the WebSocket.
     def msg_callback(payload, msg_type, timestamp):
         """
         Called when the user manually types input or when the webserver passes along an ASR transcript.
         """
+        # Background LLM work (rolling summaries) waits while the user is being served
+        with Agent.foreground_request():
+            handle_user_message(payload)
+
+    def handle_user_message(payload):
         # Special case for summary generation request
         if 'summary_request' in payload and 'user_input' in payload:
             user_text = payload['user_input']
-            annotations_data = payload.get('annotations_data', [])
-            notes_data = payload.get('notes_data', [])
-            
-            logging.debug(f"Processing summary request with {len(annotations_data)} annotations and {len(notes_data)} notes")
+
+            # Procedure data is read from server-held state; the browser only
+            # names the procedure (omitted: the current one)
+            summary_index = procedure_index
+            procedure_id = payload.get('procedure_id')
+            if procedure_id and procedure_id != procedure_start_str:
+                summary_folder = web.procedure_folder(procedure_id)
+                if not summary_folder:
+                    web.send_message({
+                        "agent_response": f"Unknown procedure: {procedure_id}",
+                        "summary_response": True
+                    })
+                    return
+                summary_index = ProcedureIndex.from_folder(summary_folder)
+
+            counts = summary_index.counts()
+            logging.debug(
+                f"Processing summary request with {counts.get('annotation', 0)} annotations "
+                f"and {counts.get('note', 0)} notes"
+            )
+            procedure_records = summary_index.render_budgeted(
+                chat_agent.summary_context_tokens, chat_agent.calculate_token_usage
+            )
             
             # Build a context-rich prompt for the ChatAgent
             summary_prompt = f"""
 Generate a comprehensive procedure summary based on the following data:
 
-ANNOTATIONS:
-{annotations_data}
-
-NOTES:
-{notes_data}
+PROCEDURE RECORDS (annotations and notes, oldest first):
+{procedure_records or "No annotations or notes recorded."}
 
 Format the summary as a structured medical report including:
 1. Procedure overview
@@ -69,8 +97,8 @@ Include all relevant clinical details captured in the annotations and notes.
 
 IMPORTANT: This is a TEXT-ONLY SUMMARY request. Do not attempt to identify instruments in any attached image - focus only on summarizing the data provided above.
 """
-            # Add to chat history
-            chat_history.add_user_message(summary_prompt)
+            # Add the request (not the bulky prompt) to chat history
+            chat_history.add_user_message(user_text)
             
             # Check if we have a recent frame to include with the summary request
             frame_data = None
@@ -81,11 +109,13 @@ IMPORTANT: This is a TEXT-ONLY SUMMARY request. Do not attempt to identify instr
             # Use the chat agent directly for summaries
             visual_info = {"image_b64": frame_data, "tool_labels": {}} if frame_data else None
             response_data = chat_agent.process_request(
-                summary_prompt, chat_history.to_list(), visual_info
+                summary_prompt, chat_history.view(), visual_info
             )
             
             # Add response to chat history
             chat_history.add_bot_message(response_data["response"])
+            if conversation_memory:
+                conversation_memory.notify()
             
             # Send result to UI with special flag for summary
             web.send_message({
@@ -104,12 +134,16 @@ IMPORTANT: This is a TEXT-ONLY SUMMARY request. Do not attempt to identify instr
                 chat_history.add_user_message(user_text)
                 
             try:
-                # Let the selector decide which agent to pick
-                selected_agent_name, corrected_text = selector_agent.process_request(
-                    user_text, chat_history.to_list()
-                )
-                if not selected_agent_name:
-                    logging.error("No agent selected by selector for user_input.")
+                # Factual questions about the procedure so far are answered from
+                # the index, skipping both the selector and the chat LLM call
+                direct_answer = chat_agent.answer_from_records(user_text)
+                if direct_answer:
+                    if not chat_history.has_message(user_text):
+                        chat_history.add_user_message(user_text)
+                    chat_history.add_bot_message(direct_answer)
+                    if conversation_memory:
+                        conversation_memory.notify()
+                    web.send_message({"agent_response": direct_answer})
                     return
 
                 # Check for frame data directly in the payload
@@ -134,6 +168,69 @@ IMPORTANT: This is a TEXT-ONLY SUMMARY request. Do not attempt to identify instr
                 # Pass the image (if any) along with empty tool labels
                 visual_info = {"image_b64": frame_data, "tool_labels": {}}
 
+                # Text-only turns can be routed and answered in one fused request
+                fused = selector_agent.fused_enabled and not frame_data
+
+                # Start ChatAgent speculatively while the selector decides, unless
+                # the selector can route this input locally without an LLM call
+                # or the fused request will answer it anyway
+                # Its answer streams into a held-back output, released if the
+                # speculation is used, so speech can start with its first sentence
+                speculation = None
+                speculative_output = DeferredOutput()
+                if not fused and not selector_agent.can_route_locally(user_text):
+                    speculative_history = chat_history.view()
+                    speculation = speculator.start(
+                        lambda token: chat_agent.process_request(
+                            user_text, speculative_history, visual_info,
+                            cancel_token=token, output=speculative_output
+                        )
+                    )
+
+                # Act on the selection as soon as the selector streams it: drop
+                # a speculation that cannot be used and record notes right away,
+                # as the NotetakerAgent needs nothing from the LLM
+                early_results = {}
+                def on_selection(selection):
+                    if speculation is not None and selection != "ChatAgent":
+                        speculator.discard(speculation, "other_agent")
+                        early_results["speculation_discarded"] = True
+                    if selection == "NotetakerAgent":
+                        early_results[selection] = notetaker_agent.process_request(
+                            user_text, chat_history.view(), visual_info
+                        )
+
+                # Let the selector decide which agent to pick
+                fused_answer = None
+                if fused:
+                    selected_agent_name, corrected_text, fused_answer = selector_agent.process_fused(
+                        user_text, chat_history.view(), chat_agent, on_selection=on_selection
+                    )
+                else:
+                    selected_agent_name, corrected_text = selector_agent.process_request(
+                        user_text, chat_history.view(), on_selection=on_selection
+                    )
+
+                # Keep the speculative answer only if it answered the same question
+                use_speculation = (
+                    speculation is not None
+                    and selected_agent_name == "ChatAgent"
+                    and Speculator.same_input(user_text, corrected_text)
+                )
+                if (speculation is not None and not use_speculation
+                        and not early_results.get("speculation_discarded")):
+                    if not selected_agent_name:
+                        reason = "no_selection"
+                    elif selected_agent_name == "ChatAgent":
+                        reason = "corrected_input"
+                    else:
+                        reason = "other_agent"
+                    speculator.discard(speculation, reason)
+
+                if not selected_agent_name:
+                    logging.error("No agent selected by selector for user_input.")
+                    return
+
                 # If user input triggers PostOpNoteAgent, do final note generation
                 if selected_agent_name == "PostOpNoteAgent":
                     # Stop the background annotation
@@ -143,6 +240,7 @@ IMPORTANT: This is a TEXT-ONLY SUMMARY request. Do not attempt to identify instr
                     procedure_folder = os.path.dirname(annotation_agent.annotation_filepath)
                     
                     final_json = post_op_note_agent.generate_post_op_note(procedure_folder)
+                    post_op_note_agent.stop_rolling_summary()
                     if final_json is None:
                         response_data = {
                             "name": "PostOpNoteAgent",
@@ -153,11 +251,25 @@ IMPORTANT: This is a TEXT-ONLY SUMMARY request. Do not attempt to identify instr
                             "name": "PostOpNoteAgent",
                             "response": "Final post-op note created. See post_op_note.json in the procedure folder."
                         }
+                elif selected_agent_name in early_results:
+                    response_data = early_results[selected_agent_name]
+                    # The note was recorded from the raw input; keep the corrected wording
+                    notetaker_agent.amend_note(response_data.get("note"), corrected_text)
+                    if response_data.get("note"):
+                        procedure_index.update_note(response_data["note"])
+                        post_op_note_agent.note_amended(response_data["note"])
+                elif fused_answer:
+                    response_data = {"name": "ChatAgent", "response": fused_answer}
+                    response_handler.add_response(fused_answer)
+                    response_handler.end_response()
+                elif use_speculation:
+                    speculative_output.release(response_handler)
+                    response_data = speculator.commit(speculation)
                 else:
                     agent = agents.get(selected_agent_name)
                     if agent:
                         response_data = agent.process_request(
-                            corrected_text, chat_history.to_list(), visual_info
+                            corrected_text, chat_history.view(), visual_info
                         )
                     else:
                         response_data = {
@@ -169,6 +281,8 @@ IMPORTANT: This is a TEXT-ONLY SUMMARY request. Do not attempt to identify instr
                 if not chat_history.has_message(corrected_text):
                     chat_history.add_user_message(corrected_text)
                 chat_history.add_bot_message(response_data["response"])
+                if conversation_memory:
+                    conversation_memory.notify()
 
                 # Check if this is from the NotetakerAgent to tag it for the UI
                 if selected_agent_name == "NotetakerAgent":
@@ -185,6 +299,8 @@ IMPORTANT: This is a TEXT-ONLY SUMMARY request. Do not attempt to identify instr
     # Create the webserver first so that its frame_queue is available.
     global web
     web = Webserver(web_server='0.0.0.0', web_port=8050, ws_port=49000, msg_callback=msg_callback)
+    # Answers reach the speech pipeline as they stream, so voice output starts with the first sentence
+    response_handler.set_listener(web.speech)
     
     # Create a directory for uploaded videos if it doesn't exist
     os.makedirs(os.path.join(os.path.dirname(__file__), 'uploaded_videos'), exist_ok=True)
@@ -203,16 +319,49 @@ IMPORTANT: This is a TEXT-ONLY SUMMARY request. Do not attempt to identify instr
         if anatomy:
             message += f" | Anatomy: {anatomy}"
             
-        # Send to UI
-        web.send_message({"agent_response": message})
+        # Send to UI; the records are kept server-side, so a lagging client may skip some
+        web.send_message({"agent_response": message}, droppable=True)
+
+        # Fold into the rolling post-op summary
+        post_op_note_agent.add_annotation(annotation)
+        procedure_index.add_annotation(annotation)
     
+    # Annotations and notes share one procedure folder so the post-op note sees both.
+    procedure_start_str = time.strftime("%Y_%m_%d__%H_%M_%S", time.localtime())
+
     # Now create agents, passing web.frame_queue to the AnnotationAgent.
     selector_agent = SelectorAgent("configs/selector.yaml", response_handler)
-    annotation_agent = AnnotationAgent("configs/annotation_agent.yaml", response_handler, frame_queue=web.frame_queue)
-    annotation_agent.on_annotation_callback = on_annotation
-    chat_agent = ChatAgent("configs/chat_agent.yaml", response_handler)
-    notetaker_agent = NotetakerAgent("configs/notetaker_agent.yaml", response_handler)
     post_op_note_agent = PostOpNoteAgent("configs/post_op_note_agent.yaml", response_handler)
+    annotation_agent = AnnotationAgent("configs/annotation_agent.yaml", response_handler, frame_queue=web.frame_queue,
+                                       procedure_start_str=procedure_start_str)
+    chat_agent = ChatAgent("configs/chat_agent.yaml", response_handler)
+    notetaker_agent = NotetakerAgent("configs/notetaker_agent.yaml", response_handler,
+                                     procedure_start_str=procedure_start_str)
+
+    # Index annotations and notes so factual questions can be answered without the LLM
+    procedure_index = ProcedureIndex()
+    chat_agent.procedure_index = procedure_index
+
+    def on_note(note):
+        post_op_note_agent.add_note(note)
+        procedure_index.add_note(note)
+    notetaker_agent.on_note_callback = on_note
+    # Count chat tokens once per message with the agents' tokenizer
+    chat_history.token_counter = chat_agent.calculate_token_usage
+
+    # Summarize older chat turns in the background so prompts keep their context
+    memory_settings = chat_agent.agent_settings.get('memory') or {}
+    conversation_memory = None
+    if memory_settings.get('enabled', False):
+        conversation_memory = ConversationMemory(chat_history, chat_agent, memory_settings)
+        conversation_memory.start()
+
+    # Summarize the procedure incrementally so the post-op note is quick at case end
+    post_op_note_agent.start_rolling_summary(os.path.dirname(annotation_agent.annotation_filepath))
+    annotation_agent.on_annotation_callback = on_annotation
+
+    # Summary and post-op requests name a procedure instead of uploading its data
+    web.register_procedure(procedure_start_str, os.path.dirname(annotation_agent.annotation_filepath))
 
     agents = {
         "ChatAgent": chat_agent,
@@ -225,6 +374,7 @@ IMPORTANT: This is a TEXT-ONLY SUMMARY request. Do not attempt to identify instr
             await asyncio.sleep(1.0)
     except asyncio.CancelledError:
         logging.info("Shutting down gracefully.")
+        web.shutdown()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -9,8 +9,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
 import base64
 import flask
+import hashlib
 import json
 import time
 import socket
@@ -18,27 +20,40 @@ import threading
 import queue
 import websockets
 import logging
-import requests
 import os
+import re
+import urllib.parse
 import uuid
 import sys
 
 # Add project root to path to ensure imports work
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from websockets.sync.server import serve as websocket_serve
 from flask import request, jsonify, redirect, url_for
-from agents.post_op_note_agent import PostOpNoteAgent
+from agents.post_op_note_agent import PostOpNoteAgent, fallback_post_op_note
+from utils.job_manager import JobManager
+from utils.async_websocket import AsyncWebSocketServers
+from utils.broadcast_hub import BroadcastHub
+from utils.chunked_upload import UploadError, UploadManager
+from utils.dispatcher import SessionDispatcher
+from utils.faststart import FaststartRemuxer
+from utils.frame_store import FRAME_TYPE_AUTO, FrameStore, parse_frame_message
+from utils.http_cache import IMMUTABLE_MAX_AGE, ResponseCompressor, StaticAssets, cached_json
+from utils.tts import ElevenLabsBackend, LocalBackend, SpeechPipeline, TTSCache, TTSError, TTSService
+from utils.video_catalog import VideoCatalog
+from utils.video_frames import VideoFrameSource
 
 class Webserver(threading.Thread):
     def __init__(self, web_server='0.0.0.0', web_port=8050, ws_port=49000,
-                 audio_ws_port=49001, msg_callback=None):
+                 audio_ws_port=49001, msg_callback=None, tts_backend=None):
         super().__init__(daemon=True)
         self.host = web_server
         self.port = web_port
         self.msg_callback = msg_callback
         self.audio_ws_port = audio_ws_port
         self.frame_queue = queue.Queue()
+        # Frames sent as binary messages, by frame id, for user inputs that refer to one
+        self.frame_store = FrameStore()
         
         # Create videos directory if it doesn't exist
         self.videos_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'uploaded_videos')
@@ -46,9 +61,30 @@ class Webserver(threading.Thread):
         
         # Current video path
         self.current_video_path = None
+
+        # Frames cut from the uploaded videos themselves, at the client's playback position
+        self.video_frames = VideoFrameSource(self.videos_dir)
+        # Uploaded MP4s with the moov atom at the end are rewritten in the background
+        # so playback and seeking can start before the whole file is fetched;
+        # the rewritten file is re-indexed and re-catalogued
+        self.faststart = FaststartRemuxer(on_done=self._on_video_remuxed)
+        # Resumable chunked uploads, hashed as they stream in; identical content is stored once
+        self.uploads = UploadManager(self.videos_dir, on_complete=self._on_video_stored)
+        # Persistent listing of the uploaded videos with their metadata and thumbnails
+        self.video_catalog = VideoCatalog(
+            self.videos_dir, video_frames=self.video_frames, hash_lookup=self.uploads.digest_for
+        )
         
         # Store the most recent frame for follow-up questions
         self.lastProcessedFrame = None
+
+        # Text to speech with a disk cache in front of a pluggable backend (ElevenLabs
+        # by default); answers are spoken sentence by sentence as they are generated
+        self.tts = TTSService(
+            tts_backend or ElevenLabsBackend(),
+            TTSCache(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'tts_cache')),
+        )
+        self.speech = SpeechPipeline(self.tts, on_audio=self._on_speech_audio)
         
         # Initialize the post-op note agent
         try:
@@ -62,41 +98,70 @@ class Webserver(threading.Thread):
             self._logger.error(f"Failed to initialize post-op note agent: {e}", exc_info=True)
             self.post_op_note_agent = None
 
+        # Bounded pool for post-op note generation; progress is pushed over the WebSocket
+        self.post_op_note_jobs = JobManager(max_workers=2, on_update=self._on_post_op_job_update)
+
+        # Procedures whose data this server holds, by id (procedure start time,
+        # e.g. "2025_01_31__09_15_00"); requests name one instead of uploading data
+        self.procedures = {}
+        self.current_procedure_id = None
+
         self.app = flask.Flask(__name__, 
             template_folder=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'web/templates'),
             static_folder=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'web/static'))
+        # Static files are linked by content-hashed URLs and served precompressed;
+        # larger dynamic responses are compressed on the fly
+        self.static_assets = StaticAssets(self.app.static_folder)
+        self.app.view_functions['static'] = self.static_assets.serve
+        self.app.jinja_env.globals['asset_url'] = self.static_assets.url
+        ResponseCompressor().init_app(self.app)
         self.app.add_url_rule('/', view_func=self.on_index, methods=['GET'])
         self.app.add_url_rule('/api/tts', view_func=self.tts_route, methods=['POST'])
+        self.app.add_url_rule('/api/tts/audio/<key>', view_func=self.tts_audio_route, methods=['GET'])
         self.app.add_url_rule('/api/upload_video', view_func=self.upload_video_route, methods=['POST'])
+        self.app.add_url_rule('/api/uploads', view_func=self.create_upload_route, methods=['POST'])
+        self.app.add_url_rule('/api/uploads/<upload_id>', view_func=self.upload_status_route, methods=['GET'])
+        self.app.add_url_rule('/api/uploads/<upload_id>', view_func=self.upload_chunk_route, methods=['PUT'])
+        self.app.add_url_rule('/api/uploads/<upload_id>', view_func=self.abort_upload_route, methods=['DELETE'])
+        self.app.add_url_rule('/api/uploads/<upload_id>/complete', view_func=self.complete_upload_route, methods=['POST'])
         self.app.add_url_rule('/api/videos', view_func=self.list_videos_route, methods=['GET'])
         self.app.add_url_rule('/api/select_video', view_func=self.select_video_route, methods=['POST'])
         self.app.add_url_rule('/api/generate_post_op_note', view_func=self.generate_post_op_note_route, methods=['POST'])
+        self.app.add_url_rule('/api/post_op_note_jobs', view_func=self.submit_post_op_note_job_route, methods=['POST'])
+        self.app.add_url_rule('/api/post_op_note_jobs/<job_id>', view_func=self.post_op_note_job_route, methods=['GET'])
+        self.app.add_url_rule('/api/websocket_clients', view_func=self.websocket_clients_route, methods=['GET'])
         self.app.add_url_rule('/videos/<path:filename>', view_func=self.serve_video, methods=['GET'])
 
-        # For text messages from WebSocket - make sure we listen on all interfaces
-        self.ws_queue = queue.Queue()
+        # Outgoing messages fan out to every connected client, each through its own bounded queue
+        self.ws_hub = BroadcastHub()
+        # User inputs run on a bounded pool, in order per client, so sockets keep
+        # reading frames and heartbeats while agents work
+        self.dispatcher = SessionDispatcher(max_workers=4, max_pending=8)
+        # Both WebSocket servers share one asyncio event loop; handlers are coroutines
+        # and blocking work runs on a bounded pool, so connections do not cost threads
+        self.ws_servers = AsyncWebSocketServers()
         # Configure WebSocket with longer ping timeout and interval for more reliability
-        self.ws_server = websocket_serve(
-            self.on_websocket, 
-            host='0.0.0.0', 
+        self.ws_servers.add(
+            self.on_websocket,
+            host='0.0.0.0',
             port=ws_port,
             ping_interval=30,  # Send ping every 30 seconds (default is 20)
             ping_timeout=60,   # Wait 60 seconds for pong response (default is 20)
-            max_size=10485760  # Increase max message size to 10MB for frame data
+            max_size=10485760,  # Increase max message size to 10MB for frame data
+            max_queue=16,      # Stop reading from a client once this many messages are unprocessed
+            write_limit=1048576  # Sends wait once this much is buffered for a slow client
         )
-        self._logger.info(f"WebSocket server listening on 0.0.0.0:{ws_port}")
-        self.ws_thread = threading.Thread(target=lambda: self.ws_server.serve_forever(), daemon=True)
 
         # For single-chunk audio - make sure we listen on all interfaces
-        self.audio_ws_server = websocket_serve(
-            self.on_audio_websocket, 
-            host='0.0.0.0', 
+        self.ws_servers.add(
+            self.on_audio_websocket,
+            host='0.0.0.0',
             port=self.audio_ws_port,
             ping_interval=30,  # Send ping every 30 seconds
             ping_timeout=60    # Wait 60 seconds for pong response
         )
-        self._logger.info(f"Audio WebSocket server listening on 0.0.0.0:{self.audio_ws_port}")
-        self.audio_ws_thread = threading.Thread(target=lambda: self.audio_ws_server.serve_forever(), daemon=True)
+        # One transcription at a time over the shared Whisper socket
+        self._whisper_lock = threading.Lock()
 
         self._logger = logging.getLogger(__name__)
         self._logger.setLevel(logging.DEBUG)
@@ -137,34 +202,94 @@ class Webserver(threading.Thread):
         return flask.render_template('index.html', video_src=video_src)
         
     def serve_video(self, filename):
-        """Serve uploaded videos"""
-        return flask.send_from_directory(self.videos_dir, filename)
+        """
+        Serve uploaded videos with byte-range support (206/416, If-Range) and
+        ETag/Last-Modified validators, so seeking fetches only what it needs
+        and reloads revalidate with a 304. Files can be rewritten in place by
+        the faststart remux, so clients must revalidate rather than cache blindly.
+        Dot-prefixed paths hold upload and catalog state; of those only the
+        catalog thumbnails are served.
+        """
+        hidden = any(part.startswith('.') for part in filename.split('/'))
+        if hidden and not filename.startswith('.catalog/thumbnails/'):
+            return jsonify({"error": "Video file not found"}), 404
+        response = flask.send_from_directory(
+            self.videos_dir, filename, conditional=True, etag=True, max_age=0
+        )
+        response.headers['Accept-Ranges'] = 'bytes'
+        response.cache_control.no_cache = True
+        return response
         
     def upload_video_route(self):
-        """Handle video upload"""
+        """Handle a single-request video upload (stored through the chunked upload path)"""
         if 'video' not in request.files:
             return jsonify({"error": "No video file uploaded"}), 400
             
         video_file = request.files['video']
         if video_file.filename == '':
             return jsonify({"error": "No video file selected"}), 400
-        
-        # Get original filename and extension
-        original_filename = os.path.basename(video_file.filename)
-        base_name, file_ext = os.path.splitext(original_filename)
-        
-        # Create a safe filename (handle duplicates)
-        final_filename = original_filename
-        counter = 1
-        
-        # Check if file exists, if so, add incremental suffix
-        while os.path.exists(os.path.join(self.videos_dir, final_filename)):
-            final_filename = f"{base_name}_{counter}{file_ext}"
-            counter += 1
-        
-        # Save the video file with the final name
-        video_path = os.path.join(self.videos_dir, final_filename)
-        video_file.save(video_path)
+
+        try:
+            video_path, digest, deduplicated = self.uploads.store_stream(video_file.filename, video_file.stream)
+        except UploadError as e:
+            return jsonify({"error": str(e)}), e.status
+        return self._activate_uploaded_video(video_path, digest, deduplicated)
+
+    def create_upload_route(self):
+        """Start a resumable upload: {"filename", "size"} -> {"upload_id", "offset", "chunk_size"}"""
+        data = request.get_json(silent=True) or {}
+        try:
+            state = self.uploads.create(data.get('filename'), data.get('size'))
+        except UploadError as e:
+            return jsonify({"error": str(e)}), e.status
+        state["chunk_size"] = 8 * 1024 * 1024
+        return jsonify(state), 201
+
+    def upload_status_route(self, upload_id):
+        """Where an interrupted upload should resume"""
+        try:
+            return jsonify(self.uploads.status(upload_id))
+        except UploadError as e:
+            return jsonify({"error": str(e)}), e.status
+
+    def upload_chunk_route(self, upload_id):
+        """Append the request body at ?offset=N; the body is streamed to disk, not buffered"""
+        try:
+            offset = int(request.args.get('offset', request.headers.get('Upload-Offset', '')))
+        except ValueError:
+            return jsonify({"error": "offset is required"}), 400
+        try:
+            state = self.uploads.append(upload_id, offset, request.stream)
+        except UploadError as e:
+            return jsonify({"error": str(e), "offset": e.offset}), e.status
+        return jsonify(state)
+
+    def abort_upload_route(self, upload_id):
+        try:
+            self.uploads.abort(upload_id)
+        except UploadError as e:
+            return jsonify({"error": str(e)}), e.status
+        return jsonify({"success": True})
+
+    def complete_upload_route(self, upload_id):
+        try:
+            video_path, digest, deduplicated = self.uploads.complete(upload_id)
+        except UploadError as e:
+            return jsonify({"error": str(e), "offset": e.offset}), e.status
+        return self._activate_uploaded_video(video_path, digest, deduplicated)
+
+    def _on_video_stored(self, video_path, digest):
+        # Downstream stages start as soon as the file is in place; none
+        # needs the upload to be read again. Cataloguing also builds the
+        # frame index.
+        self.video_catalog.add(video_path, digest)
+        self.faststart.submit(video_path)
+
+    def _on_video_remuxed(self, video_path):
+        self.video_catalog.add(video_path)
+
+    def _activate_uploaded_video(self, video_path, digest, deduplicated):
+        final_filename = os.path.basename(video_path)
         
         # Update current video path
         self.current_video_path = video_path
@@ -179,25 +304,31 @@ class Webserver(threading.Thread):
             "success": True,
             "video_path": video_path,
             "video_src": f"/videos/{final_filename}",
-            "filename": final_filename
+            "filename": final_filename,
+            "sha256": digest,
+            "deduplicated": deduplicated
         })
         
     def list_videos_route(self):
-        """List all uploaded videos"""
-        videos = []
-        for filename in os.listdir(self.videos_dir):
-            if os.path.isfile(os.path.join(self.videos_dir, filename)) and filename.lower().endswith(('.mp4', '.webm', '.mov', '.avi')):
-                videos.append({
-                    "filename": filename,
-                    "video_src": f"/videos/{filename}",
-                    "size": os.path.getsize(os.path.join(self.videos_dir, filename)),
-                    "modified": os.path.getmtime(os.path.join(self.videos_dir, filename))
-                })
-        
-        # Sort by most recently modified
-        videos.sort(key=lambda x: x["modified"], reverse=True)
-        
-        return jsonify({"videos": videos})
+        """List uploaded videos, newest first; `offset` and `limit` select a page"""
+        try:
+            offset = max(int(request.args.get('offset', 0)), 0)
+            limit = request.args.get('limit')
+            limit = max(int(limit), 1) if limit is not None else None
+        except ValueError:
+            return jsonify({"error": "offset and limit must be integers"}), 400
+
+        videos, total, version = self.video_catalog.page(offset, limit)
+        next_offset = offset + len(videos)
+        # The catalog version changes with any listed file or its metadata,
+        # so an unchanged library revalidates with a 304
+        return cached_json({
+            "videos": videos,
+            "total": total,
+            "offset": offset,
+            "limit": limit,
+            "next_offset": next_offset if next_offset < total else None
+        }, etag=f"videos-{version}-{offset}-{limit}")
         
     def select_video_route(self):
         """Select a video from the uploaded videos"""
@@ -213,6 +344,7 @@ class Webserver(threading.Thread):
             
         # Update current video path
         self.current_video_path = video_path
+        self.video_frames.index_async(video_path)
         
         # Send message to client to update video source
         self.send_message({
@@ -226,140 +358,200 @@ class Webserver(threading.Thread):
             "video_src": f"/videos/{filename}"
         })
 
-    def on_websocket(self, websocket):
-        listener_thread = threading.Thread(target=self.websocket_listener, args=[websocket], daemon=True)
-        listener_thread.start()
-        # Send queued messages
+    async def on_websocket(self, websocket):
+        subscriber = self.ws_hub.subscribe(name=str(websocket.remote_address))
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
+        # Messages are published from other threads; wake this connection's sender
+        subscriber.set_notifier(lambda: loop.call_soon_threadsafe(wakeup.set))
+        # Tell the client its session id (used to route replies to its voice
+        # input) and whether to report playback positions instead of uploading frames
+        subscriber.offer(json.dumps({"session": subscriber.id, "server_frames": self.video_frames.available}))
+        wakeup.set()
+        sender = asyncio.create_task(self._websocket_sender(websocket, subscriber, wakeup))
         try:
+            await self.websocket_listener(websocket, session=subscriber.id)
+        finally:
+            self.ws_hub.unsubscribe(subscriber)
+            self.frame_store.drop_session(subscriber.id)
+            self.speech.drop_session(subscriber.id)
+            await sender
+
+    async def _websocket_sender(self, websocket, subscriber, wakeup):
+        # Send this client's queued messages; bursts go out as one JSON array frame
+        while True:
+            await wakeup.wait()
+            wakeup.clear()
+            if subscriber.batch_window and 0 < subscriber.pending() < subscriber.batch_max:
+                await asyncio.sleep(subscriber.batch_window)
             while True:
-                msg = self.ws_queue.get()
-                self._logger.debug(f"Sending message to client: {msg}")
+                batch = subscriber.take_batch()
+                if batch is None:
+                    return
+                if not batch:
+                    break
+                msg = batch[0] if len(batch) == 1 else "[" + ",".join(batch) + "]"
+                self._logger.debug(f"Sending {len(batch)} message(s) to client {subscriber.id}")
                 try:
-                    websocket.send(msg)
+                    # Waits while this client's write buffer is full; meanwhile
+                    # its hub queue absorbs (and, if needed, sheds) new messages
+                    await websocket.send(msg)
                 except websockets.exceptions.ConnectionClosedOK:
                     self._logger.info("WebSocket connection closed by client")
-                    break
+                    return
                 except websockets.exceptions.ConnectionClosedError as e:
                     self._logger.error(f"WebSocket connection error: {e}")
-                    break
+                    return
                 except Exception as e:
                     self._logger.error(f"WebSocket send error: {e}", exc_info=True)
-                    # Don't break here, try to continue sending other messages
-        except Exception as e:
-            self._logger.error(f"WebSocket message queue processing error: {e}", exc_info=True)
+                    # Don't stop here, try to continue sending other messages
+
+    def websocket_clients_route(self):
+        """Per-client queue depth, drops and send lag for outgoing messages, plus inbound dispatch depth"""
+        stats = self.ws_hub.stats()
+        stats["dispatcher"] = self.dispatcher.stats()
+        stats["video_frames"] = self.video_frames.stats()
+        stats["tts_cache"] = self.tts.cache.stats()
+        return jsonify(stats)
 
-    def websocket_listener(self, websocket):
+    async def websocket_listener(self, websocket, session=None):
         try:
-            while True:
+            async for msg in websocket:
+                self._logger.debug(f"Received message from client (len={len(msg)}).")
+                if isinstance(msg, (bytes, bytearray)):
+                    self._on_binary_frame(msg, session)
+                    continue
                 try:
-                    msg = websocket.recv()
-                    self._logger.debug(f"Received message from client (len={len(msg)}).")
-                    try:
-                        data = json.loads(msg)
-                        # Handle heartbeat messages from client
-                        if data.get('type') == 'heartbeat':
-                            self._logger.debug("Received heartbeat from client")
-                            continue
-                            
-                        # If auto_frame flag is present, push frame_data into the frame_queue
-                        if data.get('auto_frame') == True:
-                            frame_data = data.get('frame_data')
-                            if frame_data:
-                                self._logger.debug("Got auto_frame data from client.")
-                                self.frame_queue.put(frame_data)
-                                # Also store it for future use
-                                self.lastProcessedFrame = frame_data
-                            continue
-                        # Also check for 'frame_data' in non-auto messages
-                        frame_data = data.pop('frame_data', None)
-                        if frame_data:
-                            self._logger.debug("Got frame_data from client.")
-                            self.frame_queue.put(frame_data)
-                            # Store the frame for future use
-                            self.lastProcessedFrame = frame_data
-                        if 'user_input' in data and self.msg_callback:
-                            self._logger.debug(f"Sending user_input to msg_callback: {data}")
-                            self.msg_callback(data, 0, int(time.time() * 1000))
-                    except json.JSONDecodeError:
-                        self._logger.warning("Invalid JSON from client.")
-                        continue
-                except websockets.exceptions.ConnectionClosedOK:
-                    self._logger.info("WebSocket connection closed by client (listener)")
-                    break
-                except websockets.exceptions.ConnectionClosedError as e:
-                    self._logger.error(f"WebSocket connection error (listener): {e}")
-                    # Attempt to gracefully clean up the connection
-                    try:
-                        websocket.close()
-                    except:
-                        pass
-                    break
-                except TimeoutError as e:
-                    self._logger.warning(f"WebSocket timeout error: {e}")
-                    # Attempt to gracefully close the connection
-                    try:
-                        websocket.close()
-                    except:
-                        pass
-                    break
-                except Exception as e:
-                    self._logger.error(f"WebSocket receive error: {e}", exc_info=True)
-                    # Log specific details for debugging
-                    if "Bad file descriptor" in str(e):
-                        self._logger.warning("Bad file descriptor error - possible connection timeout")
-                    break
+                    data = json.loads(msg)
+                except json.JSONDecodeError:
+                    self._logger.warning("Invalid JSON from client.")
+                    continue
+                # Handle heartbeat messages from client
+                if data.get('type') == 'heartbeat':
+                    self._logger.debug("Received heartbeat from client")
+                    continue
+
+                # Voice output toggled in the UI: speak answers as they are generated
+                if data.get('type') == 'tts_config':
+                    self.speech.configure(session, data.get('enabled'), data.get('api_key'))
+                    continue
+
+                # Playback position: cut the frame from the uploaded video in the background
+                if data.get('type') == 'playback':
+                    self._request_video_frame(data, exact=False)
+                    continue
+
+                # If auto_frame flag is present, push frame_data into the frame_queue
+                if data.get('auto_frame') == True:
+                    frame_data = data.get('frame_data')
+                    if frame_data:
+                        self._logger.debug("Got auto_frame data from client.")
+                        self.frame_queue.put(frame_data)
+                        # Also store it for future use
+                        self.lastProcessedFrame = frame_data
+                    continue
+                # Also check for 'frame_data' in non-auto messages
+                frame_data = data.pop('frame_data', None)
+                if frame_data:
+                    self._logger.debug("Got frame_data from client.")
+                    self.frame_queue.put(frame_data)
+                    # Store the frame for future use
+                    self.lastProcessedFrame = frame_data
+                # Or the frame at the reported playback position, cut on the server
+                if 'video_position' in data:
+                    future = self._request_video_frame(data, exact=True)
+                    if future is not None:
+                        try:
+                            await asyncio.wrap_future(future)
+                        except Exception:
+                            pass  # logged by the callback; the input goes ahead without a new frame
+                # Or a frame sent just before as a binary message
+                frame_id = data.pop('frame_id', None)
+                if frame_id is not None:
+                    frame = self.frame_store.get(session, frame_id)
+                    if frame:
+                        self.frame_queue.put(frame)
+                        self.lastProcessedFrame = frame
+                    else:
+                        self._logger.warning(f"Client referred to unknown frame {frame_id}")
+                if 'user_input' in data and self.msg_callback:
+                    self._logger.debug(f"Dispatching user_input to msg_callback: {data}")
+                    # Agents block for seconds; queue the input and keep reading
+                    if not self.dispatcher.submit(session, self.msg_callback, data, 0, int(time.time() * 1000)):
+                        self._logger.warning(f"Client {session} has too many pending inputs; dropping: {data.get('user_input')}")
+                        self.send_message(
+                            {"agent_response": "Still working on your earlier requests, please repeat that in a moment."},
+                            session=session,
+                        )
+            self._logger.info("WebSocket connection closed by client (listener)")
+        except websockets.exceptions.ConnectionClosedError as e:
+            self._logger.error(f"WebSocket connection error (listener): {e}")
         except Exception as e:
-            self._logger.error(f"WebSocket listener thread error: {e}", exc_info=True)
-            # Ensure we clean up the websocket
+            self._logger.error(f"WebSocket listener error: {e}", exc_info=True)
+
+    def _request_video_frame(self, data, exact):
+        # Queue the frame at data['video_position'] of data['video_src'] for the agents
+        path = self.video_frames.resolve(data.pop('video_src', None))
+        position = data.pop('video_position', None)
+        if not self.video_frames.available or not path or position is None:
+            return None
+        future = self.video_frames.request_frame(path, position, exact=exact)
+
+        def on_done(done):
             try:
-                websocket.close()
-            except:
-                pass
+                frame = done.result()
+            except Exception as e:
+                self._logger.error(f"Failed to extract frame at {position}s of {path}: {e}")
+                return
+            self._logger.debug(f"Extracted frame at {frame.video_time:.3f}s ({len(frame)} bytes)")
+            self.frame_queue.put(frame)
+            self.lastProcessedFrame = frame
 
-    def on_audio_websocket(self, websocket):
+        future.add_done_callback(on_done)
+        return future
+
+    def _on_binary_frame(self, msg, session):
+        # Header plus raw JPEG bytes; the bytes stay in the received buffer
+        try:
+            frame = parse_frame_message(msg)
+        except ValueError as e:
+            self._logger.warning(f"Invalid binary frame from client: {e}")
+            return
+        self.frame_store.put(session, frame)
+        if frame.message_type == FRAME_TYPE_AUTO:
+            self._logger.debug(f"Got auto frame {frame.frame_id} ({len(frame)} bytes) from client.")
+            self.frame_queue.put(frame)
+            self.lastProcessedFrame = frame
+
+    async def on_audio_websocket(self, websocket):
         self._logger.info("Audio websocket connected (one-shot).")
+        # The transcript goes back only to the client that recorded it: it
+        # answers with a user input, which must not be run once per client
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(websocket.request.path).query)
+        try:
+            session = int(query.get('session', [''])[0])
+        except ValueError:
+            session = None
         audio_data = bytearray()
         try:
-            while True:
-                try:
-                    chunk = websocket.recv()
-                    if isinstance(chunk, bytes):
-                        audio_data.extend(chunk)
-                    else:
-                        break
-                except websockets.exceptions.ConnectionClosedOK:
-                    self._logger.info("Audio websocket connection closed normally by client.")
-                    break
-                except websockets.exceptions.ConnectionClosedError as e:
-                    self._logger.warning(f"Audio websocket connection closed with error: {e}")
-                    # Attempt to gracefully clean up
-                    try:
-                        websocket.close()
-                    except:
-                        pass
-                    break
-                except TimeoutError as e:
-                    self._logger.warning(f"Audio WebSocket timeout error: {e}")
-                    # Attempt to gracefully close the connection
-                    try:
-                        websocket.close()
-                    except:
-                        pass
-                    break
-                except Exception as e:
-                    self._logger.error(f"Error receiving audio data: {e}", exc_info=True)
-                    if "Bad file descriptor" in str(e):
-                        self._logger.warning("Bad file descriptor error in audio socket - possible connection timeout")
+            async for chunk in websocket:
+                if isinstance(chunk, bytes):
+                    audio_data.extend(chunk)
+                else:
                     break
+        except websockets.exceptions.ConnectionClosedError as e:
+            self._logger.warning(f"Audio websocket connection closed with error: {e}")
         except Exception as e:
             self._logger.error(f"Audio websocket processing error: {e}", exc_info=True)
-            # Clean up
-            try:
-                websocket.close()
-            except:
-                pass
-        
+
         if len(audio_data) > 0:
+            # Whisper is reached over a blocking socket
+            await self.ws_servers.run_blocking(self._transcribe_audio, audio_data, session)
+        else:
+            self._logger.debug("No audio data received from client.")
+
+    def _transcribe_audio(self, audio_data, session):
+        with self._whisper_lock:
             try:
                 self._logger.debug(f"Forwarding final chunk of size {len(audio_data)} bytes to whisper server")
                 self.whisper_socket.sendall(audio_data)
@@ -370,7 +562,9 @@ class Webserver(threading.Thread):
                     recognized_text = self.read_whisper_result()
                     self._logger.debug(f"Got recognized_text from whisper: {recognized_text}")
                     
-                    if recognized_text.strip():
+                    if recognized_text.strip() and session is None:
+                        self._logger.warning("Transcript from a client without a session id; not delivered")
+                    elif recognized_text.strip():
                         self._logger.debug("Requesting a frame from browser for final transcript.")
                         # Also directly add the user message to the UI
                         self.send_message({
@@ -378,7 +572,7 @@ class Webserver(threading.Thread):
                             "recognized_text": recognized_text,
                             "user_input": recognized_text,
                             "asr_final": True
-                        })
+                        }, session=session)
                     else:
                         self._logger.debug("No recognized text found from whisper.")
                 except Exception as e:
@@ -398,8 +592,6 @@ class Webserver(threading.Thread):
                     threading.Thread(target=self.delayed_socket_recreation, daemon=True).start()
             except Exception as e:
                 self._logger.error(f"Error processing audio data: {e}", exc_info=True)
-        else:
-            self._logger.debug("No audio data received from client.")
 
     def read_whisper_result(self):
         result_buffer = b""
@@ -436,43 +628,72 @@ class Webserver(threading.Thread):
             return ""
     
     def tts_route(self):
-        data = request.json
+        """
+        Speak `text`. With `stream: true` the audio is streamed back as the
+        backend produces it; otherwise it is returned base64-encoded in JSON.
+        Either way repeated phrases come from the cache.
+        """
+        data = request.get_json(silent=True) or {}
         text = data.get('text', '').strip()
-        api_key = data.get('api_key', None)
         if not text:
             return jsonify({"error": "No text provided"}), 400
-        if not api_key:
-            return jsonify({"error": "No API key provided"}), 400
-        voice_id = "TX3LPaxmHKxFdv7VOQHJ"
-        model_id = "eleven_multilingual_v2"
-        url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}"
-        headers = {
-            "xi-api-key": api_key,
-            "Content-Type": "application/json"
-        }
-        payload = {
-            "text": text,        
-            "model_id": model_id,
-            "voice_settings": {
-                "stability": 0.5,
-                "similarity_boost": 0.5
-            }
-        }
         try:
-            r = requests.post(url, headers=headers, json=payload, timeout=15)
-            if r.status_code != 200:
-                return jsonify({"error": f"ElevenLabs API error {r.status_code}: {r.text[:500]}"}), 400
-            audio_base64 = base64.b64encode(r.content).decode('utf-8')
-            return jsonify({"tts_base64": audio_base64})
+            key, cached, chunks = self.tts.stream(text, data.get('api_key'))
+        except TTSError as e:
+            return jsonify({"error": str(e)}), e.status
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+        headers = {"X-TTS-Cache": "hit" if cached else "miss", "X-TTS-Key": key}
+        if data.get('stream'):
+            return flask.Response(chunks, mimetype=self.tts.media_type, headers=headers)
+        try:
+            audio_base64 = base64.b64encode(b"".join(chunks)).decode('utf-8')
         except Exception as e:
             return jsonify({"error": str(e)}), 500
+        return jsonify({"tts_base64": audio_base64, "media_type": self.tts.media_type}), 200, headers
+
+    def tts_audio_route(self, key):
+        """Cached audio by key; the key covers text, voice and model, so it never changes"""
+        path = self.tts.cache.path(key)
+        if not path:
+            return jsonify({"error": "Unknown audio"}), 404
+        response = flask.send_file(
+            path, mimetype=self.tts.media_type, conditional=True, etag=key, max_age=IMMUTABLE_MAX_AGE
+        )
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+    def _on_speech_audio(self, sessions, utterance, index, key):
+        payload = {
+            "tts_audio": {
+                "url": f"/api/tts/audio/{key}",
+                "utterance": utterance,
+                "index": index,
+                "media_type": self.tts.media_type
+            }
+        }
+        # Only the clients that turned voice output on
+        for session in sessions:
+            self.send_message(payload, session=session)
 
-    def send_message(self, payload):
+    def send_message(self, payload, coalesce_key=None, droppable=False, session=None):
+        """
+        Broadcast `payload` to all connected clients, or with `session` send
+        it only to that client (replies such as a transcript it must act on).
+        A message with a `coalesce_key` replaces one with the same key still
+        waiting for a slow client; `droppable` messages (e.g. intermediate
+        annotations) are shed first when a client falls too far behind.
+        """
         try:
             if not isinstance(payload, str):
                 payload = json.dumps(payload)
-            self._logger.debug(f"Queueing message for client: {payload}")
-            self.ws_queue.put(payload)
+            self._logger.debug(f"Queueing message for clients: {payload}")
+            if session is None:
+                self.ws_hub.publish(payload, key=coalesce_key, droppable=droppable)
+            elif not self.ws_hub.send(session, payload, key=coalesce_key, droppable=droppable):
+                self._logger.warning(f"Client {session} disconnected; message not delivered")
         except Exception as e:
             self._logger.error(f"Error queueing message for client: {e}", exc_info=True)
 
@@ -486,70 +707,39 @@ class Webserver(threading.Thread):
             # Check if we have direct data from the frontend
             data = request.json
             self._logger.debug(f"Received post-op note request: {data}")
-            
-            if data and 'notes' in data and 'annotations' in data:
-                self._logger.info("Using frontend-provided data for post-op note generation")
-                
-                # Create a temporary folder for this data
-                import datetime
-                import tempfile
-                temp_dir = tempfile.mkdtemp(prefix="temp_procedure_")
-                
-                # Save the annotation data
-                annotation_json = os.path.join(temp_dir, "annotation.json")
-                with open(annotation_json, 'w') as f:
-                    json.dump(data['annotations'], f, indent=2)
-                
-                # Save the notes data
-                notes_json = os.path.join(temp_dir, "notetaker_notes.json")
-                with open(notes_json, 'w') as f:
-                    json.dump(data['notes'], f, indent=2)
-                
-                procedure_folder = temp_dir
-                self._logger.info(f"Created temporary procedure folder: {procedure_folder}")
-                
-                # If we have frontend data but it's empty, return a basic note
-                if not data['notes'] and not data['annotations']:
-                    basic_note = {
-                        "procedure_information": {
-                            "procedure_type": "Unknown procedure",
-                            "date": datetime.datetime.now().strftime("%Y-%m-%d"),
-                            "duration": data.get('video_duration', 'Unknown'),
-                            "surgeon": "Not specified"
-                        },
-                        "findings": ["No findings recorded"],
-                        "procedure_timeline": [],
-                        "complications": []
-                    }
-                    return jsonify({
-                        "success": True, 
-                        "post_op_note": basic_note
-                    })
-                
-            else:
-                # No frontend data, look for annotations directory
-                self._logger.info("No frontend data, using stored annotations")
-                annotations_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'annotations')
-                os.makedirs(annotations_dir, exist_ok=True)
-                
-                # Find the most recent procedure folder
-                procedure_folders = []
-                for folder in os.listdir(annotations_dir):
-                    if folder.startswith('procedure_'):
-                        folder_path = os.path.join(annotations_dir, folder)
-                        if os.path.isdir(folder_path):
-                            procedure_folders.append(folder_path)
-                
-                if not procedure_folders:
-                    self._logger.warning("No procedure annotations found")
-                    return jsonify({"error": "No procedure annotations found"}), 404
-                    
-                # Get the most recent folder by modification time
-                procedure_folder = max(procedure_folders, key=os.path.getmtime)
-            
-            # Generate the post-op note using the agent
-            self._logger.info(f"Generating post-op note from folder: {procedure_folder}")
-            post_op_note = self.post_op_note_agent.generate_post_op_note(procedure_folder)
+
+            # If we have frontend data but it's empty, return a basic note
+            if data and 'notes' in data and 'annotations' in data and not data['notes'] and not data['annotations']:
+                basic_note = fallback_post_op_note(
+                    "No findings recorded", procedure_type="Unknown procedure",
+                    duration=data.get('video_duration', 'Unknown'),
+                )
+                return jsonify({
+                    "success": True, 
+                    "post_op_note": basic_note
+                })
+
+            # Stream the note section by section if the client asked for it
+            if data and data.get('stream'):
+                if 'notes' in data and 'annotations' in data:
+                    self._logger.info("Streaming post-op note sections from frontend-provided data")
+                    return self._stream_post_op_note(
+                        None, data.get('video_duration'),
+                        annotations=data['annotations'], notes=data['notes'],
+                    )
+                procedure_folder, error_response = self._request_procedure_folder(data)
+                if error_response:
+                    return error_response
+                self._logger.info(f"Streaming post-op note sections from folder: {procedure_folder}")
+                return self._stream_post_op_note(procedure_folder, data.get('video_duration'))
+
+            # Generate through the job pool so concurrent retries share one run
+            # and repeated requests for unchanged data are served from cache
+            job, error_response = self._submit_post_op_note_job(data)
+            if error_response:
+                return error_response
+            job = self.post_op_note_jobs.wait(job["job_id"])
+            post_op_note = job.get("result") if job else None
             
             if post_op_note:
                 return jsonify({
@@ -559,17 +749,10 @@ class Webserver(threading.Thread):
             else:
                 self._logger.error("Post-op note agent returned empty result")
                 # Return a basic note structure instead of error
-                basic_note = {
-                    "procedure_information": {
-                        "procedure_type": "Laparoscopic procedure",
-                        "date": datetime.datetime.now().strftime("%Y-%m-%d"),
-                        "duration": data.get('video_duration', 'Unknown') if data else 'Unknown',
-                        "surgeon": "Not specified"
-                    },
-                    "findings": ["Insufficient data for detailed findings"],
-                    "procedure_timeline": [],
-                    "complications": []
-                }
+                basic_note = fallback_post_op_note(
+                    "Insufficient data for detailed findings", procedure_type="Laparoscopic procedure",
+                    duration=data.get('video_duration', 'Unknown') if data else 'Unknown',
+                )
                 return jsonify({
                     "success": True, 
                     "post_op_note": basic_note
@@ -578,7 +761,170 @@ class Webserver(threading.Thread):
         except Exception as e:
             self._logger.error(f"Error generating post-op note: {e}", exc_info=True)
             return jsonify({"error": str(e)}), 500
-    
+
+    def submit_post_op_note_job_route(self):
+        """Start post-op note generation in the background and return a job id"""
+        if not self.post_op_note_agent:
+            self._logger.error("Post-op note agent not initialized")
+            return jsonify({"error": "Post-op note agent not initialized"}), 500
+        try:
+            job, error_response = self._submit_post_op_note_job(request.get_json(silent=True))
+            if error_response:
+                return error_response
+            return jsonify(self._post_op_job_payload(job)), 202
+        except Exception as e:
+            self._logger.error(f"Error submitting post-op note job: {e}", exc_info=True)
+            return jsonify({"error": str(e)}), 500
+
+    def post_op_note_job_route(self, job_id):
+        """Report the status (and, once done, the result) of a post-op note job"""
+        job = self.post_op_note_jobs.get(job_id)
+        if not job:
+            return jsonify({"error": "Unknown job id"}), 404
+        payload = self._post_op_job_payload(job)
+        if job["status"] in ("done", "failed"):
+            # A finished job never changes; polls after the result arrived are 304s
+            return cached_json(payload, etag=f"{job_id}-{job['status']}", max_age=3600)
+        return cached_json(payload, etag=f"{job_id}-{job['status']}-{job['stage']}")
+
+    def _submit_post_op_note_job(self, data):
+        """
+        Queue a post-op note job keyed by its inputs: the frontend-provided data,
+        or the procedure folder named by `procedure_id` (default: the current
+        procedure) and the state of its data files.
+        Returns (job, None) or (None, error_response).
+        """
+        if data and 'notes' in data and 'annotations' in data:
+            self._logger.info("Using frontend-provided data for post-op note generation")
+            key = "data:" + hashlib.sha256(
+                json.dumps([data['annotations'], data['notes']], sort_keys=True).encode('utf-8')
+            ).hexdigest()
+            procedure_folder = None
+            annotations, notes = data['annotations'], data['notes']
+        else:
+            procedure_folder, error_response = self._request_procedure_folder(data)
+            if error_response:
+                return None, error_response
+            key = f"folder:{procedure_folder}:{self._procedure_fingerprint(procedure_folder)}"
+            annotations = notes = None
+
+        def run(progress):
+            # Frontend data is handed over in memory; nothing is written to disk
+            note = self.post_op_note_agent.generate_post_op_note(
+                procedure_folder, progress_callback=progress, annotations=annotations, notes=notes
+            )
+            if note is None:
+                raise RuntimeError("Post-op note agent returned empty result")
+            return note
+
+        return self.post_op_note_jobs.submit(key, run), None
+
+    def register_procedure(self, procedure_id, procedure_folder):
+        """Register a live procedure's data folder and make it the default for requests."""
+        self.procedures[procedure_id] = procedure_folder
+        self.current_procedure_id = procedure_id
+        self._logger.info(f"Registered procedure {procedure_id} at {procedure_folder}")
+
+    def procedure_folder(self, procedure_id=None):
+        """Data folder for `procedure_id` (default: the current procedure), or None if unknown."""
+        procedure_id = procedure_id or self.current_procedure_id
+        if not procedure_id:
+            return None
+        if procedure_id in self.procedures:
+            return self.procedures[procedure_id]
+        # Past procedures are looked up on disk; ids are timestamps, nothing else
+        if not re.fullmatch(r"[0-9_]+", procedure_id):
+            return None
+        annotations_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'annotations')
+        folder = os.path.join(annotations_dir, f"procedure_{procedure_id}")
+        return folder if os.path.isdir(folder) else None
+
+    def _request_procedure_folder(self, data):
+        """
+        Folder for the procedure a request names, else the current procedure,
+        else the most recent one on disk. Returns (folder, None) or (None, error_response).
+        """
+        procedure_id = (data or {}).get('procedure_id')
+        folder = self.procedure_folder(procedure_id)
+        if folder:
+            return folder, None
+        if procedure_id:
+            self._logger.warning(f"Unknown procedure requested: {procedure_id}")
+            return None, (jsonify({"error": f"Unknown procedure: {procedure_id}"}), 404)
+        return self._latest_procedure_folder()
+
+    def _latest_procedure_folder(self):
+        """
+        Most recent stored procedure folder, holding annotation.json and
+        notetaker_notes.json. Returns (folder, None) or (None, error_response).
+        """
+        # No frontend data, look for annotations directory
+        self._logger.info("No frontend data, using stored annotations")
+        annotations_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'annotations')
+        os.makedirs(annotations_dir, exist_ok=True)
+
+        # Find the most recent procedure folder
+        procedure_folders = []
+        for folder in os.listdir(annotations_dir):
+            if folder.startswith('procedure_'):
+                folder_path = os.path.join(annotations_dir, folder)
+                if os.path.isdir(folder_path):
+                    procedure_folders.append(folder_path)
+
+        if not procedure_folders:
+            self._logger.warning("No procedure annotations found")
+            return None, (jsonify({"error": "No procedure annotations found"}), 404)
+
+        # Get the most recent folder by modification time
+        return max(procedure_folders, key=os.path.getmtime), None
+
+    def _procedure_fingerprint(self, procedure_folder):
+        """Size and mtime of the procedure's data files, so cached notes expire when they change"""
+        parts = []
+        for name in ("annotation.json", "notetaker_notes.json"):
+            try:
+                st = os.stat(os.path.join(procedure_folder, name))
+                parts.append(f"{st.st_size}-{st.st_mtime_ns}")
+            except OSError:
+                parts.append("missing")
+        return ":".join(parts)
+
+    def _post_op_job_payload(self, job):
+        payload = {
+            "job_id": job["job_id"],
+            "status": job["status"],
+            "stage": job["stage"],
+        }
+        if job["status"] == "done":
+            payload["post_op_note"] = job["result"]
+        elif job["status"] == "failed":
+            payload["error"] = job["error"]
+        return payload
+
+    def _on_post_op_job_update(self, job):
+        # Push progress to the UI over the WebSocket
+        # Only the latest state of a job matters to a client that is behind
+        self.send_message({"post_op_job": self._post_op_job_payload(job)},
+                          coalesce_key=f"post_op_job:{job['job_id']}")
+
+    def _stream_post_op_note(self, procedure_folder, video_duration=None, annotations=None, notes=None):
+        """Stream the post-op note as newline-delimited JSON, one line per section"""
+        def generate():
+            note = {}
+            try:
+                sections = self.post_op_note_agent.iter_post_op_note_sections(
+                    procedure_folder, video_duration, annotations=annotations, notes=notes
+                )
+                for section, content in sections:
+                    note[section] = content
+                    yield json.dumps({"section": section, "content": content}) + "\n"
+                yield json.dumps({"done": True, "post_op_note": note}) + "\n"
+            except Exception as e:
+                self._logger.error(f"Error streaming post-op note: {e}", exc_info=True)
+                yield json.dumps({"error": str(e)}) + "\n"
+
+        return flask.Response(flask.stream_with_context(generate()), mimetype='application/x-ndjson')
+
     def format_post_op_note_html(self, post_op_note):
         """Format the post-op note JSON into HTML for display"""
         try:
@@ -686,11 +1032,15 @@ class Webserver(threading.Thread):
             """
     
     def run(self):
-        self.ws_thread.start()
-        self.audio_ws_thread.start()
+        self.ws_servers.start()
         self._logger.info(f"Starting Flask app on {self.host}:{self.port}")
         self.app.run(host=self.host, port=self.port, debug=False, use_reloader=False)
 
+    def shutdown(self):
+        """Close WebSocket clients with a going-away frame and stop the event loop."""
+        self.ws_servers.stop()
+        self.dispatcher.shutdown()
+
 
 if __name__ == "__main__":
     import argparse
@@ -699,13 +1049,17 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Start the web server')
     parser.add_argument('--host', type=str, default='0.0.0.0', help='Host to listen on')
     parser.add_argument('--port', type=int, default=8050, help='Port to listen on')
+    parser.add_argument('--tts-backend', choices=['elevenlabs', 'local'], default='elevenlabs',
+                        help='Speech synthesis backend (local: offline stand-in tone)')
     args = parser.parse_args()
     
     print(f"Starting web server on {args.host}:{args.port}...")
-    server = Webserver(web_server=args.host, web_port=args.port)
+    server = Webserver(web_server=args.host, web_port=args.port,
+                       tts_backend=LocalBackend() if args.tts_backend == 'local' else None)
     server.start()
     try:
         server.join()
     except KeyboardInterrupt:
         print("\nShutdown requested... exiting")
+        server.shutdown()
         sys.exit(0)
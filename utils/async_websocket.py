@@ -0,0 +1,97 @@
+# Copyright (c) MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from websockets.asyncio.server import serve
+
+class AsyncWebSocketServers:
+    """
+    Hosts several asyncio WebSocket servers on one event loop running in a
+    background thread, so connections cost coroutines rather than threads.
+    Handlers are coroutines; blocking work (LLM calls, socket I/O to other
+    services) goes through `run_blocking`, which uses a bounded thread pool.
+    """
+
+    def __init__(self, max_blocking_workers=8):
+        self._logger = logging.getLogger(__name__)
+        self._specs = []
+        self._servers = []
+        self._loop = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=max_blocking_workers, thread_name_prefix="ws-blocking")
+
+    @property
+    def loop(self):
+        return self._loop
+
+    def add(self, handler, host, port, **kwargs):
+        """Register `handler(connection)`; extra kwargs go to websockets' `serve`."""
+        self._specs.append((handler, host, port, kwargs))
+
+    def start(self, timeout=10):
+        if self._thread and self._thread.is_alive():
+            return
+        self._ready.clear()
+        self._thread = threading.Thread(target=self._run, name="websocket-loop", daemon=True)
+        self._thread.start()
+        if not self._ready.wait(timeout):
+            raise RuntimeError("WebSocket event loop did not start")
+
+    def stop(self, timeout=5):
+        """Close the listeners, send close frames to connected clients and stop the loop."""
+        if not self._loop or not self._loop.is_running():
+            return
+        future = asyncio.run_coroutine_threadsafe(self._close_servers(), self._loop)
+        try:
+            future.result(timeout)
+        except Exception as e:
+            self._logger.warning(f"WebSocket servers did not close cleanly: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+        self._executor.shutdown(wait=False)
+
+    async def run_blocking(self, fn, *args):
+        """Run a blocking call off the event loop and await its result."""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._open_servers())
+        except Exception as e:
+            self._logger.error(f"Failed to start WebSocket servers: {e}", exc_info=True)
+            self._ready.set()
+            return
+        self._ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._loop.close()
+
+    async def _open_servers(self):
+        for handler, host, port, kwargs in self._specs:
+            server = await serve(handler, host, port, **kwargs)
+            self._servers.append(server)
+            self._logger.info(f"WebSocket server listening on {host}:{port}")
+
+    async def _close_servers(self):
+        for server in self._servers:
+            # Stops accepting and closes open connections with 1001 (going away)
+            server.close(close_connections=True)
+        for server in self._servers:
+            await server.wait_closed()
+        self._servers = []
@@ -0,0 +1,213 @@
+# Copyright (c) MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+
+class _Entry:
+    __slots__ = ("payload", "key", "droppable", "enqueued")
+
+    def __init__(self, payload, key, droppable, enqueued):
+        self.payload = payload
+        self.key = key
+        self.droppable = droppable
+        self.enqueued = enqueued
+
+class Subscriber:
+    """
+    One client's outgoing queue. Bounded: when full, the oldest droppable
+    message goes first, then the oldest of any kind. A message published with
+    a key replaces a still-queued message with the same key instead of
+    queueing behind it, so a lagging client only sees the latest state.
+    """
+
+    def __init__(self, subscriber_id, name, max_queue, batch_max, batch_window):
+        self.id = subscriber_id
+        self.name = name
+        self.max_queue = max_queue
+        self.batch_max = batch_max
+        self.batch_window = batch_window
+        self._lock = threading.Lock()
+        self._items = deque()
+        self._keyed = {}
+        self._closed = False
+        self._notifier = None
+        self._stats = {
+            "connected": time.time(),
+            "sent": 0,
+            "batches": 0,
+            "dropped": 0,
+            "coalesced": 0,
+            "max_queued": 0,
+            "last_lag_ms": 0.0,
+            "max_lag_ms": 0.0,
+            "total_lag_ms": 0.0,
+        }
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+        self._notify()
+
+    def offer(self, payload, key=None, droppable=False):
+        with self._lock:
+            if self._closed:
+                return
+            if key is not None and key in self._keyed:
+                # Keep the original position and enqueue time; only the content is stale
+                self._keyed[key].payload = payload
+                self._stats["coalesced"] += 1
+                return
+            if len(self._items) >= self.max_queue:
+                self._evict_one()
+            entry = _Entry(payload, key, droppable, time.time())
+            self._items.append(entry)
+            if key is not None:
+                self._keyed[key] = entry
+            self._stats["max_queued"] = max(self._stats["max_queued"], len(self._items))
+        self._notify()
+
+    def set_notifier(self, callback):
+        """
+        `callback()` is called (from the publishing thread) whenever a message
+        is queued or the subscriber is closed, so an event loop can wake up.
+        """
+        self._notifier = callback
+
+    def pending(self):
+        with self._lock:
+            return len(self._items)
+
+    def take_batch(self):
+        """
+        Return up to `batch_max` queued messages without blocking; [] if none
+        are queued, None once the subscriber is closed.
+        """
+        with self._lock:
+            if self._closed:
+                return None
+            now = time.time()
+            batch = []
+            while self._items and len(batch) < self.batch_max:
+                entry = self._items.popleft()
+                if entry.key is not None:
+                    self._keyed.pop(entry.key, None)
+                batch.append(entry.payload)
+                lag_ms = (now - entry.enqueued) * 1000
+                self._stats["last_lag_ms"] = lag_ms
+                self._stats["max_lag_ms"] = max(self._stats["max_lag_ms"], lag_ms)
+                self._stats["total_lag_ms"] += lag_ms
+            if batch:
+                self._stats["sent"] += len(batch)
+                self._stats["batches"] += 1
+            return batch
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["queued"] = len(self._items)
+        total_lag = stats.pop("total_lag_ms")
+        stats["mean_lag_ms"] = round(total_lag / stats["sent"], 2) if stats["sent"] else 0.0
+        stats["last_lag_ms"] = round(stats["last_lag_ms"], 2)
+        stats["max_lag_ms"] = round(stats["max_lag_ms"], 2)
+        stats["id"] = self.id
+        stats["name"] = self.name
+        return stats
+
+    def _notify(self):
+        notifier = self._notifier
+        if notifier is not None:
+            try:
+                notifier()
+            except Exception:
+                # The consumer's event loop may already be gone
+                pass
+
+    def _evict_one(self):
+        victim = next((entry for entry in self._items if entry.droppable), None)
+        if victim is None:
+            victim = self._items[0]
+        self._items.remove(victim)
+        if victim.key is not None:
+            self._keyed.pop(victim.key, None)
+        self._stats["dropped"] += 1
+
+class BroadcastHub:
+    """
+    Fans each published message out to every subscriber's own bounded queue,
+    so every connected client receives every message and a slow client only
+    delays itself.
+    """
+
+    def __init__(self, max_queue=256, batch_max=32, batch_window=0.01):
+        self._logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._ids = itertools.count(1)
+        self.max_queue = max_queue
+        self.batch_max = batch_max
+        self.batch_window = batch_window
+        self.published = 0
+
+    def subscribe(self, name=None):
+        subscriber = Subscriber(next(self._ids), name, self.max_queue, self.batch_max, self.batch_window)
+        with self._lock:
+            self._subscribers[subscriber.id] = subscriber
+        self._logger.info(f"WebSocket client {subscriber.id} ({name}) subscribed")
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        subscriber.close()
+        with self._lock:
+            removed = self._subscribers.pop(subscriber.id, None)
+        if removed is not None:
+            self._logger.info(f"WebSocket client {subscriber.id} unsubscribed; stats: {subscriber.stats()}")
+
+    def publish(self, payload, key=None, droppable=False):
+        """
+        Queue `payload` (an encoded message) for every subscriber. `key`
+        coalesces with a queued message carrying the same key; `droppable`
+        messages are the first to go when a client's queue is full.
+        """
+        with self._lock:
+            subscribers = list(self._subscribers.values())
+            self.published += 1
+        for subscriber in subscribers:
+            subscriber.offer(payload, key=key, droppable=droppable)
+        return len(subscribers)
+
+    def send(self, subscriber_id, payload, key=None, droppable=False):
+        """
+        Queue `payload` for one subscriber only, for replies meant for the
+        client that caused them. Returns False if it is no longer connected.
+        """
+        with self._lock:
+            subscriber = self._subscribers.get(subscriber_id)
+        if subscriber is None:
+            return False
+        subscriber.offer(payload, key=key, droppable=droppable)
+        return True
+
+    def stats(self):
+        with self._lock:
+            subscribers = list(self._subscribers.values())
+            published = self.published
+        return {
+            "published": published,
+            "clients": [subscriber.stats() for subscriber in subscribers],
+        }
@@ -9,40 +9,116 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
+import logging
+import threading
+from collections import Counter, deque
+from collections.abc import Sequence
+
 class ChatHistory:
-    def __init__(self):
-        # Each entry in history: (user_message, agent_message) tuple
-        self.history = []
+    """
+    Conversation turns as (user_message, agent_message) pairs.
+
+    Only the most recent `max_turns` turns are kept in memory; older turns are
+    appended to `spill_path` (JSON lines) if one is given, otherwise dropped.
+    Membership checks use a hash index, token counts are computed once per
+    message, and `view()`/`tail()` give read-only access without copying.
+
+    Turns are addressed by absolute index (position since the session began),
+    which stays stable as old turns are evicted. A summary of the turns before
+    some absolute index can be attached with `set_summary`; views report it so
+    prompts can use the summary in place of those turns.
+    """
+
+    def __init__(self, max_turns=200, spill_path=None, token_counter=None):
+        self._logger = logging.getLogger(__name__)
+        self._lock = threading.RLock()
+        self.max_turns = max_turns
+        self.spill_path = spill_path
+        self.token_counter = token_counter
+        # Each entry: [user_msg, agent_msg, user_tokens, agent_tokens]; token
+        # counts stay None until first requested
+        self._turns = deque()
+        self._evicted = 0  # turns dropped from the front so far; gives stable absolute indices
+        self._user_index = Counter()
+        self._summary = ""
+        self._summary_upto = 0  # absolute index of the first turn not covered by the summary
+
+    def __len__(self):
+        return len(self._turns)
 
     def add_user_message(self, user_msg):
-        self.history.append((user_msg, None))
+        with self._lock:
+            self._append([user_msg, None, None, None])
 
     def add_bot_message(self, bot_msg):
-        if not self.history:
-            # If there's no user message yet, just add a None for user.
-            self.history.append((None, bot_msg))
-        else:
-            # Add bot msg to the last user-bot pair if bot is currently None
-            last_user, last_bot = self.history[-1]
-            if last_bot is None:
-                self.history[-1] = (last_user, bot_msg)
+        with self._lock:
+            if self._turns and self._turns[-1][1] is None:
+                # Add bot msg to the last user-bot pair if bot is currently None
+                self._turns[-1][1] = bot_msg
+                self._turns[-1][3] = None
             else:
-                # If last entry is already complete, start a new one.
-                self.history.append((None, bot_msg))
+                # No open user message: start a new entry with None for user.
+                self._append([None, bot_msg, None, None])
 
     def to_list(self):
-        # return a copy of the conversation as a list of [user_msg, bot_msg]
-        return [[u, b] for (u,b) in self.history]
+        # return a copy of the conversation as a list of [user_msg, bot_msg];
+        # prefer view() or tail(), which do not copy
+        with self._lock:
+            return [[turn[0], turn[1]] for turn in self._turns]
+
+    def view(self):
+        """Read-only view of the turns currently held, without copying them."""
+        with self._lock:
+            return ChatHistoryView(self, self._evicted, self._evicted + len(self._turns))
+
+    def tail(self, n):
+        """Read-only view of the last `n` turns."""
+        with self._lock:
+            stop = self._evicted + len(self._turns)
+            return ChatHistoryView(self, max(self._evicted, stop - n), stop)
 
     def reset(self):
-        self.history = []
-        
+        with self._lock:
+            self._evicted += len(self._turns)
+            self._turns.clear()
+            self._user_index.clear()
+            self._summary = ""
+            self._summary_upto = self._evicted
+
+    def end_index(self):
+        """Absolute index one past the newest turn."""
+        with self._lock:
+            return self._evicted + len(self._turns)
+
+    def turns_between(self, start, stop):
+        """Completed (user_msg, bot_msg) turns in [start, stop) that are still in memory."""
+        with self._lock:
+            first = max(start, self._evicted)
+            return [self._get(i) for i in range(first, min(stop, self.end_index()))]
+
+    def summary_state(self):
+        """(summary_text, upto): the summary covers the turns before absolute index `upto`."""
+        with self._lock:
+            return self._summary, self._summary_upto
+
+    def set_summary(self, text, upto, expected_upto=None):
+        """
+        Attach a summary of the turns before absolute index `upto`. If
+        `expected_upto` is given the update only applies when the current
+        summary still ends there, so a reset in between is not overwritten.
+        """
+        with self._lock:
+            if expected_upto is not None and self._summary_upto != expected_upto:
+                return False
+            self._summary = text
+            self._summary_upto = upto
+            return True
+
     def has_message(self, message):
         """Check if a message already exists in the chat history"""
-        for user_msg, _ in self.history:
-            if user_msg == message:
-                return True
-        return False
+        with self._lock:
+            return self._user_index[message] > 0
 
     def update_chat_history(self, is_done, agent_response, prompt_complete, asr_text):
         if prompt_complete:
@@ -51,3 +127,96 @@ class ChatHistory:
         if is_done and agent_response:
             # LLM finished responding
             self.add_bot_message(agent_response)
+
+    def _append(self, turn):
+        if self.max_turns and len(self._turns) >= self.max_turns:
+            old = self._turns.popleft()
+            self._evicted += 1
+            if old[0] is not None:
+                self._user_index[old[0]] -= 1
+                if self._user_index[old[0]] <= 0:
+                    del self._user_index[old[0]]
+            self._spill(old)
+        self._turns.append(turn)
+        if turn[0] is not None:
+            self._user_index[turn[0]] += 1
+
+    def _spill(self, turn):
+        if not self.spill_path:
+            return
+        try:
+            with open(self.spill_path, "a") as f:
+                f.write(json.dumps({"user": turn[0], "agent": turn[1]}) + "\n")
+        except Exception as e:
+            self._logger.error(f"Failed to spill chat turn to {self.spill_path}: {e}")
+
+    def _get(self, absolute_index):
+        with self._lock:
+            position = absolute_index - self._evicted
+            if position < 0 or position >= len(self._turns):
+                raise LookupError(f"chat turn {absolute_index} is no longer in memory")
+            turn = self._turns[position]
+            return turn[0], turn[1]
+
+    def _tokens(self, absolute_index):
+        with self._lock:
+            position = absolute_index - self._evicted
+            if position < 0 or position >= len(self._turns):
+                raise LookupError(f"chat turn {absolute_index} is no longer in memory")
+            turn = self._turns[position]
+            if self.token_counter is None:
+                return None, None
+            for slot in (0, 1):
+                if turn[slot + 2] is None and turn[slot] is not None:
+                    turn[slot + 2] = self.token_counter(turn[slot])
+            return turn[2], turn[3]
+
+class ChatHistoryView(Sequence):
+    """
+    Read-only window onto a ChatHistory. Items are (user_msg, bot_msg) tuples.
+    A view keeps pointing at the same turns as new ones are added; slicing
+    with a step of 1 returns another view. Indexing a turn that has since been
+    evicted raises LookupError.
+    """
+
+    def __init__(self, history, start, stop):
+        self._history = history
+        self._start = start
+        self._stop = stop
+
+    def __len__(self):
+        return self._stop - self._start
+
+    def __iter__(self):
+        # Turns evicted from memory since the view was taken are skipped
+        for absolute_index in range(max(self._start, self._history._evicted), self._stop):
+            try:
+                yield self._history._get(absolute_index)
+            except LookupError:
+                continue
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step == 1:
+                return ChatHistoryView(self._history, self._start + start, self._start + max(start, stop))
+            return [self[i] for i in range(start, stop, step)]
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("chat history view index out of range")
+        return self._history._get(self._start + index)
+
+    def summary(self):
+        """
+        (summary_text, covered): the history's summary of older turns and how
+        many of this view's leading turns it already covers.
+        """
+        text, upto = self._history.summary_state()
+        return text, min(max(upto - self._start, 0), len(self))
+
+    def message_tokens(self, index):
+        """Cached (user_tokens, bot_tokens) for a turn; (None, None) without a token counter."""
+        if index < 0:
+            index += len(self)
+        return self._history._tokens(self._start + index)
@@ -0,0 +1,258 @@
+# Copyright (c) MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+
+class UploadError(Exception):
+    """An upload request that cannot be applied; `status` is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+class UploadManager:
+    """
+    Resumable uploads into `target_dir`. A client creates an upload, sends
+    the file in chunks at increasing offsets (resending from the offset the
+    server reports after an interruption), then completes it.
+
+    Chunks are streamed to a `.part` file in `block_size` blocks while a
+    SHA-256 of the content is updated, so memory stays bounded and the file
+    is never read back. On completion, content already stored under another
+    name is not stored again: the existing file is returned instead.
+    Upload state survives a server restart; the hash is then rebuilt once
+    from the part file.
+    """
+
+    def __init__(self, target_dir, block_size=1024 * 1024, on_complete=None):
+        self._logger = logging.getLogger(__name__)
+        self.target_dir = target_dir
+        self.block_size = block_size
+        self.on_complete = on_complete
+        self._state_dir = os.path.join(target_dir, ".uploads")
+        os.makedirs(self._state_dir, exist_ok=True)
+        self._hashes_path = os.path.join(self._state_dir, "hashes.json")
+        self._lock = threading.Lock()
+        self._uploads = {}   # upload_id -> state
+        self._hashers = {}   # upload_id -> running sha256
+        self._upload_locks = {}
+        self._hashes = self._load_hashes()
+
+    def create(self, filename, size=None):
+        """Start an upload of `size` bytes (None: unknown, taken from what arrives)."""
+        filename = os.path.basename(filename or "")
+        if not filename:
+            raise UploadError("No filename provided")
+        if size is not None:
+            try:
+                size = int(size)
+            except (TypeError, ValueError):
+                raise UploadError("Invalid size")
+            if size < 0:
+                raise UploadError("Invalid size")
+        upload_id = uuid.uuid4().hex
+        state = {"upload_id": upload_id, "filename": filename, "size": size, "offset": 0}
+        with self._lock:
+            self._uploads[upload_id] = state
+            self._hashers[upload_id] = hashlib.sha256()
+            self._upload_locks[upload_id] = threading.Lock()
+        open(self._part_path(upload_id), "wb").close()
+        self._save_state(state)
+        return dict(state)
+
+    def status(self, upload_id):
+        return dict(self._state(upload_id))
+
+    def append(self, upload_id, offset, stream):
+        """
+        Write the chunk read from `stream` at `offset`, which must be where
+        the upload currently ends. Returns the new state.
+        """
+        with self._upload_lock(upload_id):
+            state = self._state(upload_id)
+            if offset != state["offset"]:
+                raise UploadError(f"Expected offset {state['offset']}", status=409, offset=state["offset"])
+            hasher = self._hasher(upload_id, state)
+            remaining = state["size"] - state["offset"] if state["size"] is not None else None
+            try:
+                with open(self._part_path(upload_id), "r+b") as f:
+                    f.seek(state["offset"])
+                    f.truncate()
+                    while True:
+                        block = stream.read(self.block_size)
+                        if not block:
+                            break
+                        if remaining is not None:
+                            if len(block) > remaining:
+                                raise UploadError("Chunk runs past the declared size", status=413, offset=state["offset"])
+                            remaining -= len(block)
+                        f.write(block)
+                        hasher.update(block)
+                        state["offset"] += len(block)
+            finally:
+                # A dropped connection keeps what arrived; the client resumes from here
+                self._save_state(state)
+            return dict(state)
+
+    def complete(self, upload_id):
+        """
+        Finish an upload. Returns (path, sha256, deduplicated): the stored
+        file, its content hash, and whether an identical file already existed.
+        """
+        with self._upload_lock(upload_id):
+            state = self._state(upload_id)
+            if state["size"] is None:
+                state["size"] = state["offset"]
+            if state["offset"] != state["size"]:
+                raise UploadError(
+                    f"Upload incomplete: {state['offset']} of {state['size']} bytes", status=409, offset=state["offset"]
+                )
+            digest = self._hasher(upload_id, state).hexdigest()
+            part_path = self._part_path(upload_id)
+
+            with self._lock:
+                existing = self._hashes.get(digest)
+            existing_path = os.path.join(self.target_dir, existing) if existing else None
+            # The stored copy may since have been remuxed, so match on the uploaded content only
+            if existing_path and os.path.isfile(existing_path):
+                os.remove(part_path)
+                path, deduplicated = existing_path, True
+                self._logger.info(f"Upload {state['filename']} matches stored {existing}; not storing a copy")
+            else:
+                path = self._unique_path(state["filename"])
+                os.replace(part_path, path)
+                with self._lock:
+                    self._hashes[digest] = os.path.basename(path)
+                    self._save_hashes()
+                deduplicated = False
+
+            self._forget(upload_id)
+
+        if self.on_complete and not deduplicated:
+            try:
+                self.on_complete(path, digest)
+            except Exception as e:
+                self._logger.error(f"Post-upload step failed for {path}: {e}", exc_info=True)
+        return path, digest, deduplicated
+
+    def store_stream(self, filename, stream, size=None):
+        """Store a whole non-chunked upload through the same path (hashing and dedupe)."""
+        state = self.create(filename, size)
+        try:
+            self.append(state["upload_id"], 0, stream)
+            return self.complete(state["upload_id"])
+        except Exception:
+            self.abort(state["upload_id"])
+            raise
+
+    def abort(self, upload_id):
+        with self._upload_lock(upload_id):
+            if os.path.exists(self._part_path(upload_id)):
+                os.remove(self._part_path(upload_id))
+            self._forget(upload_id)
+
+    def digest_for(self, filename):
+        """SHA-256 recorded when `filename` was uploaded, or None if it was not stored through here."""
+        with self._lock:
+            for digest, stored in self._hashes.items():
+                if stored == filename:
+                    return digest
+        return None
+
+    def _state(self, upload_id):
+        if not upload_id or not all(c in "0123456789abcdef" for c in upload_id):
+            raise UploadError("Unknown upload", status=404)
+        with self._lock:
+            state = self._uploads.get(upload_id)
+        if state is None:
+            # Resume after a restart
+            try:
+                with open(self._state_path(upload_id)) as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                raise UploadError("Unknown upload", status=404)
+            try:
+                state["offset"] = min(state["offset"], os.path.getsize(self._part_path(upload_id)))
+            except OSError:
+                # The part file is gone, so the upload cannot be resumed
+                raise UploadError("Unknown upload", status=404)
+            with self._lock:
+                state = self._uploads.setdefault(upload_id, state)
+        return state
+
+    def _upload_lock(self, upload_id):
+        self._state(upload_id)
+        with self._lock:
+            return self._upload_locks.setdefault(upload_id, threading.Lock())
+
+    def _hasher(self, upload_id, state):
+        with self._lock:
+            hasher = self._hashers.get(upload_id)
+        if hasher is None:
+            # State came from disk: hash what was already received, once
+            hasher = hashlib.sha256()
+            with open(self._part_path(upload_id), "rb") as f:
+                remaining = state["offset"]
+                while remaining > 0:
+                    block = f.read(min(self.block_size, remaining))
+                    if not block:
+                        break
+                    hasher.update(block)
+                    remaining -= len(block)
+            with self._lock:
+                self._hashers[upload_id] = hasher
+        return hasher
+
+    def _forget(self, upload_id):
+        with self._lock:
+            self._uploads.pop(upload_id, None)
+            self._hashers.pop(upload_id, None)
+            self._upload_locks.pop(upload_id, None)
+        if os.path.exists(self._state_path(upload_id)):
+            os.remove(self._state_path(upload_id))
+
+    def _unique_path(self, filename):
+        base_name, file_ext = os.path.splitext(filename)
+        final_filename = filename
+        counter = 1
+        while os.path.exists(os.path.join(self.target_dir, final_filename)):
+            final_filename = f"{base_name}_{counter}{file_ext}"
+            counter += 1
+        return os.path.join(self.target_dir, final_filename)
+
+    def _part_path(self, upload_id):
+        return os.path.join(self._state_dir, f"{upload_id}.part")
+
+    def _state_path(self, upload_id):
+        return os.path.join(self._state_dir, f"{upload_id}.json")
+
+    def _save_state(self, state):
+        with open(self._state_path(state["upload_id"]), "w") as f:
+            json.dump(state, f)
+
+    def _load_hashes(self):
+        try:
+            with open(self._hashes_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_hashes(self):
+        tmp_path = self._hashes_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._hashes, f)
+        os.replace(tmp_path, self._hashes_path)
@@ -0,0 +1,116 @@
+# Copyright (c) MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import threading
+
+class ConversationMemory:
+    """
+    Background summarizer for a ChatHistory. Turns older than the last
+    `keep_recent_turns` are folded into a rolling summary, a batch at a time,
+    and attached to the history with `set_summary`; prompts then carry the
+    summary plus recent turns verbatim instead of dropping older context.
+    Summaries run at background priority so they never delay the surgeon.
+    """
+
+    def __init__(self, chat_history, agent, settings=None):
+        self._logger = logging.getLogger(__name__)
+        settings = settings or {}
+        self.chat_history = chat_history
+        self.agent = agent
+        self.keep_recent_turns = settings.get('keep_recent_turns', 4)
+        self.batch_turns = settings.get('batch_turns', 8)
+        self.summary_max_tokens = settings.get('summary_max_tokens', 256)
+        self.summary_prompt = settings.get(
+            'summary_prompt', "Merge the new conversation turns into the existing summary."
+        ).strip()
+        self._wakeup = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._worker, name="conversation-memory", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def notify(self):
+        """Call after a turn completes; the worker checks whether anything needs summarizing."""
+        self._wakeup.set()
+
+    def _worker(self):
+        while not self._stop_event.is_set():
+            self._wakeup.wait()
+            self._wakeup.clear()
+            while not self._stop_event.is_set() and self._pending_range():
+                # Yield to interactive requests before spending LLM time
+                if not self.agent.wait_for_foreground_idle(timeout=1.0):
+                    continue
+                if not self._summarize_next_batch():
+                    break
+
+    def _pending_range(self):
+        _, upto = self.chat_history.summary_state()
+        # The newest turn may still be waiting for its answer, so never touch it
+        stop = self.chat_history.end_index() - max(self.keep_recent_turns, 1)
+        if stop <= upto:
+            return None
+        return upto, min(stop, upto + self.batch_turns)
+
+    def _summarize_next_batch(self):
+        pending = self._pending_range()
+        if not pending:
+            return False
+        start, stop = pending
+        summary, _ = self.chat_history.summary_state()
+        turns = self.chat_history.turns_between(start, stop)
+        lines = []
+        for user_msg, bot_msg in turns:
+            if user_msg:
+                lines.append(f"Surgeon: {user_msg}")
+            if bot_msg:
+                lines.append(f"Assistant: {bot_msg}")
+        if not lines:
+            return self.chat_history.set_summary(summary, stop, expected_upto=start)
+
+        user_content = (
+            f"Existing summary:\n{summary or '(none)'}\n\n"
+            "New turns:\n" + "\n".join(lines)
+        )
+        try:
+            result = self.agent.client.chat.completions.create(
+                model=self.agent.model_name,
+                messages=[
+                    {"role": "system", "content": self.summary_prompt},
+                    {"role": "user", "content": user_content},
+                ],
+                temperature=0.0,
+                max_tokens=self.summary_max_tokens,
+            )
+            new_summary = result.choices[0].message.content.strip() if result.choices else ""
+        except Exception as e:
+            self._logger.error(f"Conversation summary failed: {e}", exc_info=True)
+            return False
+        if not new_summary:
+            return False
+
+        updated = self.chat_history.set_summary(new_summary, stop, expected_upto=start)
+        if updated:
+            self._logger.debug(f"Conversation summary now covers turns before {stop}")
+        return updated
@@ -0,0 +1,96 @@
+# Copyright (c) MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+
+class SessionDispatcher:
+    """
+    Runs handlers on a bounded worker pool while keeping each session's
+    handlers in submission order: a session has at most one handler running,
+    and its next one starts when that finishes. Sessions take turns for
+    workers one handler at a time, so a busy client cannot starve the others.
+    """
+
+    def __init__(self, max_workers=4, max_pending=8):
+        self._logger = logging.getLogger(__name__)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="dispatch")
+        self._lock = threading.Lock()
+        self._queues = {}       # session -> deque of (fn, args, enqueued)
+        self._running = set()   # sessions with a handler scheduled or running
+        self._stats = Counter()
+        self._total_wait = 0.0
+        self._max_depth = 0
+        self.max_pending = max_pending
+
+    def submit(self, session, fn, *args):
+        """
+        Queue `fn(*args)` behind the session's earlier handlers. Returns False
+        (and runs nothing) if the session already has `max_pending` waiting.
+        """
+        with self._lock:
+            pending = self._queues.setdefault(session, deque())
+            if len(pending) >= self.max_pending:
+                self._stats["rejected"] += 1
+                return False
+            pending.append((fn, args, time.time()))
+            self._stats["submitted"] += 1
+            self._max_depth = max(self._max_depth, len(pending))
+            schedule = session not in self._running
+            if schedule:
+                self._running.add(session)
+        if schedule:
+            self._executor.submit(self._run_next, session)
+        return True
+
+    def shutdown(self, wait=False):
+        self._executor.shutdown(wait=wait)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            depths = {str(session): len(pending) for session, pending in self._queues.items() if pending}
+            stats["queued"] = sum(depths.values())
+            stats["in_flight"] = self._stats["started"] - self._stats["completed"] - self._stats["failed"]
+            stats["max_session_depth"] = self._max_depth
+            stats["session_depths"] = depths
+            started = self._stats["started"]
+            stats["mean_wait_ms"] = round(self._total_wait * 1000 / started, 2) if started else 0.0
+        return stats
+
+    def _run_next(self, session):
+        with self._lock:
+            pending = self._queues.get(session)
+            if not pending:
+                self._running.discard(session)
+                self._queues.pop(session, None)
+                return
+            fn, args, enqueued = pending.popleft()
+            self._stats["started"] += 1
+            self._total_wait += time.time() - enqueued
+        try:
+            fn(*args)
+            outcome = "completed"
+        except Exception as e:
+            self._logger.error(f"Handler for session {session} failed: {e}", exc_info=True)
+            outcome = "failed"
+        with self._lock:
+            self._stats[outcome] += 1
+            more = bool(self._queues.get(session))
+            if not more:
+                self._running.discard(session)
+                self._queues.pop(session, None)
+        if more:
+            # Requeue behind other sessions instead of looping on this worker
+            self._executor.submit(self._run_next, session)
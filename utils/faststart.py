@@ -0,0 +1,102 @@
+# Copyright (c) MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import os
+import shutil
+import struct
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+FASTSTART_EXTENSIONS = ('.mp4', '.m4v', '.mov')
+
+def needs_faststart(path):
+    """
+    True if an MP4/QuickTime file has its `moov` atom after `mdat`, so a
+    browser must fetch (or range-request) the end of the file before it can
+    start playing. Only the top-level atom headers are read.
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        offset = 0
+        while offset + 8 <= size:
+            f.seek(offset)
+            box_size, box_type = struct.unpack(">I4s", f.read(8))
+            if box_size == 1:
+                box_size = struct.unpack(">Q", f.read(8))[0]
+            elif box_size == 0:
+                box_size = size - offset
+            if box_type == b'moov':
+                return False
+            if box_type == b'mdat':
+                return True
+            if box_size < 8:
+                # Not a well-formed MP4; leave it alone
+                return False
+            offset += box_size
+    return False
+
+class FaststartRemuxer:
+    """
+    Rewrites uploaded MP4s with the `moov` atom first (ffmpeg stream copy,
+    no re-encode) on a background worker, then atomically replaces the
+    original. `on_done(path)` is called after a file has been replaced.
+    """
+
+    def __init__(self, on_done=None, timeout=600):
+        self._logger = logging.getLogger(__name__)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="faststart")
+        self._lock = threading.Lock()
+        self._in_progress = set()
+        self.on_done = on_done
+        self.timeout = timeout
+        self.available = bool(shutil.which("ffmpeg"))
+
+    def submit(self, path):
+        if not path.lower().endswith(FASTSTART_EXTENSIONS):
+            return
+        with self._lock:
+            if path in self._in_progress:
+                return
+            self._in_progress.add(path)
+        self._executor.submit(self._remux, path)
+
+    def _remux(self, path):
+        try:
+            if not needs_faststart(path):
+                return
+            if not self.available:
+                self._logger.warning(f"{os.path.basename(path)} is not faststart but ffmpeg is unavailable")
+                return
+            tmp_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.faststart.part")
+            result = subprocess.run(
+                ["ffmpeg", "-v", "error", "-y", "-i", path, "-map", "0", "-c", "copy",
+                 "-movflags", "+faststart", "-f", "mp4", tmp_path],
+                capture_output=True, timeout=self.timeout,
+            )
+            if result.returncode != 0:
+                self._logger.error(
+                    f"Faststart remux of {path} failed: {result.stderr.decode('utf-8', 'replace').strip()[:200]}"
+                )
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                return
+            # Readers that already opened the old file keep it; new requests get the new one
+            os.replace(tmp_path, path)
+            self._logger.info(f"Remuxed {os.path.basename(path)} for faststart playback")
+            if self.on_done:
+                self.on_done(path)
+        except Exception as e:
+            self._logger.error(f"Faststart remux of {path} failed: {e}", exc_info=True)
+        finally:
+            with self._lock:
+                self._in_progress.discard(path)
@@ -0,0 +1,95 @@
+# Copyright (c) MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import base64
+import struct
+import threading
+from collections import OrderedDict
+
+# Binary WebSocket frame message: a fixed header followed by the raw JPEG bytes.
+#   version (uint8), message type (uint8), frame id (uint32), client timestamp in ms (uint64)
+FRAME_HEADER = struct.Struct("!BBIQ")
+FRAME_PROTOCOL_VERSION = 1
+
+# Message types
+FRAME_TYPE_AUTO = 1   # periodic capture, feeds the annotation agent
+FRAME_TYPE_INPUT = 2  # captured for a user input that follows as JSON with its frame_id
+
+class Frame:
+    """
+    A JPEG frame received from a client or extracted from a video on the
+    server. `jpeg` is a memoryview into the received message, so the image
+    bytes are never copied; the base64 data URI is only built if a consumer
+    asks for it. `video_time` is the position in the video, when known.
+    """
+
+    def __init__(self, jpeg, frame_id=None, timestamp_ms=None, message_type=FRAME_TYPE_AUTO, video_time=None):
+        self.jpeg = jpeg
+        self.frame_id = frame_id
+        self.timestamp_ms = timestamp_ms
+        self.message_type = message_type
+        self.video_time = video_time
+        self._data_uri = None
+
+    def __len__(self):
+        return len(self.jpeg)
+
+    @property
+    def data_uri(self):
+        if self._data_uri is None:
+            self._data_uri = "data:image/jpeg;base64," + base64.b64encode(self.jpeg).decode("ascii")
+        return self._data_uri
+
+def parse_frame_message(message):
+    """Parse a binary frame message. Raises ValueError if it is malformed."""
+    if len(message) <= FRAME_HEADER.size:
+        raise ValueError(f"frame message too short ({len(message)} bytes)")
+    view = memoryview(message)
+    version, message_type, frame_id, timestamp_ms = FRAME_HEADER.unpack_from(view)
+    if version != FRAME_PROTOCOL_VERSION:
+        raise ValueError(f"unsupported frame protocol version {version}")
+    return Frame(view[FRAME_HEADER.size:], frame_id, timestamp_ms, message_type)
+
+def frame_bytes(frame):
+    """Raw image bytes of a Frame or a (data URI) base64 string."""
+    if isinstance(frame, Frame):
+        return frame.jpeg
+    if frame.startswith("data:image/"):
+        frame = frame.split(",", 1)[-1]
+    return base64.b64decode(frame)
+
+class FrameStore:
+    """
+    Most recent frames of each client by frame id, so a user input can refer
+    to the frame its client sent before it. Clients number their frames
+    themselves, so ids are only unique within a session.
+    """
+
+    def __init__(self, max_frames=16):
+        self._lock = threading.Lock()
+        self._sessions = {}   # session -> OrderedDict of frame_id -> Frame
+        self.max_frames = max_frames
+
+    def put(self, session, frame):
+        with self._lock:
+            frames = self._sessions.setdefault(session, OrderedDict())
+            frames[frame.frame_id] = frame
+            frames.move_to_end(frame.frame_id)
+            while len(frames) > self.max_frames:
+                frames.popitem(last=False)
+
+    def get(self, session, frame_id):
+        with self._lock:
+            return self._sessions.get(session, {}).get(frame_id)
+
+    def drop_session(self, session):
+        with self._lock:
+            self._sessions.pop(session, None)
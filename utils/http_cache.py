@@ -0,0 +1,189 @@
+# Copyright (c) MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import threading
+
+import flask
+from flask import request
+from werkzeug.exceptions import NotFound
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    "text/", "application/javascript", "application/json", "application/xml", "image/svg+xml",
+    "image/x-icon", "image/vnd.microsoft.icon",
+)
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+def is_compressible(mimetype):
+    return bool(mimetype) and mimetype.startswith(COMPRESSIBLE_TYPES)
+
+def preferred_encoding(encodings=("br", "gzip")):
+    """The first of `encodings` (that this server can produce) the client accepts, or None."""
+    for encoding in encodings:
+        if encoding == "br" and brotli is None:
+            continue
+        if request.accept_encodings[encoding]:
+            return encoding
+    return None
+
+def compress(data, encoding, level=None):
+    if encoding == "br":
+        return brotli.compress(data, quality=11 if level is None else level)
+    return gzip.compress(data, compresslevel=9 if level is None else level, mtime=0)
+
+def cached_json(payload, etag, max_age=None):
+    """
+    JSON response validated by `etag` (weak, since compression may change the
+    bytes): a matching If-None-Match gets a 304. Without `max_age` clients
+    revalidate on every use.
+    """
+    response = flask.jsonify(payload)
+    response.set_etag(etag, weak=True)
+    response.cache_control.private = True
+    if max_age is None:
+        response.cache_control.no_cache = True
+    else:
+        response.cache_control.max_age = max_age
+    return response.make_conditional(request)
+
+class StaticAssets:
+    """
+    Serves the static folder with long-lived caching. Templates link assets
+    through `url(filename)`, which appends a hash of the file content, so a
+    versioned URL never changes meaning and is sent `immutable` for a year;
+    an edited file simply gets a new URL. Unversioned requests revalidate
+    with an ETag.
+
+    Text assets are compressed once per file version at the highest level
+    (brotli when the `brotli` package is installed, gzip otherwise) and kept
+    in memory, so requests never compress on the fly.
+    """
+
+    def __init__(self, static_dir):
+        self._logger = logging.getLogger(__name__)
+        self.static_dir = static_dir
+        self._lock = threading.Lock()
+        self._assets = {}   # filename -> {"version", "hash", encoding: bytes}
+
+    def url(self, filename):
+        try:
+            return f"/static/{filename}?v={self._asset(filename)['hash']}"
+        except NotFound:
+            self._logger.warning(f"Static asset {filename} not found")
+            return f"/static/{filename}"
+
+    def serve(self, filename):
+        asset = self._asset(filename)
+        path = asset["path"]
+        mimetype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        encoding = preferred_encoding() if is_compressible(mimetype) else None
+        versioned = request.args.get("v") == asset["hash"]
+
+        if encoding:
+            body = self._compressed(asset, encoding)
+            response = flask.Response(body, mimetype=mimetype)
+            response.headers["Content-Encoding"] = encoding
+            response.set_etag(f"{asset['hash']}-{encoding}")
+        else:
+            response = flask.send_file(
+                path, mimetype=mimetype, conditional=True, etag=asset["hash"],
+                max_age=IMMUTABLE_MAX_AGE if versioned else None,
+            )
+        response.vary.add("Accept-Encoding")
+
+        if versioned:
+            response.cache_control.public = True
+            response.cache_control.max_age = IMMUTABLE_MAX_AGE
+            response.cache_control.immutable = True
+        else:
+            response.cache_control.no_cache = True
+        return response.make_conditional(request)
+
+    def _asset(self, filename):
+        path = safe_join(self.static_dir, filename)
+        if path is None or not os.path.isfile(path):
+            raise NotFound()
+        stat = os.stat(path)
+        version = (stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            asset = self._assets.get(filename)
+            if asset and asset["version"] == version:
+                return asset
+        hasher = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                hasher.update(block)
+        digest = hasher.hexdigest()[:12]
+        asset = {"path": path, "version": version, "hash": digest}
+        with self._lock:
+            self._assets[filename] = asset
+        return asset
+
+    def _compressed(self, asset, encoding):
+        with self._lock:
+            body = asset.get(encoding)
+        if body is None:
+            with open(asset["path"], "rb") as f:
+                body = compress(f.read(), encoding)
+            with self._lock:
+                asset[encoding] = body
+        return body
+
+class ResponseCompressor:
+    """
+    Compresses dynamic responses (JSON, HTML) of at least `min_size` bytes
+    for clients that accept it, using fast settings since this runs per
+    request. Streamed and already-encoded responses are left alone.
+    """
+
+    def __init__(self, min_size=1024, gzip_level=6, brotli_quality=5):
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def init_app(self, app):
+        app.after_request(self.after_request)
+
+    def after_request(self, response):
+        if (
+            response.status_code != 200
+            or response.direct_passthrough
+            or response.is_streamed
+            or "Content-Encoding" in response.headers
+            or not is_compressible(response.mimetype)
+        ):
+            return response
+        response.vary.add("Accept-Encoding")
+        if (response.content_length or 0) < self.min_size:
+            return response
+        encoding = preferred_encoding()
+        if not encoding:
+            return response
+
+        level = self.brotli_quality if encoding == "br" else self.gzip_level
+        response.set_data(compress(response.get_data(), encoding, level))
+        response.headers["Content-Encoding"] = encoding
+        etag, _ = response.get_etag()
+        if etag:
+            # Same content in another encoding: only a weak validator still holds
+            response.set_etag(etag, weak=True)
+        return response
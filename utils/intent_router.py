@@ -0,0 +1,227 @@
+# Copyright (c) MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import math
+import re
+import threading
+from collections import Counter, defaultdict, deque
+
+# Sharpness values tried when calibrating against labelled inputs
+SHARPNESS_CANDIDATES = (0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 4.0, 5.0, 6.0, 8.0, 10.0)
+
+class IntentRouter:
+    """
+    Cheap CPU intent classifier that sits in front of the LLM selector.
+
+    Regex rules from the config are checked first; otherwise a character n-gram
+    naive Bayes model trained on the configured examples scores each agent.
+    `classify` returns (label, confidence, source) and callers only trust it
+    when confidence clears `min_confidence`. Decisions the LLM makes are fed
+    back with `record_llm_decision`, which tracks how often the two agree and
+    adds the input as a training example; only the most recent
+    `max_learned_examples` learned inputs are kept.
+
+    With `sharpness: auto` the model's sharpness is fitted to the
+    `calibration` inputs (held out from training), or by leave-one-out over
+    the examples when there are none, so that its confidences match its
+    accuracy on them.
+    """
+
+    def __init__(self, settings):
+        self._logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self.rule_confidence = settings.get('rule_confidence', 0.99)
+        self.min_confidence = settings.get('min_confidence', 0.9)
+        self.ngram_range = tuple(settings.get('ngram_range', [2, 4]))
+        self.sharpness = settings.get('sharpness', 'auto')
+        self.learn_from_llm = settings.get('learn_from_llm', False)
+        self._learned = deque()
+        self.max_learned_examples = settings.get('max_learned_examples', 200)
+        # Agents the n-gram model may pick on its own; others need a rule match
+        self.model_labels = set(settings.get('model_labels') or [])
+
+        self.rules = []
+        for label, patterns in (settings.get('rules') or {}).items():
+            for pattern in patterns:
+                self.rules.append((label, re.compile(pattern, re.IGNORECASE)))
+
+        self.labels = []
+        self._ngram_counts = {}
+        self._ngram_totals = {}
+        self._doc_counts = Counter()
+        self._vocab = Counter()   # n-gram -> occurrences over all labels
+        examples = [
+            (example, label)
+            for label, label_examples in (settings.get('examples') or {}).items()
+            for example in label_examples
+        ]
+        for example, label in examples:
+            self._learn(example, label)
+
+        if self.sharpness == 'auto':
+            held_out = [
+                (text, label)
+                for label, texts in (settings.get('calibration') or {}).items()
+                for text in texts
+            ]
+            self.sharpness = self._calibrate(held_out, examples)
+
+        # label agreement between local guesses and the LLM, split by route source
+        self._stats = defaultdict(Counter)
+        self._logger.info(
+            f"Intent router ready: {len(self.rules)} rules, "
+            f"{sum(self._doc_counts.values())} examples over {len(self.labels)} agents, "
+            f"sharpness {self.sharpness}"
+        )
+
+    def classify(self, text):
+        """Return (label, confidence, source); label is None if nothing matched."""
+        normalized = self._normalize(text)
+        if not normalized:
+            return None, 0.0, None
+
+        for label, pattern in self.rules:
+            if pattern.search(normalized):
+                return label, self.rule_confidence, "rule"
+
+        with self._lock:
+            scores = self._posteriors(normalized)
+        if not scores:
+            return None, 0.0, None
+        label = max(scores, key=scores.get)
+        return label, scores[label], "model"
+
+    def is_confident(self, confidence):
+        return confidence >= self.min_confidence
+
+    def can_route(self, label, confidence, source):
+        """True if a classify() result is trustworthy enough to skip the LLM."""
+        if label is None or not self.is_confident(confidence):
+            return False
+        return source == "rule" or not self.model_labels or label in self.model_labels
+
+    def record_llm_decision(self, text, local_label, local_confidence, local_source, llm_label):
+        """Compare a local guess with the LLM's pick, and learn from the LLM's answer."""
+        if not llm_label:
+            return
+        confident = self.can_route(local_label, local_confidence, local_source)
+        bucket = f"{local_source or 'none'}_{'confident' if confident else 'uncertain'}"
+        with self._lock:
+            self._stats[bucket]["agree" if local_label == llm_label else "disagree"] += 1
+            if self.learn_from_llm and not confident:
+                self._learn(text, llm_label)
+                self._learned.append((text, llm_label))
+                # Oldest learned inputs age out, so memory stays bounded and
+                # early LLM mistakes do not stay in the model for good
+                while len(self._learned) > self.max_learned_examples:
+                    self._learn(*self._learned.popleft(), sign=-1)
+        if confident and local_label != llm_label:
+            self._logger.warning(
+                f"Intent router disagreed with LLM selector: local={local_label} "
+                f"({local_source}, {local_confidence:.2f}), llm={llm_label}, text={text!r}"
+            )
+
+    def record_local_route(self, source):
+        with self._lock:
+            self._stats[f"{source}_routed"]["count"] += 1
+
+    def stats(self):
+        """Counts of local routes and local/LLM agreement, plus agreement rates."""
+        with self._lock:
+            snapshot = {bucket: dict(counts) for bucket, counts in self._stats.items()}
+        for counts in snapshot.values():
+            judged = counts.get("agree", 0) + counts.get("disagree", 0)
+            if judged:
+                counts["agreement_rate"] = round(counts.get("agree", 0) / judged, 3)
+        return snapshot
+
+    def _learn(self, text, label, sign=1):
+        """Add `text` as an example of `label`, or with sign=-1 take it back out."""
+        if label not in self._ngram_counts:
+            self.labels.append(label)
+            self._ngram_counts[label] = Counter()
+            self._ngram_totals[label] = 0
+        grams = Counter(self._ngrams(self._normalize(text)))
+        if sign > 0:
+            self._ngram_counts[label].update(grams)
+            self._vocab.update(grams)
+        else:
+            for counts in (self._ngram_counts[label], self._vocab):
+                counts.subtract(grams)
+                # Forget n-grams no longer seen, so the vocabulary shrinks too
+                for gram in grams:
+                    if counts[gram] <= 0:
+                        del counts[gram]
+        self._ngram_totals[label] += sign * sum(grams.values())
+        self._doc_counts[label] += sign
+
+    def _calibrate(self, held_out, examples):
+        """
+        The candidate sharpness with the lowest log loss on `held_out`, or on
+        leave-one-out predictions over `examples` when nothing is held out.
+        """
+        if held_out:
+            def predictions():
+                return [(self._posteriors(self._normalize(text)), label) for text, label in held_out]
+        else:
+            def predictions():
+                results = []
+                for text, label in examples:
+                    self._learn(text, label, sign=-1)
+                    results.append((self._posteriors(self._normalize(text)), label))
+                    self._learn(text, label)
+                return results
+
+        best, best_loss = SHARPNESS_CANDIDATES[0], math.inf
+        for sharpness in SHARPNESS_CANDIDATES:
+            self.sharpness = sharpness
+            scored = [(scores, label) for scores, label in predictions() if scores]
+            if not scored:
+                return 1.0
+            loss = -sum(math.log(max(scores.get(label, 0.0), 1e-12)) for scores, label in scored) / len(scored)
+            if loss < best_loss:
+                best, best_loss = sharpness, loss
+        return best
+
+    def _posteriors(self, normalized):
+        grams = self._ngrams(normalized)
+        if not grams or not self.labels:
+            return {}
+        total_docs = sum(self._doc_counts.values())
+        vocab_size = len(self._vocab) + 1
+        log_scores = {}
+        for label in self.labels:
+            if self._doc_counts[label] <= 0:
+                continue
+            counts = self._ngram_counts[label]
+            denom = self._ngram_totals[label] + vocab_size
+            # Average per-n-gram log-likelihood (Laplace smoothed) keeps long
+            # inputs from producing absurdly peaked posteriors
+            likelihood = sum(math.log((counts[g] + 1) / denom) for g in grams) / len(grams)
+            log_scores[label] = math.log(self._doc_counts[label] / total_docs) / len(grams) + likelihood * self.sharpness
+        top = max(log_scores.values())
+        exp_scores = {label: math.exp(score - top) for label, score in log_scores.items()}
+        norm = sum(exp_scores.values())
+        return {label: score / norm for label, score in exp_scores.items()}
+
+    def _ngrams(self, normalized):
+        padded = f" {normalized} "
+        low, high = self.ngram_range
+        return [
+            padded[i:i + n]
+            for n in range(low, high + 1)
+            for i in range(len(padded) - n + 1)
+        ]
+
+    @staticmethod
+    def _normalize(text):
+        return re.sub(r"[^a-z0-9']+", " ", (text or "").lower()).strip()
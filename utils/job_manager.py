@@ -0,0 +1,126 @@
+# Copyright (c) MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+class JobManager:
+    """
+    Runs long jobs on a bounded worker pool. Jobs carry a key describing their
+    inputs: submitting a key that is already in flight returns the existing job,
+    and finished results are cached by key so repeats do no work at all.
+    """
+
+    def __init__(self, max_workers=2, cache_size=32, on_update=None):
+        self._logger = logging.getLogger(__name__)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()       # job_id -> job record, oldest first
+        self._in_flight = {}             # key -> job_id
+        self._results = OrderedDict()    # key -> job_id of the finished job, LRU
+        self._failed = OrderedDict()     # job_id -> None, kept for status queries only
+        self._cache_size = cache_size
+        self._done_events = {}
+        self.on_update = on_update
+
+    def submit(self, key, fn):
+        """
+        Start `fn(progress)` for `key` unless an identical job is running or cached.
+        `progress(stage)` may be called by `fn` to report what it is doing.
+        Returns a snapshot of the job record.
+        """
+        with self._lock:
+            job_id = self._in_flight.get(key)
+            if job_id is None and key in self._results:
+                job_id = self._results[key]
+                self._results.move_to_end(key)
+            if job_id is not None:
+                self._logger.debug(f"Reusing job {job_id} for key {key}")
+                return dict(self._jobs[job_id])
+
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {
+                "job_id": job_id,
+                "status": "queued",
+                "stage": None,
+                "result": None,
+                "error": None,
+                "created": time.time(),
+                "finished": None,
+            }
+            self._in_flight[key] = job_id
+            self._done_events[job_id] = threading.Event()
+            snapshot = dict(self._jobs[job_id])
+
+        self._notify(snapshot)
+        self._executor.submit(self._run, job_id, key, fn)
+        return snapshot
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def wait(self, job_id, timeout=None):
+        """Block until the job finishes. Returns its record, or None if unknown."""
+        with self._lock:
+            event = self._done_events.get(job_id)
+        if event is None:
+            return self.get(job_id)
+        event.wait(timeout)
+        return self.get(job_id)
+
+    def _run(self, job_id, key, fn):
+        self._update(job_id, status="running")
+        try:
+            result = fn(lambda stage: self._update(job_id, stage=stage))
+            self._finish(job_id, key, status="done", result=result)
+        except Exception as e:
+            self._logger.error(f"Job {job_id} failed: {e}", exc_info=True)
+            self._finish(job_id, key, status="failed", error=str(e))
+
+    def _finish(self, job_id, key, **fields):
+        evicted = []
+        with self._lock:
+            self._in_flight.pop(key, None)
+            event = self._done_events[job_id]
+            if fields["status"] == "done":
+                self._results[key] = job_id
+                while len(self._results) > self._cache_size:
+                    evicted.append(self._results.popitem(last=False)[1])
+            else:
+                self._failed[job_id] = None
+                while len(self._failed) > self._cache_size:
+                    evicted.append(self._failed.popitem(last=False)[0])
+        self._update(job_id, finished=time.time(), **fields)
+        event.set()
+        with self._lock:
+            for old_id in evicted:
+                self._jobs.pop(old_id, None)
+                self._done_events.pop(old_id, None)
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs[job_id]
+            job.update(fields)
+            snapshot = dict(job)
+        self._notify(snapshot)
+
+    def _notify(self, snapshot):
+        if self.on_update:
+            try:
+                self.on_update(snapshot)
+            except Exception as e:
+                self._logger.error(f"Error in job update callback: {e}")
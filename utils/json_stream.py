@@ -0,0 +1,74 @@
+# Copyright (c) MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+
+class JsonFieldStream:
+    """
+    Incremental scanner for a streamed JSON object. Feed it text as it arrives
+    and it returns each top-level string field as soon as its closing quote is
+    seen, without waiting for the rest of the object. Non-string and nested
+    values are skipped.
+    """
+
+    def __init__(self):
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._buf = []
+        self._key = None
+        self._expect_value = False
+        self.fields = {}
+
+    def feed(self, text):
+        """Consume `text`; return a list of (key, value) pairs completed by it."""
+        completed = []
+        for ch in text:
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                    self._buf.append(ch)
+                elif ch == '\\':
+                    self._escape = True
+                    self._buf.append(ch)
+                elif ch == '"':
+                    self._in_string = False
+                    self._close_string(completed)
+                else:
+                    self._buf.append(ch)
+            elif ch == '"':
+                self._in_string = True
+                self._buf = []
+            elif ch in '{[':
+                self._depth += 1
+            elif ch in '}]':
+                self._depth -= 1
+            elif self._depth == 1 and ch == ':':
+                self._expect_value = True
+            elif self._depth == 1 and ch == ',':
+                self._key = None
+                self._expect_value = False
+        return completed
+
+    def _close_string(self, completed):
+        if self._depth != 1:
+            return
+        try:
+            value = json.loads('"' + "".join(self._buf) + '"')
+        except json.JSONDecodeError:
+            value = "".join(self._buf)
+        if self._expect_value and self._key is not None:
+            self.fields[self._key] = value
+            completed.append((self._key, value))
+            self._key = None
+            self._expect_value = False
+        else:
+            self._key = value
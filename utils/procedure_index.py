@@ -0,0 +1,356 @@
+# Copyright (c) MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import bisect
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+STOP_WORDS = {
+    "a", "an", "the", "we", "i", "you", "did", "do", "does", "was", "were", "is", "are",
+    "have", "has", "had", "when", "what", "which", "where", "how", "so", "far", "of", "to",
+    "in", "on", "at", "it", "that", "this", "be", "been", "first", "start", "begin", "any",
+    "there", "and", "or", "for", "with", "our", "us", "me", "my", "please", "tell", "can",
+}
+
+SCENE_WORDS = r"\b(now|current|currently|this|see|seeing|image|frame|screen|visible)\b"
+
+def _stem(word):
+    for suffix in ("ing", "ed", "er", "es", "s"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            word = word[:-len(suffix)]
+            break
+    # clipp -> clip, so clipped/clipping/clip share a stem
+    if len(word) > 3 and word[-1] == word[-2] and word[-1] not in "aeiou":
+        word = word[:-1]
+    return word
+
+def _terms(text):
+    words = re.findall(r"[a-z0-9]+", (text or "").lower().replace("_", " "))
+    return [_stem(w) for w in words if w not in STOP_WORDS]
+
+def _format_elapsed(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes:02d}m {seconds:02d}s" if hours else f"{minutes}m {seconds:02d}s"
+
+class ProcedureIndex:
+    """
+    In-memory inverted index over the procedure's annotations and notes.
+
+    Records are indexed by kind, surgical phase, tool, anatomy, stemmed text
+    terms and time. `query` combines those filters; `answer` handles common
+    factual questions ("how many notes so far?", "when did we clip the
+    cystic duct?") outright, and `context_for` picks the records relevant to
+    a question so only those go into an LLM prompt.
+    """
+
+    def __init__(self):
+        self._logger = logging.getLogger(__name__)
+        self._lock = threading.RLock()
+        self._records = {}
+        self._next_id = 0
+        self._note_ids = {}                 # id(note dict) -> record id
+        self._postings = defaultdict(lambda: defaultdict(set))   # field -> value -> record ids
+        self._record_terms = {}             # record id -> set of terms
+        self._by_time = []                  # sorted (epoch, record id)
+        self._procedure_start = None
+
+    @classmethod
+    def from_folder(cls, procedure_folder):
+        """Build an index from a procedure folder's annotation.json and notetaker_notes.json."""
+        index = cls()
+        for name, add in (("annotation.json", index.add_annotation), ("notetaker_notes.json", index.add_note)):
+            path = os.path.join(procedure_folder, name)
+            if not os.path.isfile(path):
+                continue
+            try:
+                with open(path, "r") as f:
+                    items = json.load(f)
+            except Exception as e:
+                index._logger.error(f"Error reading {path}: {e}")
+                continue
+            for item in items if isinstance(items, list) else []:
+                if isinstance(item, dict):
+                    add(item)
+        return index
+
+    def counts(self):
+        with self._lock:
+            return {kind: len(ids) for kind, ids in self._postings["kind"].items()}
+
+    def add_annotation(self, annotation):
+        epoch = self._parse_time(annotation.get("timestamp"))
+        elapsed = annotation.get("elapsed_time_seconds")
+        if epoch is not None and isinstance(elapsed, (int, float)) and self._procedure_start is None:
+            self._procedure_start = epoch - elapsed
+        tools = [t for t in annotation.get("tools", []) if t and t != "none"]
+        anatomy = [a for a in annotation.get("anatomy", []) if a and a != "none"]
+        record = {
+            "kind": "annotation",
+            "time": epoch,
+            "clock": self._clock(annotation.get("timestamp")),
+            "phase": annotation.get("surgical_phase", ""),
+            "tools": tools,
+            "anatomy": anatomy,
+            "text": annotation.get("description", ""),
+        }
+        text = " ".join([record["phase"], " ".join(tools), " ".join(anatomy), record["text"]])
+        with self._lock:
+            self._add(record, text)
+
+    def add_note(self, note):
+        record = {
+            "kind": "note",
+            "time": self._parse_time(note.get("timestamp")),
+            "clock": self._clock(note.get("timestamp")),
+            "phase": "",
+            "tools": [],
+            "anatomy": [],
+            "text": note.get("text", ""),
+        }
+        with self._lock:
+            self._note_ids[id(note)] = self._add(record, record["text"])
+
+    def update_note(self, note):
+        """Re-index a note whose text changed after it was added."""
+        with self._lock:
+            record_id = self._note_ids.get(id(note))
+            if record_id is None:
+                self.add_note(note)
+                return
+            for term in self._record_terms.pop(record_id, set()):
+                self._postings["term"][term].discard(record_id)
+            self._records[record_id]["text"] = note.get("text", "")
+            self._index_terms(record_id, self._records[record_id]["text"])
+
+    def query(self, kind=None, phase=None, tool=None, anatomy=None, terms=None, since=None, until=None):
+        """Records matching every given filter, oldest first. `terms` must all appear."""
+        with self._lock:
+            candidates = None
+            filters = [("kind", kind), ("phase", phase), ("tool", tool), ("anatomy", anatomy)]
+            filters += [("term", term) for term in (terms or [])]
+            for field, value in filters:
+                if value is None:
+                    continue
+                ids = self._postings[field].get(value, set())
+                candidates = set(ids) if candidates is None else candidates & ids
+                if not candidates:
+                    return []
+            if since is not None or until is not None:
+                lo = bisect.bisect_left(self._by_time, (since if since is not None else float("-inf"), -1))
+                hi = bisect.bisect_right(self._by_time, (until if until is not None else float("inf"), float("inf")))
+                in_range = {record_id for _, record_id in self._by_time[lo:hi]}
+                candidates = in_range if candidates is None else candidates & in_range
+            if candidates is None:
+                candidates = set(self._records)
+            return [self._records[i] for i in sorted(candidates, key=self._sort_key)]
+
+    def answer(self, question):
+        """A direct answer from the indexed records, or None if the question needs the LLM."""
+        # Only questions phrased as such, so a note like "note how many clips..." is left alone
+        q = re.sub(r"^((so|and|ok|okay|hey|please),?\s+)+", "", (question or "").lower().strip())
+        if not q:
+            return None
+        with self._lock:
+            if re.match(r"how many notes\b", q):
+                return self._answer_note_count()
+            # Questions about the current scene are for the vision model
+            about_scene = re.search(SCENE_WORDS, q)
+            if re.match(r"(what|which) (tools|instruments)\b", q) and not about_scene:
+                return self._answer_counts("tool", "tools", "No tools have been recorded yet.")
+            if re.match(r"(what|which) (anatomy|anatomical structures|structures)\b", q) and not about_scene:
+                return self._answer_counts("anatomy", "anatomy", "No anatomy has been recorded yet.")
+            if re.match(r"(what|which) phases\b", q):
+                return self._answer_phases()
+            if re.match(r"how long\b.*\b(procedure|surgery|case|operation|going)\b", q):
+                return self._answer_duration()
+            if re.match(r"(when|at what time) (did|was|were|have|had)\b", q):
+                return self._answer_when(q)
+        return None
+
+    def context_for(self, question, max_tokens, token_counter):
+        """
+        Render the records that share the most terms with `question`, oldest
+        first, within `max_tokens`. Returns "" when nothing matches.
+        """
+        terms = set(_terms(question))
+        if not terms:
+            return ""
+        with self._lock:
+            scores = Counter()
+            for term in terms:
+                for record_id in self._postings["term"].get(term, ()):
+                    scores[record_id] += 1
+            if not scores:
+                return ""
+            chosen, used = [], 0
+            for record_id, _ in scores.most_common():
+                line = self._render(self._records[record_id])
+                cost = token_counter(line) + 1
+                if used + cost > max_tokens:
+                    break
+                chosen.append(record_id)
+                used += cost
+            return "\n".join(self._render(self._records[i]) for i in sorted(chosen, key=self._sort_key))
+
+    def render_budgeted(self, max_tokens, token_counter):
+        """
+        Render all records oldest first, or as many as fit in `max_tokens`.
+        When over budget, notes are kept first, then annotations where the
+        phase changes, then the remaining annotations spread evenly over time.
+        """
+        with self._lock:
+            ordered = sorted(self._records, key=self._sort_key)
+            lines = {record_id: self._render(self._records[record_id]) for record_id in ordered}
+            costs = {record_id: token_counter(line) + 1 for record_id, line in lines.items()}
+            if sum(costs.values()) <= max_tokens:
+                return "\n".join(lines[record_id] for record_id in ordered)
+
+            # Leave room for the line saying how much was left out
+            budget = max_tokens - 16
+            chosen, used = set(), 0
+            def take(record_id):
+                nonlocal used
+                if record_id not in chosen and used + costs[record_id] <= budget:
+                    chosen.add(record_id)
+                    used += costs[record_id]
+
+            annotations = [i for i in ordered if self._records[i]["kind"] == "annotation"]
+            for record_id in ordered:
+                if self._records[record_id]["kind"] == "note":
+                    take(record_id)
+            previous_phase = None
+            for record_id in annotations:
+                phase = self._records[record_id]["phase"]
+                if phase != previous_phase:
+                    take(record_id)
+                previous_phase = phase
+            remaining = [i for i in annotations if i not in chosen]
+            if remaining and used < budget:
+                average = sum(costs[i] for i in remaining) / len(remaining)
+                stride = max(1, math.ceil(len(remaining) * average / (budget - used)))
+                for record_id in remaining[::stride]:
+                    take(record_id)
+
+            rendered = [lines[record_id] for record_id in ordered if record_id in chosen]
+            omitted = len(ordered) - len(chosen)
+            if omitted:
+                rendered.append(f"({omitted} further records omitted to fit the prompt budget)")
+            return "\n".join(rendered)
+
+    def _add(self, record, text):
+        record_id = self._next_id
+        self._next_id += 1
+        self._records[record_id] = record
+        self._postings["kind"][record["kind"]].add(record_id)
+        if record["phase"]:
+            self._postings["phase"][record["phase"]].add(record_id)
+        for tool in record["tools"]:
+            self._postings["tool"][tool].add(record_id)
+        for structure in record["anatomy"]:
+            self._postings["anatomy"][structure].add(record_id)
+        self._index_terms(record_id, text)
+        if record["time"] is not None:
+            bisect.insort(self._by_time, (record["time"], record_id))
+        return record_id
+
+    def _index_terms(self, record_id, text):
+        terms = set(_terms(text))
+        self._record_terms[record_id] = terms
+        for term in terms:
+            self._postings["term"][term].add(record_id)
+
+    def _sort_key(self, record_id):
+        record_time = self._records[record_id]["time"]
+        return (record_time if record_time is not None else float("inf"), record_id)
+
+    def _when(self, record):
+        when = record["clock"] or "an unknown time"
+        if record["time"] is not None and self._procedure_start is not None:
+            when += f" ({_format_elapsed(max(record['time'] - self._procedure_start, 0))} into the procedure)"
+        return when
+
+    def _render(self, record):
+        if record["kind"] == "note":
+            return f"[{record['clock']}] Note: {record['text']}"
+        parts = [f"[{record['clock']}] Phase: {record['phase']}"]
+        if record["tools"]:
+            parts.append(f"Tools: {', '.join(record['tools'])}")
+        if record["anatomy"]:
+            parts.append(f"Anatomy: {', '.join(record['anatomy'])}")
+        if record["text"]:
+            parts.append(record["text"])
+        return " | ".join(parts)
+
+    def _answer_note_count(self):
+        notes = self.query(kind="note")
+        if not notes:
+            return "No notes have been recorded yet."
+        noun = "note has" if len(notes) == 1 else "notes have"
+        return f"{len(notes)} {noun} been recorded so far; the latest at {self._when(notes[-1])}."
+
+    def _answer_counts(self, field, label, empty_message):
+        postings = self._postings[field]
+        counts = {value: len(ids) for value, ids in postings.items() if ids}
+        if not counts:
+            return empty_message
+        parts = []
+        for value, _ in sorted(counts.items(), key=lambda item: -item[1]):
+            first = self.query(**{field: value})[0]
+            seen = f"{counts[value]} annotation" + ("" if counts[value] == 1 else "s")
+            parts.append(f"{value.replace('_', ' ')} (seen in {seen}, first at {first['clock']})")
+        return f"Recorded {label} so far: " + "; ".join(parts) + "."
+
+    def _answer_phases(self):
+        annotations = self.query(kind="annotation")
+        if not annotations:
+            return "No surgical phases have been recorded yet."
+        timeline = []
+        for record in annotations:
+            if record["phase"] and (not timeline or timeline[-1][0] != record["phase"]):
+                timeline.append((record["phase"], record["clock"]))
+        return "Phases so far: " + ", ".join(f"{phase.replace('_', ' ')} from {clock}" for phase, clock in timeline) + "."
+
+    def _answer_duration(self):
+        if not self._by_time or self._procedure_start is None:
+            return None
+        latest = self._by_time[-1][0]
+        return f"The procedure has been running for about {_format_elapsed(latest - self._procedure_start)} as of the latest record."
+
+    def _answer_when(self, question):
+        terms = _terms(question)
+        if not terms:
+            return None
+        matches = self.query(terms=terms)
+        if not matches:
+            return None
+        first = matches[0]
+        answer = f"First recorded at {self._when(first)}: {self._render(first)}"
+        if len(matches) > 1:
+            answer += f" It appears in {len(matches)} records; the latest at {self._when(matches[-1])}."
+        return answer
+
+    @staticmethod
+    def _parse_time(timestamp):
+        try:
+            return time.mktime(time.strptime(timestamp, "%Y-%m-%d %H:%M:%S"))
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def _clock(timestamp):
+        return timestamp.split(" ")[-1] if isinstance(timestamp, str) and timestamp else ""
@@ -18,17 +18,34 @@ class ResponseHandler:
         self._response_queue = queue.Queue()
         self._muted = False
         self._lock = threading.Lock()
+        self._listener = None
+
+    def set_listener(self, listener):
+        """
+        Also pass responses to `listener` as they arrive: `listener.feed(text)`
+        for each piece and `listener.end()` when a response is done.
+        """
+        with self._lock:
+            self._listener = listener
 
     def add_response(self, text):
         with self._lock:
-            if not self._muted:
-                self._response_queue.put((False, text))
+            if self._muted:
+                return
+            self._response_queue.put((False, text))
+            listener = self._listener
+        if listener:
+            listener.feed(text)
 
     def end_response(self):
         with self._lock:
-            if not self._muted:
-                # True indicates the response is done
-                self._response_queue.put((True, None))
+            if self._muted:
+                return
+            # True indicates the response is done
+            self._response_queue.put((True, None))
+            listener = self._listener
+        if listener:
+            listener.end()
 
     def reset_queue(self):
         with self._lock:
@@ -0,0 +1,148 @@
+# Copyright (c) MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+class CancelToken:
+    """Cancellation flag plus a running count of tokens generated under it."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._tokens = 0
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def add_tokens(self, count):
+        with self._lock:
+            self._tokens += count
+
+    @property
+    def generated_tokens(self):
+        with self._lock:
+            return self._tokens
+
+class Speculation:
+    def __init__(self, future, token):
+        self.future = future
+        self.token = token
+        self.started = time.time()
+
+class DeferredOutput:
+    """
+    Response-handler stand-in for a speculative answer: streamed text is held
+    back until `release(handler)`, which passes on what has arrived so far
+    and forwards the rest as it streams. Never released, it is simply dropped.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._target = None
+        self._held = []     # (is_done, text) in arrival order
+
+    def add_response(self, text):
+        self._put(False, text)
+
+    def end_response(self):
+        self._put(True, None)
+
+    def release(self, handler):
+        # Flush and switch under the lock so pieces stay in order
+        with self._lock:
+            for is_done, text in self._held:
+                self._send(handler, is_done, text)
+            self._held = []
+            self._target = handler
+
+    def _put(self, is_done, text):
+        with self._lock:
+            if self._target is None:
+                self._held.append((is_done, text))
+            else:
+                self._send(self._target, is_done, text)
+
+    @staticmethod
+    def _send(handler, is_done, text):
+        if is_done:
+            handler.end_response()
+        else:
+            handler.add_response(text)
+
+class Speculator:
+    """
+    Runs work before we know whether it is wanted. `start(fn)` calls
+    `fn(cancel_token)` on a worker thread; the caller later either `commit`s
+    the speculation (waiting for its result) or `discard`s it, which cancels
+    it and books the tokens it generated as wasted.
+    """
+
+    def __init__(self, max_workers=2):
+        self._logger = logging.getLogger(__name__)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speculative")
+        self._lock = threading.Lock()
+        self._stats = Counter()
+
+    def start(self, fn):
+        token = CancelToken()
+        with self._lock:
+            self._stats["started"] += 1
+        return Speculation(self._executor.submit(fn, token), token)
+
+    def commit(self, speculation, timeout=None):
+        """Wait for and return the speculative result."""
+        result = speculation.future.result(timeout=timeout)
+        with self._lock:
+            self._stats["hits"] += 1
+            self._stats["used_tokens"] += speculation.token.generated_tokens
+        self._logger.debug(
+            f"Speculation hit after {time.time() - speculation.started:.2f}s; stats: {self.stats()}"
+        )
+        return result
+
+    def discard(self, speculation, reason):
+        """Cancel a speculation whose result will not be used."""
+        speculation.token.cancel()
+        with self._lock:
+            self._stats["misses"] += 1
+            self._stats[f"miss_{reason}"] += 1
+
+        def book_waste(_future):
+            with self._lock:
+                self._stats["wasted_tokens"] += speculation.token.generated_tokens
+            self._logger.debug(f"Speculation discarded ({reason}); stats: {self.stats()}")
+
+        speculation.future.add_done_callback(book_waste)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        decided = stats.get("hits", 0) + stats.get("misses", 0)
+        if decided:
+            stats["hit_rate"] = round(stats.get("hits", 0) / decided, 3)
+        return stats
+
+    @staticmethod
+    def same_input(original, corrected):
+        """True if `corrected` differs from `original` only in case, spacing or punctuation."""
+        def normalize(text):
+            text = (text or "").lower().replace("'", "")
+            return re.sub(r"[^a-z0-9]+", " ", text).strip()
+        return normalize(original) == normalize(corrected)
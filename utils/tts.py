@@ -0,0 +1,373 @@
+# Copyright (c) MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import io
+import json
+import logging
+import math
+import os
+import re
+import struct
+import threading
+import uuid
+import wave
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+class TTSError(Exception):
+    """A synthesis request that failed; `status` is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+class ElevenLabsBackend:
+    """
+    ElevenLabs streaming synthesis over one pooled HTTP session, so repeated
+    requests reuse TLS connections instead of opening a new one each time.
+    """
+
+    name = "elevenlabs"
+    extension = "mp3"
+    media_type = "audio/mpeg"
+
+    def __init__(self, voice_id="TX3LPaxmHKxFdv7VOQHJ", model_id="eleven_multilingual_v2",
+                 api_key=None, timeout=15, pool_size=8):
+        self.voice_id = voice_id
+        self.model_id = model_id
+        self.api_key = api_key
+        self.timeout = timeout
+        self.url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}/stream"
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+
+    def stream(self, text, api_key=None):
+        """Start synthesis of `text`; returns an iterator of audio chunks."""
+        api_key = api_key or self.api_key
+        if not api_key:
+            raise TTSError("No API key provided")
+        response = self.session.post(
+            self.url,
+            headers={"xi-api-key": api_key, "Content-Type": "application/json"},
+            json={
+                "text": text,
+                "model_id": self.model_id,
+                "voice_settings": {"stability": 0.5, "similarity_boost": 0.5},
+            },
+            timeout=self.timeout,
+            stream=True,
+        )
+        if response.status_code != 200:
+            detail = response.text[:500]
+            response.close()
+            raise TTSError(f"ElevenLabs API error {response.status_code}: {detail}")
+        return self._iter_chunks(response)
+
+    def _iter_chunks(self, response):
+        try:
+            for chunk in response.iter_content(chunk_size=8192):
+                if chunk:
+                    yield chunk
+        finally:
+            response.close()
+
+class LocalBackend:
+    """
+    Offline stand-in: a quiet tone whose length follows the text, as WAV.
+    Needs no key or network, for development and tests.
+    """
+
+    name = "local"
+    extension = "wav"
+    media_type = "audio/wav"
+
+    def __init__(self, sample_rate=16000, seconds_per_char=0.05):
+        self.voice_id = "tone"
+        self.model_id = "local"
+        self.sample_rate = sample_rate
+        self.seconds_per_char = seconds_per_char
+
+    def stream(self, text, api_key=None):
+        frames = max(int(len(text) * self.seconds_per_char * self.sample_rate), 1)
+        samples = (int(2000 * math.sin(2 * math.pi * 440 * i / self.sample_rate)) for i in range(frames))
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(self.sample_rate)
+            f.writeframes(b"".join(struct.pack("<h", s) for s in samples))
+        data = buffer.getvalue()
+        return iter([data[i:i + 8192] for i in range(0, len(data), 8192)])
+
+class TTSCache:
+    """
+    Synthesized audio on disk, least recently used evicted first once the
+    total exceeds `max_bytes`. Entries are named by key, and the LRU order
+    survives restarts through the files' mtimes.
+    """
+
+    def __init__(self, cache_dir, max_bytes=256 * 1024 * 1024):
+        self._logger = logging.getLogger(__name__)
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> (filename, size), least recently used first
+        self._bytes = 0
+        self._load()
+
+    @staticmethod
+    def key(backend, text):
+        """Cache key of `text` spoken by `backend` with its voice and model."""
+        return hashlib.sha256(
+            json.dumps([backend.name, backend.voice_id, backend.model_id, text]).encode("utf-8")
+        ).hexdigest()
+
+    def path(self, key):
+        """Path of the cached audio for `key`, or None. Counts as a use."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+        path = os.path.join(self.cache_dir, entry[0])
+        try:
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self._drop(key)
+            return None
+        return path
+
+    def write_through(self, key, extension, chunks):
+        """
+        Yield `chunks` while writing them to the cache. The entry is only
+        added once every chunk has been written; a stream that fails or is
+        abandoned part way leaves nothing behind.
+        """
+        filename = f"{key}.{extension}"
+        part_path = os.path.join(self.cache_dir, f".{key}.{uuid.uuid4().hex}.part")
+        complete = False
+        try:
+            with open(part_path, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+            os.replace(part_path, os.path.join(self.cache_dir, filename))
+            complete = True
+            self._add(key, filename)
+        finally:
+            if not complete and os.path.exists(part_path):
+                os.remove(part_path)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes}
+
+    def _add(self, key, filename):
+        size = os.path.getsize(os.path.join(self.cache_dir, filename))
+        evicted = []
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (filename, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                old_key = next(iter(self._entries))
+                evicted.append(self._entries[old_key][0])
+                self._drop(old_key)
+        for old_filename in evicted:
+            try:
+                os.remove(os.path.join(self.cache_dir, old_filename))
+            except OSError:
+                pass
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry:
+            self._bytes -= entry[1]
+
+    def _load(self):
+        found = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.startswith("."):
+                # Leftover from an interrupted write
+                os.remove(entry.path)
+                continue
+            stat = entry.stat()
+            found.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, filename, size in sorted(found):
+            self._entries[filename.split(".", 1)[0]] = (filename, size)
+            self._bytes += size
+
+class SentenceSplitter:
+    """
+    Splits streamed text into sentences. Feed it text as it arrives and it
+    returns each sentence once the whitespace after its end punctuation has
+    been seen; `flush` returns whatever is left at the end.
+    """
+
+    _BOUNDARY = re.compile(r'(?<=[.!?])["\')\]]*\s+|\n+')
+
+    def __init__(self, min_length=12):
+        self.min_length = min_length
+        self._buf = ""
+
+    def feed(self, text):
+        self._buf += text
+        sentences = []
+        start = 0
+        for match in self._BOUNDARY.finditer(self._buf):
+            sentence = self._buf[start:match.end()].strip()
+            # Very short pieces ("Dr.", "1.") are kept with what follows
+            if len(sentence) >= self.min_length:
+                sentences.append(sentence)
+                start = match.end()
+        self._buf = self._buf[start:]
+        return sentences
+
+    def flush(self):
+        rest, self._buf = self._buf.strip(), ""
+        return rest
+
+class TTSService:
+    """
+    Text to speech through a pluggable backend with a disk cache in front,
+    so repeated phrases are synthesized once.
+    """
+
+    def __init__(self, backend, cache, max_workers=2):
+        self._logger = logging.getLogger(__name__)
+        self.backend = backend
+        self.cache = cache
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tts")
+
+    @property
+    def media_type(self):
+        return self.backend.media_type
+
+    def stream(self, text, api_key=None):
+        """
+        Audio for `text` as (key, cached, chunks). Backend errors surface as
+        TTSError here, before any audio is returned.
+        """
+        key = self.cache.key(self.backend, text)
+        path = self.cache.path(key)
+        if path:
+            return key, True, self._read_file(path)
+        chunks = self.backend.stream(text, api_key)
+        return key, False, self.cache.write_through(key, self.backend.extension, chunks)
+
+    def synthesize(self, text, api_key=None):
+        """Make sure `text` is in the cache; returns its key."""
+        key, cached, chunks = self.stream(text, api_key)
+        if not cached:
+            for _ in chunks:
+                pass
+        return key
+
+    def synthesize_async(self, text, api_key=None):
+        return self._executor.submit(self.synthesize, text, api_key)
+
+    def _read_file(self, path):
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(64 * 1024), b""):
+                yield block
+
+class SpeechPipeline:
+    """
+    Speaks answers while they are still being generated. Fed with streamed
+    answer text (it is a ResponseHandler listener), it starts synthesizing
+    each sentence as soon as it is complete and calls
+    `on_audio(sessions, utterance, index, key)` for the sentences of an
+    answer in order, each once its audio is cached. `sessions` are the
+    clients that had voice output enabled when the sentence was submitted.
+
+    Each sentence is synthesized once, whichever clients listen, using the
+    API key of one of them; the audio is cached under a key that does not
+    depend on the API key.
+    """
+
+    def __init__(self, service, on_audio):
+        self._logger = logging.getLogger(__name__)
+        self.service = service
+        self.on_audio = on_audio
+        # Reentrant: a synthesis that is already done runs its callback inside _submit
+        self._lock = threading.RLock()
+        self._sessions = {}     # session with voice output enabled -> its API key, if any
+        self._splitter = SentenceSplitter()
+        self._utterance = 0
+        self._pending = {}      # utterance -> {"submitted", "next", "ended", "results"}
+
+    def configure(self, session, enabled, api_key=None):
+        with self._lock:
+            if enabled:
+                self._sessions[session] = api_key or self._sessions.get(session)
+            else:
+                self._sessions.pop(session, None)
+
+    def drop_session(self, session):
+        """Stop speaking to a client that disconnected."""
+        self.configure(session, False)
+
+    def feed(self, text):
+        with self._lock:
+            if not self._sessions:
+                return
+            for sentence in self._splitter.feed(text):
+                self._submit(sentence)
+
+    def end(self):
+        with self._lock:
+            rest = self._splitter.flush()
+            if self._sessions and rest:
+                self._submit(rest)
+            state = self._pending.get(self._utterance)
+            if state:
+                state["ended"] = True
+                self._forget_if_done(self._utterance, state)
+            self._utterance += 1
+
+    def _submit(self, sentence):
+        utterance = self._utterance
+        state = self._pending.setdefault(utterance, {"submitted": 0, "next": 0, "ended": False, "results": {}})
+        index = state["submitted"]
+        state["submitted"] += 1
+        sessions = tuple(self._sessions)
+        api_key = next((key for key in self._sessions.values() if key), None)
+        future = self.service.synthesize_async(sentence, api_key)
+        future.add_done_callback(lambda f: self._on_synthesized(utterance, index, sessions, f))
+
+    def _on_synthesized(self, utterance, index, sessions, future):
+        try:
+            key = future.result()
+        except Exception as e:
+            self._logger.error(f"Speech synthesis failed: {e}")
+            key = None
+        with self._lock:
+            state = self._pending[utterance]
+            state["results"][index] = (sessions, key)
+            # Deliver in sentence order; a later sentence waits for earlier ones
+            while state["next"] in state["results"]:
+                ready_sessions, ready_key = state["results"].pop(state["next"])
+                # Only to clients still listening
+                ready_sessions = [session for session in ready_sessions if session in self._sessions]
+                if ready_key and ready_sessions:
+                    self.on_audio(ready_sessions, utterance, state["next"], ready_key)
+                state["next"] += 1
+            self._forget_if_done(utterance, state)
+
+    def _forget_if_done(self, utterance, state):
+        if state["ended"] and state["next"] == state["submitted"]:
+            del self._pending[utterance]
@@ -0,0 +1,221 @@
+# Copyright (c) MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+VIDEO_EXTENSIONS = ('.mp4', '.webm', '.mov', '.avi')
+
+class VideoCatalog:
+    """
+    Persistent catalog of the uploaded videos: size, mtime, content hash,
+    duration, codec, resolution and a thumbnail per file, kept in `.catalog/`
+    in the videos directory (a subdirectory, so writing it does not touch
+    the videos directory's mtime).
+
+    Listing is served from an in-memory list already sorted newest first, so
+    a page costs a slice. The only filesystem work per listing is one stat of
+    the directory: if its mtime moved (a file was added, removed or replaced)
+    the directory is rescanned, reusing entries whose size and mtime are
+    unchanged. Missing metadata is filled in on a background worker.
+    """
+
+    def __init__(self, videos_dir, video_frames=None, hash_lookup=None):
+        self._logger = logging.getLogger(__name__)
+        self.videos_dir = videos_dir
+        self.video_frames = video_frames
+        self.hash_lookup = hash_lookup
+        self._catalog_dir = os.path.join(videos_dir, ".catalog")
+        self._path = os.path.join(self._catalog_dir, "catalog.json")
+        self._thumbnail_dir = os.path.join(self._catalog_dir, "thumbnails")
+        os.makedirs(self._thumbnail_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._ordered = []
+        self._dir_mtime = None
+        self._version = 0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="catalog")
+        self._load()
+
+    def page(self, offset=0, limit=None):
+        """
+        (videos, total, version) for the given window of the newest-first
+        listing. `version` changes whenever the listing does, and is saved
+        with the catalog so it keeps increasing across restarts; it can be
+        used as a validator.
+        """
+        self._refresh_if_stale()
+        with self._lock:
+            total = len(self._ordered)
+            stop = total if limit is None else offset + limit
+            return [dict(entry) for entry in self._ordered[offset:stop]], total, self._version
+
+    def get(self, filename):
+        self._refresh_if_stale()
+        with self._lock:
+            entry = self._entries.get(filename)
+            return dict(entry) if entry else None
+
+    def add(self, path, sha256=None):
+        """Record a newly stored file right away, e.g. from the upload path."""
+        filename = os.path.basename(path)
+        stat = os.stat(path)
+        with self._lock:
+            entry = self._entries.get(filename)
+            if not entry or entry["size"] != stat.st_size or entry["modified"] != stat.st_mtime:
+                entry = self._new_entry(filename, stat)
+                self._entries[filename] = entry
+            if sha256:
+                entry["sha256"] = sha256
+            self._reorder()
+        self._save()
+        self._enrich_async(filename)
+
+    def _refresh_if_stale(self):
+        try:
+            dir_mtime = os.stat(self.videos_dir).st_mtime
+        except OSError:
+            return
+        with self._lock:
+            if dir_mtime == self._dir_mtime:
+                return
+        self._rescan(dir_mtime)
+
+    def _rescan(self, dir_mtime):
+        found = {}
+        for entry in os.scandir(self.videos_dir):
+            if entry.name.startswith('.') or not entry.name.lower().endswith(VIDEO_EXTENSIONS):
+                continue
+            try:
+                if entry.is_file():
+                    found[entry.name] = entry.stat()
+            except OSError:
+                continue
+
+        pending = []
+        with self._lock:
+            entries = {}
+            changed = False
+            for filename, stat in found.items():
+                entry = self._entries.get(filename)
+                if not entry or entry["size"] != stat.st_size or entry["modified"] != stat.st_mtime:
+                    entry = self._new_entry(filename, stat)
+                    changed = True
+                if not entry.get("complete"):
+                    pending.append(filename)
+                entries[filename] = entry
+            removed = set(self._entries) - set(entries)
+            self._dir_mtime = dir_mtime
+            if changed or removed:
+                self._entries = entries
+                self._reorder()
+        for filename in removed:
+            thumbnail_path = os.path.join(self._thumbnail_dir, f"{filename}.jpg")
+            if os.path.exists(thumbnail_path):
+                os.remove(thumbnail_path)
+        if changed or removed:
+            self._save()
+        for filename in pending:
+            self._enrich_async(filename)
+
+    def _new_entry(self, filename, stat):
+        return {
+            "filename": filename,
+            "video_src": f"/videos/{filename}",
+            "size": stat.st_size,
+            "modified": stat.st_mtime,
+            "sha256": self.hash_lookup(filename) if self.hash_lookup else None,
+            "duration": None,
+            "codec": None,
+            "width": None,
+            "height": None,
+            "thumbnail": None,
+            "complete": False,
+        }
+
+    def _reorder(self):
+        self._ordered = sorted(self._entries.values(), key=lambda e: e["modified"], reverse=True)
+        self._version += 1
+
+    def _enrich_async(self, filename):
+        self._executor.submit(self._enrich, filename)
+
+    def _enrich(self, filename):
+        path = os.path.join(self.videos_dir, filename)
+        with self._lock:
+            entry = self._entries.get(filename)
+            if not entry or entry.get("complete"):
+                return
+            updates = {}
+            sha256 = entry.get("sha256")
+        try:
+            if not sha256:
+                updates["sha256"] = self._hash_file(path)
+            if self.video_frames and self.video_frames.available:
+                index = self.video_frames.index(path)
+                updates.update(
+                    duration=index["duration"], codec=index["codec"],
+                    width=index["width"], height=index["height"],
+                )
+                updates["thumbnail"] = self._make_thumbnail(path, filename, index["duration"])
+        except Exception as e:
+            self._logger.warning(f"Could not read metadata for {filename}: {e}")
+        with self._lock:
+            entry = self._entries.get(filename)
+            if not entry:
+                return
+            entry.update(updates)
+            entry["complete"] = True
+            self._version += 1
+        self._save()
+
+    def _make_thumbnail(self, path, filename, duration):
+        frame = self.video_frames.frame_at(path, min(1.0, duration / 10) if duration else 0.0)
+        thumbnail_name = f"{filename}.jpg"
+        with open(os.path.join(self._thumbnail_dir, thumbnail_name), "wb") as f:
+            f.write(frame.jpeg)
+        return f"/videos/.catalog/thumbnails/{thumbnail_name}"
+
+    def _hash_file(self, path):
+        hasher = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                hasher.update(block)
+        return hasher.hexdigest()
+
+    def _load(self):
+        try:
+            with open(self._path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self._entries = {entry["filename"]: entry for entry in data.get("videos", [])}
+        # Continue from the saved version; _reorder moves past it, so no
+        # version served before a restart is reused for different contents
+        self._version = data.get("version", 0)
+        # Rescan on first use anyway; the stored entries let it skip unchanged files
+        self._dir_mtime = None
+        self._reorder()
+
+    def _save(self):
+        with self._lock:
+            data = {"version": self._version, "videos": [dict(entry) for entry in self._ordered]}
+        tmp_path = self._path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self._path)
+        except OSError as e:
+            self._logger.warning(f"Could not save video catalog: {e}")
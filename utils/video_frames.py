@@ -0,0 +1,196 @@
+# Copyright (c) MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import bisect
+import json
+import logging
+import os
+import shutil
+import subprocess
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.frame_store import FRAME_TYPE_AUTO, Frame
+
+class VideoFrameSource:
+    """
+    Extracts frames from uploaded videos on the server, so clients only report
+    their playback position instead of capturing and uploading JPEGs.
+
+    Each video gets an index (duration, frame rate, resolution and keyframe
+    timestamps from ffprobe), built once per file version and kept next to the
+    videos in `.index/`. Frames are cut with ffmpeg at the target width and
+    kept in an LRU cache of encoded JPEGs keyed by frame number.
+    """
+
+    def __init__(self, videos_dir, width=640, cache_size=64, jpeg_quality=3,
+                 snap_tolerance=0.5, max_workers=2, timeout=15):
+        self._logger = logging.getLogger(__name__)
+        self.videos_dir = videos_dir
+        self.width = width
+        self.cache_size = cache_size
+        self.jpeg_quality = jpeg_quality
+        self.snap_tolerance = snap_tolerance
+        self.timeout = timeout
+        self.available = bool(shutil.which("ffmpeg") and shutil.which("ffprobe"))
+        if not self.available:
+            self._logger.warning("ffmpeg/ffprobe not found; clients will keep capturing frames themselves")
+        self._index_dir = os.path.join(videos_dir, ".index")
+        self._lock = threading.Lock()
+        self._indexes = {}          # path -> index
+        self._cache = OrderedDict() # (path, frame_number, width) -> Frame, LRU
+        self._stats = Counter()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="frames")
+
+    def resolve(self, video_src):
+        """Map a `/videos/<name>` URL (or bare name) to a file in the videos directory."""
+        if not video_src:
+            return None
+        filename = os.path.basename(str(video_src).split("?", 1)[0])
+        path = os.path.join(self.videos_dir, filename)
+        return path if filename and os.path.isfile(path) else None
+
+    def index_async(self, path):
+        """Build the index for `path` in the background, e.g. right after upload."""
+        if self.available:
+            self._executor.submit(self._index_quietly, path)
+
+    def index(self, path):
+        """Index for `path`, from memory, the on-disk cache, or ffprobe."""
+        stat = os.stat(path)
+        version = [stat.st_size, int(stat.st_mtime)]
+        with self._lock:
+            index = self._indexes.get(path)
+        if index and index["version"] == version:
+            return index
+
+        index_path = os.path.join(self._index_dir, os.path.basename(path) + ".json")
+        try:
+            with open(index_path) as f:
+                index = json.load(f)
+            if index.get("version") != version:
+                index = None
+        except (OSError, ValueError):
+            index = None
+
+        if index is None:
+            index = self._probe(path)
+            index["version"] = version
+            try:
+                os.makedirs(self._index_dir, exist_ok=True)
+                with open(index_path, "w") as f:
+                    json.dump(index, f)
+            except OSError as e:
+                self._logger.warning(f"Could not write video index {index_path}: {e}")
+            self._logger.info(
+                f"Indexed {os.path.basename(path)}: {index['duration']:.1f}s, "
+                f"{len(index['keyframes'])} keyframes"
+            )
+
+        with self._lock:
+            self._indexes[path] = index
+        return index
+
+    def request_frame(self, path, position, exact=True):
+        """Extract the frame at `position` seconds on a worker; returns a Future of a Frame."""
+        return self._executor.submit(self.frame_at, path, position, exact)
+
+    def frame_at(self, path, position, exact=True):
+        """
+        The frame shown at `position` seconds. With `exact=False` a keyframe up
+        to `snap_tolerance` earlier is used instead, which is cheaper to decode
+        and more likely to be cached (fine for periodic annotation).
+        """
+        index = self.index(path)
+        fps = index["fps"] or 25.0
+        position = max(float(position), 0.0)
+        if index["duration"]:
+            position = min(position, max(index["duration"] - 1.0 / fps, 0.0))
+        if not exact and index["keyframes"]:
+            i = bisect.bisect_right(index["keyframes"], position) - 1
+            if i >= 0 and position - index["keyframes"][i] <= self.snap_tolerance:
+                position = index["keyframes"][i]
+        frame_number = int(round(position * fps))
+        key = (path, frame_number, self.width)
+
+        with self._lock:
+            frame = self._cache.get(key)
+            if frame is not None:
+                self._cache.move_to_end(key)
+                self._stats["hits"] += 1
+                return frame
+            self._stats["misses"] += 1
+
+        video_time = frame_number / fps
+        jpeg = self._extract(path, video_time)
+        frame = Frame(memoryview(jpeg), message_type=FRAME_TYPE_AUTO, video_time=video_time)
+        with self._lock:
+            self._cache[key] = frame
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return frame
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["cached_frames"] = len(self._cache)
+            stats["indexed_videos"] = len(self._indexes)
+        return stats
+
+    def _index_quietly(self, path):
+        try:
+            self.index(path)
+        except Exception as e:
+            self._logger.error(f"Failed to index video {path}: {e}", exc_info=True)
+
+    def _probe(self, path):
+        info = json.loads(self._run([
+            "ffprobe", "-v", "error", "-select_streams", "v:0",
+            "-show_entries", "stream=codec_name,width,height,avg_frame_rate:format=duration",
+            "-of", "json", path,
+        ]))
+        stream = (info.get("streams") or [{}])[0]
+        num, _, den = (stream.get("avg_frame_rate") or "0/1").partition("/")
+        fps = float(num) / float(den or 1) if float(den or 1) else 0.0
+
+        keyframes = []
+        listing = self._run([
+            "ffprobe", "-v", "error", "-select_streams", "v:0", "-skip_frame", "nokey",
+            "-show_entries", "frame=best_effort_timestamp_time", "-of", "csv=p=0", path,
+        ])
+        for line in listing.decode("utf-8", "replace").splitlines():
+            try:
+                keyframes.append(float(line.strip().rstrip(",")))
+            except ValueError:
+                continue
+
+        return {
+            "duration": float((info.get("format") or {}).get("duration") or 0.0),
+            "fps": fps,
+            "width": stream.get("width"),
+            "height": stream.get("height"),
+            "codec": stream.get("codec_name"),
+            "keyframes": sorted(keyframes),
+        }
+
+    def _extract(self, path, video_time):
+        return self._run([
+            "ffmpeg", "-v", "error", "-ss", f"{video_time:.3f}", "-i", path,
+            "-frames:v", "1", "-vf", f"scale={self.width}:-2",
+            "-f", "image2pipe", "-vcodec", "mjpeg", "-q:v", str(self.jpeg_quality), "-",
+        ])
+
+    def _run(self, cmd):
+        result = subprocess.run(cmd, capture_output=True, timeout=self.timeout)
+        if result.returncode != 0 or not result.stdout:
+            raise RuntimeError(f"{cmd[0]} failed: {result.stderr.decode('utf-8', 'replace').strip()[:200]}")
+        return result.stdout
@@ -80,7 +80,11 @@ async function stopAudio() {
                 }
             }
 
-            const audioUrl = `${getWebsocketProtocol()}${window.location.hostname}:49001`;
+            let audioUrl = `${getWebsocketProtocol()}${window.location.hostname}:49001`;
+            // Name our main connection so the transcript is sent back to this client only
+            if (typeof clientSession !== 'undefined' && clientSession !== null) {
+                audioUrl += `/?session=${clientSession}`;
+            }
             audioWS = new WebSocket(audioUrl);
             audioWS.binaryType = "arraybuffer";
 
@@ -304,9 +304,117 @@ document.addEventListener('DOMContentLoaded', function() {
   }
 });
 
+// Whether the server cuts frames from the uploaded video itself (announced on connect)
+let serverFrames = false;
+// This connection's session id (announced on connect); voice input sends it so
+// the transcript comes back to this client only
+let clientSession = null;
+
+// Playback position of a server-hosted video, or null when the server
+// cannot extract frames for it and the browser has to capture them
+function playbackPosition() {
+  if (!serverFrames) return null;
+  const videoElement = document.getElementById('surgery-video');
+  if (!videoElement || !videoElement.src || videoElement.readyState < 1) return null;
+  const videoPath = new URL(videoElement.src, window.location.href).pathname;
+  if (!videoPath.startsWith('/videos/')) return null;
+  return { video_src: videoPath, video_position: videoElement.currentTime };
+}
+
+// Reports the playback position for annotation; false if a frame must be captured instead
+function sendPlaybackPosition() {
+  const playback = playbackPosition();
+  if (!playback || typeof sendJSON !== 'function') return false;
+  sendJSON({ type: 'playback', ...playback });
+  return true;
+}
+
+// Voice output: the server speaks answers sentence by sentence while they are
+// generated and announces each clip as it is ready; clips play in order
+let ttsEnabled = false;
+const ttsQueue = [];
+let ttsPlaying = null;
+
+function sendTtsConfig() {
+  const apiKeyInput = document.getElementById('ttsApiKey');
+  sendJSON({
+    type: 'tts_config',
+    enabled: ttsEnabled,
+    api_key: apiKeyInput ? apiKeyInput.value.trim() : ''
+  });
+}
+
+function enqueueSpeech(clip) {
+  if (!ttsEnabled) return;
+  ttsQueue.push(clip.url);
+  if (!ttsPlaying) {
+    playNextSpeech();
+  }
+}
+
+function playNextSpeech() {
+  const url = ttsQueue.shift();
+  if (!url) {
+    ttsPlaying = null;
+    return;
+  }
+  const audio = new Audio(url);
+  ttsPlaying = audio;
+  const next = () => {
+    if (ttsPlaying === audio) playNextSpeech();
+  };
+  audio.onended = next;
+  audio.onerror = next;
+  audio.play().catch(err => {
+    console.warn('Could not play speech:', err);
+    next();
+  });
+}
+
+function stopSpeech() {
+  ttsQueue.length = 0;
+  if (ttsPlaying) {
+    ttsPlaying.pause();
+    ttsPlaying = null;
+  }
+}
+
+document.addEventListener('DOMContentLoaded', function() {
+  const ttsToggle = document.getElementById('ttsEnable');
+  if (!ttsToggle) return;
+  ttsToggle.addEventListener('change', () => {
+    ttsEnabled = ttsToggle.checked;
+    if (!ttsEnabled) {
+      stopSpeech();
+    }
+    sendTtsConfig();
+  });
+  const apiKeyInput = document.getElementById('ttsApiKey');
+  if (apiKeyInput) {
+    apiKeyInput.addEventListener('change', () => {
+      if (ttsEnabled) sendTtsConfig();
+    });
+  }
+});
+
 // Handle messages from the server
 function handleServerMessage(message) {
   console.log("Received message from server:", message);
+
+  if (message.server_frames !== undefined) {
+    serverFrames = message.server_frames;
+    clientSession = message.session;
+    // Sent on every (re)connect, so voice output survives a server restart
+    if (ttsEnabled) {
+      sendTtsConfig();
+    }
+    return;
+  }
+
+  if (message.tts_audio) {
+    enqueueSpeech(message.tts_audio);
+    return;
+  }
   
   // Handle recognized text from audio
   if (message.recognized_text && message.asr_final) {
@@ -954,6 +1062,13 @@ function sendMessageToBackend(message) {
       user_input: message,
       original_user_input: message // Store original message for note processing
     };
+
+    // The server can cut the frame itself; just say where playback is
+    const playback = playbackPosition();
+    if (playback) {
+      sendJSON({ ...payload, ...playback });
+      return;
+    }
     
     // First try to get a new frame by capturing the current video
     let frameData = captureVideoFrame();
@@ -1133,9 +1248,15 @@ function completeMessageSend(message, frameData) {
     frameData = createPlaceholderFrame();
   }
   
-  // Add frame data to payload
+  // Send the frame ahead as a binary message and refer to it by id;
+  // fall back to embedding it if it could not be sent that way
   if (frameData) {
-    payload.frame_data = frameData;
+    const frameId = typeof sendFrame === 'function' ? sendFrame(frameData, FRAME_TYPE_INPUT) : null;
+    if (frameId !== null) {
+      payload.frame_id = frameId;
+    } else {
+      payload.frame_data = frameData;
+    }
     console.log("Frame data added to message payload");
   } else {
     // This should almost never happen since we generate placeholders
@@ -1173,6 +1294,13 @@ function sendFrameWithText(text) {
 
 // Enhanced function that tries harder to get a frame from the video
 function sendTextWithMaxCapture(text) {
+  // The server can cut the frame itself; just say where playback is
+  const playback = playbackPosition();
+  if (playback && typeof sendJSON === 'function') {
+    sendJSON({ user_input: text, asr_final: true, ...playback });
+    return;
+  }
+
   // Try to get a frame directly
   let frameData = captureVideoFrame();
   
@@ -1293,9 +1421,14 @@ function completeFrameWithTextSend(text, frameData) {
     asr_final: true
   };
   
-  // Add frame data if we have it
+  // Add frame data if we have it, preferably as a binary message referenced by id
   if (frameData) {
-    payload.frame_data = frameData;
+    const frameId = typeof sendFrame === 'function' ? sendFrame(frameData, FRAME_TYPE_INPUT) : null;
+    if (frameId !== null) {
+      payload.frame_id = frameId;
+    } else {
+      payload.frame_data = frameData;
+    }
   }
   
   // Send to server
@@ -1503,11 +1636,13 @@ function startAutoFrameCapture() {
   // Clear any existing interval
   stopAutoFrameCapture();
   
-  // Force a capture now to ensure we have a frame, even if the video is paused
-  let initialFrame = captureVideoFrame();
+  // Force a capture now to ensure we have a frame, even if the video is paused,
+  // unless the server extracts frames from the video itself
+  const serverExtracts = sendPlaybackPosition();
+  let initialFrame = serverExtracts ? null : captureVideoFrame();
   
   // If we couldn't capture, but a video is loaded, try to seek to the first frame
-  if (!initialFrame) {
+  if (!initialFrame && !serverExtracts) {
     const videoElement = document.getElementById('surgery-video');
     if (videoElement && videoElement.readyState >= 2) {
       // Try to seek to first frame to ensure we can capture something
@@ -1545,19 +1680,21 @@ function startAutoFrameCapture() {
     
     // Send to server for annotation
     if (typeof sendJSON === 'function') {
-      sendJSON({
-        auto_frame: true,
-        frame_data: initialFrame
-      });
+      sendAutoFrame(initialFrame);
       console.log("Initial frame sent for annotation");
     }
-  } else {
+  } else if (!serverExtracts) {
     console.warn("Failed to capture initial frame - ChatBot responses may be limited");
     showToast("Could not capture video frame - AI responses may be limited", "warning");
   }
   
   // Start regular interval for frame capture
   frameCapture = setInterval(() => {
+    // Server-side extraction only needs the playback position
+    if (sendPlaybackPosition()) {
+      return;
+    }
+
     // Try to capture current frame
     const frameData = captureVideoFrame();
     
@@ -1565,12 +1702,9 @@ function startAutoFrameCapture() {
       // Store the frame for future use
       sessionStorage.setItem('lastCapturedFrame', frameData);
       
-      // Send frame to server with auto_frame flag for annotation
+      // Send frame to server for annotation
       if (typeof sendJSON === 'function') {
-        sendJSON({
-          auto_frame: true,
-          frame_data: frameData
-        });
+        sendAutoFrame(frameData);
         console.log("Auto-captured frame sent for annotation");
       }
     } else {
@@ -1580,10 +1714,7 @@ function startAutoFrameCapture() {
       // Try to use any previously stored frame for annotation
       const lastFrame = sessionStorage.getItem('lastCapturedFrame');
       if (lastFrame && typeof sendJSON === 'function') {
-        sendJSON({
-          auto_frame: true,
-          frame_data: lastFrame
-        });
+        sendAutoFrame(lastFrame);
         console.log("Using previously captured frame for annotation");
       }
     }
@@ -1592,6 +1723,17 @@ function startAutoFrameCapture() {
   console.log("Auto frame capture started");
 }
 
+// Sends a frame for annotation, as a binary message when possible
+function sendAutoFrame(frameData) {
+  if (typeof sendFrame === 'function' && sendFrame(frameData, FRAME_TYPE_AUTO) !== null) {
+    return;
+  }
+  sendJSON({
+    auto_frame: true,
+    frame_data: frameData
+  });
+}
+
 function stopAutoFrameCapture() {
   if (frameCapture) {
     clearInterval(frameCapture);
@@ -1854,51 +1996,11 @@ function generateSummary() {
   const video = document.getElementById('surgery-video');
   const videoDuration = video ? formatTime(video.duration) : 'Unknown';
   
-  // Extract note data to send to backend
-  const noteData = notes.map(note => {
-    const contentEl = note.querySelector('.note-content');
-    const content = contentEl ? contentEl.textContent.trim() : '';
-    const timeEl = note.querySelector('.text-xs.text-gray-500') || note.querySelector('[class*="text-"].text-gray-500');
-    const time = timeEl ? timeEl.textContent.trim() : '';
-    return { text: content, timestamp: time };
-  }).filter(note => note.text && note.text !== 'Take a note');
-
-  // Extract annotation data to send to backend
-  const annotationData = annotations.map(ann => {
-    // For annotations, the content is in a p tag with text-sm text-gray-300 classes
-    const contentEl = ann.querySelector('p.text-sm.text-gray-300');
-    const content = contentEl ? contentEl.textContent.trim() : '';
-    
-    // Get timestamp from the span
-    const timeEl = ann.querySelector('.text-xs.text-gray-400');
-    const time = timeEl ? timeEl.textContent.trim() : '';
-    
-    // Get surgical phase from the h3 tag
-    const phaseEl = ann.querySelector('h3.text-lg.font-semibold');
-    const phase = phaseEl ? phaseEl.textContent.trim() : '';
-    
-    // Get tools and anatomy from the badges
-    const toolsEl = ann.querySelector('.badge.text-primary-300');
-    const tools = toolsEl ? toolsEl.textContent.trim() : '';
-    
-    const anatomyEl = ann.querySelector('.badge.text-yellow-300');
-    const anatomy = anatomyEl ? anatomyEl.textContent.trim() : '';
-    
-    return { 
-      description: content, 
-      timestamp: time,
-      surgical_phase: phase,
-      tools: tools ? [tools] : [],
-      anatomy: anatomy ? [anatomy] : []
-    };
-  }).filter(ann => ann.description);
-
-  // Log what we're sending to help with debugging
-  console.log("Generating summary with:");
-  console.log("- Notes:", noteData.length, noteData);
-  console.log("- Annotations:", annotationData.length, annotationData);
+  // The server holds the annotations and notes for the procedure, so only
+  // the procedure reference is sent (omitted: the current procedure)
+  console.log("Generating summary for the current procedure");
   
-  // Generate request to backend for summary generation with data
+  // Generate request to backend for summary generation
   fetch('/api/generate_post_op_note', {
     method: 'POST',
     headers: {
@@ -1906,15 +2008,19 @@ function generateSummary() {
     },
     body: JSON.stringify({
       request_type: 'generate_summary',
-      notes: noteData,
-      annotations: annotationData,
-      video_duration: videoDuration
+      video_duration: videoDuration,
+      stream: true
     })
   })
   .then(response => {
     if (!response.ok) {
       throw new Error('Failed to generate summary');
     }
+    // Sections arrive one per line as they are generated
+    const contentType = response.headers.get('Content-Type') || '';
+    if (response.body && contentType.includes('application/x-ndjson')) {
+      return readPostOpNoteStream(response, summaryContainer);
+    }
     return response.json();
   })
   .then(data => {
@@ -1955,6 +2061,46 @@ function generateSummary() {
   });
 }
 
+// Read a streamed (NDJSON) post-op note, rendering each section as it arrives.
+// Resolves with the same shape as the non-streamed response.
+function readPostOpNoteStream(response, container) {
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  const note = {};
+  let buffer = '';
+  let result = null;
+
+  function handleLine(line) {
+    if (!line.trim()) return;
+    const msg = JSON.parse(line);
+    if (msg.error) {
+      throw new Error(msg.error);
+    }
+    if (msg.done) {
+      result = msg;
+      return;
+    }
+    note[msg.section] = msg.content;
+    displayFormattedPostOpNote(note, container);
+  }
+
+  function pump() {
+    return reader.read().then(({ done, value }) => {
+      if (done) {
+        handleLine(buffer);
+        return result || { post_op_note: note };
+      }
+      buffer += decoder.decode(value, { stream: true });
+      const lines = buffer.split('\n');
+      buffer = lines.pop();
+      lines.forEach(handleLine);
+      return pump();
+    });
+  }
+
+  return pump();
+}
+
 // Fallback client-side summary generation
 function fallbackGenerateSummary(notes, annotations, videoDuration, summaryContainer) {
   // Process after a small delay to show loading animation
@@ -2279,7 +2425,19 @@ function saveManualNote() {
 }
 
 // Function to fetch and display videos
-function loadVideos() {
+// Videos fetched per page of the library list
+const VIDEO_PAGE_SIZE = 50;
+
+// Format a duration in seconds as m:ss (or h:mm:ss)
+function formatDuration(seconds) {
+  const total = Math.round(seconds);
+  const h = Math.floor(total / 3600);
+  const m = Math.floor((total % 3600) / 60);
+  const s = (total % 60).toString().padStart(2, '0');
+  return h > 0 ? `${h}:${m.toString().padStart(2, '0')}:${s}` : `${m}:${s}`;
+}
+
+function loadVideos(offset = 0) {
   const videoList = document.getElementById('video-list');
   const videoLoading = document.getElementById('video-loading');
   const noVideos = document.getElementById('no-videos');
@@ -2292,12 +2450,18 @@ function loadVideos() {
     noVideos.style.display = 'none';
   }
   
-  // Clear existing videos
-  const existingVideos = videoList.querySelectorAll('.video-item');
-  existingVideos.forEach(item => item.remove());
+  // Clear existing videos when loading the first page
+  if (offset === 0) {
+    const existingVideos = videoList.querySelectorAll('.video-item');
+    existingVideos.forEach(item => item.remove());
+  }
+  const existingLoadMore = document.getElementById('load-more-videos');
+  if (existingLoadMore) {
+    existingLoadMore.remove();
+  }
   
-  // Fetch videos from the server
-  fetch('/api/videos')
+  // Fetch one page of videos from the server
+  fetch(`/api/videos?offset=${offset}&limit=${VIDEO_PAGE_SIZE}`)
     .then(response => {
       if (!response.ok) {
         throw new Error('Failed to fetch videos');
@@ -2326,18 +2490,22 @@ function loadVideos() {
             year: 'numeric'
           });
           
-          // Get a random duration for preview purposes (in real app this would come from the video metadata)
-          const duration = `${Math.floor(Math.random() * 10) + 1}:${Math.floor(Math.random() * 60).toString().padStart(2, '0')}`;
+          // Duration and thumbnail come from the server's catalog once the video has been probed
+          const duration = video.duration ? formatDuration(video.duration) : '--:--';
+          const thumbnail = video.thumbnail
+            ? `<img src="${video.thumbnail}" alt="" loading="lazy" class="absolute inset-0 w-full h-full object-cover">`
+            : '<i class="fas fa-film text-primary-400 text-4xl relative z-10"></i>';
+          const resolution = video.width && video.height ? `${video.width}×${video.height}` : '';
           
           // Create a unique ID for this video item
-          const videoItemId = `video-item-${index}`;
+          const videoItemId = `video-item-${offset + index}`;
           
           videoItem.innerHTML = `
             <div class="flex flex-col sm:flex-row sm:items-center">
               <div class="bg-dark-900 h-full min-h-24 sm:w-40 flex items-center justify-center p-3 relative">
                 <div class="absolute inset-0 bg-gradient-to-r from-primary-900/30 to-primary-700/30 opacity-0 group-hover:opacity-100 transition-opacity duration-300"></div>
-                <i class="fas fa-film text-primary-400 text-4xl relative z-10"></i>
-                <span class="absolute bottom-2 right-2 text-xs text-white bg-dark-900/80 px-2 py-1 rounded">${duration}</span>
+                ${thumbnail}
+                <span class="absolute bottom-2 right-2 z-10 text-xs text-white bg-dark-900/80 px-2 py-1 rounded">${duration}</span>
               </div>
               <div class="flex-grow p-4">
                 <div class="flex items-start justify-between">
@@ -2347,6 +2515,7 @@ function loadVideos() {
                 <div class="flex items-center mt-2 text-sm text-gray-400">
                   <i class="fas fa-calendar-alt mr-1 text-primary-500"></i>
                   <span>${formattedDate}</span>
+                  ${resolution ? `<i class="fas fa-expand ml-3 mr-1 text-primary-500"></i><span>${resolution}</span>` : ''}
                 </div>
               </div>
               <div class="flex items-center justify-end p-3 pr-4 bg-dark-800 sm:bg-transparent">
@@ -2385,7 +2554,17 @@ function loadVideos() {
             }
           });
         });
-      } else {
+
+        // Offer the next page when the library is larger than what is shown
+        if (data.next_offset !== null && data.next_offset !== undefined) {
+          const loadMore = document.createElement('button');
+          loadMore.id = 'load-more-videos';
+          loadMore.className = 'btn w-full mt-2 px-4 py-2 rounded-lg bg-dark-700 hover:bg-dark-600 text-gray-300 transition-colors duration-200';
+          loadMore.innerHTML = `<i class="fas fa-chevron-down mr-2"></i> Load more (${data.total - data.next_offset} remaining)`;
+          loadMore.addEventListener('click', () => loadVideos(data.next_offset));
+          videoList.appendChild(loadMore);
+        }
+      } else if (offset === 0) {
         // Show no videos message
         if (noVideos) {
           noVideos.style.display = 'block';
@@ -2502,6 +2681,76 @@ function closeModal(modal) {
   }, 300);
 }
 
+// Uploads a file through the resumable upload API: chunks are sent at the
+// offset the server reports, so a dropped connection (or a page reload, via
+// the upload id kept in localStorage) resumes instead of starting over
+async function uploadFileInChunks(file, onProgress) {
+  const resumeKey = `upload:${file.name}:${file.size}:${file.lastModified}`;
+  let upload = null;
+
+  const savedId = localStorage.getItem(resumeKey);
+  if (savedId) {
+    const response = await fetch(`/api/uploads/${savedId}`);
+    if (response.ok) {
+      upload = await response.json();
+      upload.chunk_size = upload.chunk_size || 8 * 1024 * 1024;
+    } else {
+      localStorage.removeItem(resumeKey);
+    }
+  }
+  if (!upload) {
+    const response = await fetch('/api/uploads', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ filename: file.name, size: file.size })
+    });
+    if (!response.ok) {
+      throw new Error('Could not start upload');
+    }
+    upload = await response.json();
+    localStorage.setItem(resumeKey, upload.upload_id);
+  }
+
+  let offset = upload.offset;
+  let failures = 0;
+  while (offset < file.size) {
+    const chunk = file.slice(offset, offset + upload.chunk_size);
+    try {
+      const response = await fetch(`/api/uploads/${upload.upload_id}?offset=${offset}`, {
+        method: 'PUT',
+        headers: { 'Content-Type': 'application/octet-stream' },
+        body: chunk
+      });
+      const state = await response.json();
+      if (!response.ok && state.offset === undefined) {
+        throw new Error(state.error || 'Chunk upload failed');
+      }
+      // On 409 the server says where it actually is; continue from there
+      offset = state.offset;
+      failures = 0;
+    } catch (err) {
+      failures++;
+      if (failures > 5) {
+        throw err;
+      }
+      console.warn(`Chunk upload failed (attempt ${failures}), resuming:`, err);
+      await new Promise(resolve => setTimeout(resolve, 1000 * failures));
+      const status = await fetch(`/api/uploads/${upload.upload_id}`).then(r => r.json()).catch(() => null);
+      if (status && status.offset !== undefined) {
+        offset = status.offset;
+      }
+    }
+    if (onProgress) onProgress(offset, file.size);
+  }
+
+  const response = await fetch(`/api/uploads/${upload.upload_id}/complete`, { method: 'POST' });
+  if (!response.ok) {
+    throw new Error('Could not complete upload');
+  }
+  localStorage.removeItem(resumeKey);
+  return response.json();
+}
+
 // Video upload functionality
 function uploadVideo() {
   const fileInput = document.getElementById('video-upload');
@@ -2514,10 +2763,6 @@ function uploadVideo() {
     return;
   }
   
-  // Create FormData object
-  const formData = new FormData();
-  formData.append('video', file);
-  
   // Show loading state
   if (uploadButton) {
     uploadButton.disabled = true;
@@ -2525,21 +2770,21 @@ function uploadVideo() {
   }
   showToast('Uploading video...', 'info');
   
-  // Use fetch to upload the file
-  fetch('/api/upload_video', {
-    method: 'POST',
-    body: formData
-  })
-  .then(response => {
-    if (!response.ok) {
-      throw new Error('Network response was not ok');
+  // Upload in resumable chunks
+  uploadFileInChunks(file, (sent, total) => {
+    if (uploadButton && total > 0) {
+      const percent = Math.floor((sent / total) * 100);
+      uploadButton.innerHTML = `<i class="fas fa-spinner fa-spin mr-2"></i> Uploading ${percent}%`;
     }
-    return response.json();
   })
   .then(data => {
     // Handle successful upload with the actual filename
     const displayName = data.filename || 'video';
-    showToast(`"${displayName}" uploaded successfully!`, 'success');
+    if (data.deduplicated) {
+      showToast(`Already uploaded as "${displayName}"`, 'success');
+    } else {
+      showToast(`"${displayName}" uploaded successfully!`, 'success');
+    }
     
     // Reset file name display
     const fileNameElement = fileInput.closest('.relative')?.querySelector('.file-name');
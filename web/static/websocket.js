@@ -65,8 +65,9 @@ function connectWebsocket(port=49000, onMessageCallback=null) {
     console.log("Message received from server:", event.data);
     try {
       const msg = JSON.parse(event.data);
-      // If we have a callback, call it
-      if (onMessageCallback) onMessageCallback(msg);
+      // Bursts arrive batched as one JSON array; deliver them in order
+      const messages = Array.isArray(msg) ? msg : [msg];
+      if (onMessageCallback) messages.forEach((m) => onMessageCallback(m));
     } catch (e) {
       console.error("Failed to parse WebSocket message as JSON:", e, event.data);
     }
@@ -109,4 +110,38 @@ function sendJSON(payload) {
   }
   console.log("Sending JSON message:", payload);
   websocket.send(JSON.stringify(payload));
-}
\ No newline at end of file
+}
+// Binary frame messages: a 14-byte header followed by the raw JPEG bytes.
+//   version (uint8), message type (uint8), frame id (uint32), timestamp in ms (uint64), big-endian
+const FRAME_PROTOCOL_VERSION = 1;
+const FRAME_TYPE_AUTO = 1;   // periodic capture for annotation
+const FRAME_TYPE_INPUT = 2;  // frame for the user input sent right after it, referenced by frame_id
+const FRAME_HEADER_SIZE = 14;
+let nextFrameId = 1;
+
+// Sends a captured frame (a JPEG data URL) as a binary message and returns
+// its frame id, or null if it could not be sent
+function sendFrame(dataURL, type=FRAME_TYPE_AUTO) {
+  if (!websocket || websocket.readyState !== WebSocket.OPEN) {
+    console.warn("WebSocket not open. Unable to send frame.");
+    return null;
+  }
+  if (!dataURL || !dataURL.startsWith('data:image/jpeg;base64,')) {
+    console.warn("Not a JPEG data URL; frame not sent.");
+    return null;
+  }
+  const binary = atob(dataURL.slice(dataURL.indexOf(',') + 1));
+  const message = new Uint8Array(FRAME_HEADER_SIZE + binary.length);
+  const header = new DataView(message.buffer, 0, FRAME_HEADER_SIZE);
+  const frameId = nextFrameId;
+  nextFrameId = (nextFrameId % 0xFFFFFFFF) + 1;
+  header.setUint8(0, FRAME_PROTOCOL_VERSION);
+  header.setUint8(1, type);
+  header.setUint32(2, frameId);
+  header.setBigUint64(6, BigInt(Date.now()));
+  for (let i = 0; i < binary.length; i++) {
+    message[FRAME_HEADER_SIZE + i] = binary.charCodeAt(i);
+  }
+  websocket.send(message);
+  return frameId;
+}